@@ -0,0 +1,50 @@
+"""Import time of each sync module in a fresh interpreter, and which heavy libraries it pulled in.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5] [module ...]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+MODULES = ["order_transform", "backfill_sales", "sync_fb_ads", "sync_data", "generate_insights", "refund_tracker", "sync_daemon", "local_store"]
+HEAVY = ["supabase", "requests", "httpx", "dotenv"]
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def probe(module):
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        cwd=SCRIPTS_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return None, (proc.stderr.strip().splitlines() or ["failed"])[-1]
+    return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'module':<20} {'median ms':>10} {'min ms':>8}  heavy imports")
+    for module in args.modules:
+        timings, loaded, error = [], [], None
+        for _ in range(args.repeat):
+            result, error = probe(module)
+            if error:
+                break
+            timings.append(result["seconds"] * 1000)
+            loaded = result["loaded"]
+        if error:
+            print(f"{module:<20} {'-':>10} {'-':>8}  ❌ {error}")
+            continue
+        print(f"{module:<20} {statistics.median(timings):>10.1f} {min(timings):>8.1f}  {', '.join(loaded) or 'none'}")
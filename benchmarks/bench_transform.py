@@ -0,0 +1,109 @@
+"""Rows/sec of the per-order Konnektive transform vs a columnar batch candidate.
+
+The columnar candidate below applies the skip, event-type and refund-sign
+rules (the same tables order_transform uses) over whole columns of a page and
+assembles the kept rows column by column. It lives here rather than in
+order_transform.py because it measured no faster than the per-order loop:
+about half the transform time is the per-order content hash (JSON encoding),
+which a columnar layout does not remove. Re-run this before reviving it.
+
+Usage: python benchmarks/bench_transform.py [--orders 100000] [--page-size 200]
+"""
+import gc
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from order_transform import (REFUND_EVENTS, SKIP_STATUSES, TEST_FLAGS, event_for, order_content_hash,
+                             parse_items, transform_page)
+from synthetic import synthetic_orders
+
+def pages(orders, page_size):
+    return [orders[i:i + page_size] for i in range(0, len(orders), page_size)]
+
+# --- 📊 COLUMNAR CANDIDATE ---
+def columnar_page(raw_orders):
+    """Same output as transform_page, computed column by column."""
+    status = [(raw.get('orderStatus') or '').upper() for raw in raw_orders]
+    order_type = [(raw.get('orderType') or '').upper() for raw in raw_orders]
+    is_test = [t is True or str(t).lower() in TEST_FLAGS for t in (raw.get('test') for raw in raw_orders)]
+    kept = [i for i in range(len(raw_orders)) if status[i] not in SKIP_STATUSES and not is_test[i]]
+
+    raws = [raw_orders[i] for i in kept]
+    events = [event_for(status[i], order_type[i]) for i in kept]
+    amounts = [float(raw.get('totalAmount', 0) or 0) for raw in raws]
+    amounts = [-abs(a) if e[0] in REFUND_EVENTS else a for a, e in zip(amounts, events)]
+
+    def col(key):
+        return [raw.get(key) for raw in raws]
+
+    def col_or(key, fallback):
+        return [raw.get(key) or raw.get(fallback) for raw in raws]
+
+    order_ids = col('orderId')
+    columns = {
+        "transaction_id": order_ids,
+        "order_id": order_ids,
+        "date": col('dateCreated'),
+        "total_amount": amounts,
+        "status": ["sale"] * len(raws),
+        "event_type": [e[0] for e in events],
+        "revenue_type": [e[1] for e in events],
+        "payment_status": col('orderStatus'),
+        "campaign_id": col('campaignId'),
+        "campaign_name": col('campaignName'),
+        "traffic_source": col_or('UTMSource', 'sourceValue1'),
+        "affiliate_id": col('affId'),
+        "currency": [raw.get('currencyCode', 'USD') for raw in raws],
+        "customer_email": col('emailAddress'),
+        "customer_state": col_or('state', 'shipState'),
+        "customer_country": col_or('country', 'shipCountry'),
+        "raw_data": raws,
+        "items": [parse_items(raw.get('items', [])) for raw in raws],
+    }
+    keys = list(columns)
+    orders = [dict(zip(keys, row)) for row in zip(*columns.values())]
+    for order in orders:
+        order["content_hash"] = order_content_hash(order)
+    return orders
+
+def run_loop(all_pages):
+    return [o for page in all_pages for o in transform_page(page)]
+
+def run_columnar(all_pages):
+    return [o for page in all_pages for o in columnar_page(page)]
+
+def timed(fn, *args, repeat=3):
+    """Best of `repeat` runs. Results are dropped and the heap collected between
+    runs, so one side never pays for the other's output still being alive."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"🧪 Generating {args.orders:,} synthetic orders ({args.page_size}/page)...")
+    all_pages = pages(synthetic_orders(args.orders), args.page_size)
+
+    kept = len(run_loop(all_pages))
+    assert run_loop(all_pages) == run_columnar(all_pages), "columnar candidate output differs from transform_page"
+    print(f"   ✅ Identical output: {kept:,} kept orders.")
+
+    loop_seconds = timed(run_loop, all_pages)
+    columnar_seconds = timed(run_columnar, all_pages)
+
+    print(f"   🐢 per-order loop : {args.orders / loop_seconds:>12,.0f} rows/sec ({loop_seconds:.2f}s)")
+    print(f"   📊 columnar       : {args.orders / columnar_seconds:>12,.0f} rows/sec ({columnar_seconds:.2f}s)")
+    print(f"   📈 speedup: {loop_seconds / columnar_seconds:.2f}x")
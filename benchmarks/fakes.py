@@ -0,0 +1,286 @@
+"""Local stand-ins for Konnektive, the Graph API and Supabase's PostgREST.
+
+Each fake is a ThreadingHTTPServer that runs in a background thread and counts
+the requests and bytes it serves, so a benchmark can report how chatty a sync
+is without touching the real services.
+"""
+import json
+import random
+import threading
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse, unquote
+
+from synthetic import synthetic_order, synthetic_insights
+
+class FakeServer:
+    """Base class: owns the HTTP server thread and the request counters."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.requests = Counter()
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, headers = fake.handle(self.command, parsed.path, parse_qs(parsed.query, keep_blank_values=True), self.headers, body)
+                data = b"" if payload is None else json.dumps(payload).encode()
+                with fake.lock:
+                    fake.requests[(self.command, fake.route_label(parsed.path))] += 1
+                    fake.bytes_out += len(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = Counter()
+            self.bytes_out = 0
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def route_label(self, path):
+        return path
+
+    def handle(self, method, path, query, headers, body):
+        raise NotImplementedError
+
+class FakeKonnektive(FakeServer):
+    """Serves paginated `order/query` results for `orders_per_day` orders on every day."""
+
+    name = "konnektive"
+
+    def __init__(self, orders_per_day):
+        super().__init__()
+        self.orders_per_day = orders_per_day
+
+    @lru_cache(maxsize=64)
+    def day_orders(self, day):
+        rng = random.Random(f"konnektive-{day}")
+        return tuple(synthetic_order(i, rng, day) for i in range(self.orders_per_day))
+
+    def route_label(self, path):
+        return "order/query"
+
+    def handle(self, method, path, query, headers, body):
+        day = datetime.strptime(query["startDate"][0], "%m/%d/%Y").date().isoformat()
+        per_page = int(query.get("resultsPerPage", ["25"])[0])
+        page = int(query.get("page", ["1"])[0])
+
+        orders = self.day_orders(day)
+        if query.get("orderStatus"):
+            wanted = query["orderStatus"][0]
+            orders = [o for o in orders if o["orderStatus"] == wanted]
+
+        data = list(orders[(page - 1) * per_page:page * per_page])
+        if not data:
+            return 200, {"result": "ERROR", "message": "No orders matching those parameters could be found"}, None
+        return 200, {"result": "SUCCESS", "message": {
+            "totalResults": len(orders), "resultsPerPage": per_page, "page": page, "data": data
+        }}, None
+
+class FakeGraph(FakeServer):
+    """Serves `/<act_id>/insights` with cursor paging and low usage headers."""
+
+    name = "graph"
+
+    def __init__(self, campaigns_per_account):
+        super().__init__()
+        self.campaigns = campaigns_per_account
+
+    def route_label(self, path):
+        return "insights"
+
+    def handle(self, method, path, query, headers, body):
+        account_id = path.strip("/").split("/")[-2]
+        time_range = json.loads(query["time_range"][0])
+        start = date.fromisoformat(time_range["since"])
+        end = date.fromisoformat(time_range["until"])
+        days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+        rows = synthetic_insights(account_id, days, self.campaigns)
+        limit = int(query.get("limit", ["25"])[0])
+        offset = int(query.get("after", ["0"])[0])
+        payload = {"data": rows[offset:offset + limit]}
+
+        if offset + limit < len(rows):
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query["after"] = str(offset + limit)
+            payload["paging"] = {"next": f"{self.url}{path}?{urlencode(next_query)}"}
+
+        usage = {"x-app-usage": json.dumps({"call_count": 3, "total_cputime": 2, "total_time": 2})}
+        return 200, payload, usage
+
+# Upsert keys per table (PostgREST uses the primary key unless on_conflict is given)
+PRIMARY_KEYS = {
+    "transactions": ["transaction_id"],
+    "product_map": ["product_id"],
+    "inventory_batches": ["batch_id"],
+    "facebook_ads": ["date", "campaign_id"],
+    "daily_metrics": ["date", "revenue_type", "campaign_id"],
+    "dashboard_metrics_cache": ["start_date", "end_date"],
+    "campaign_attribution": ["date", "campaign_key"],
+    "inventory_daily_usage": ["date", "base_product"],
+    "inventory_forecast": ["base_product"],
+    "insight_baselines": ["metric", "segment", "dow"],
+    "ai_daily_insights": ["date", "rank"],
+}
+
+class FakePostgrest(FakeServer):
+    """Just enough of PostgREST for the sync scripts, backed by in-memory tables.
+
+    Supports select/insert/upsert/update/delete with eq, in, gt(e), lt(e)
+    filters, order and offset/limit or Range paging. RPC calls answer 404 so
+    the scripts exercise their client-side fallbacks.
+    """
+
+    name = "postgrest"
+
+    def __init__(self):
+        super().__init__()
+        self.tables = defaultdict(list)
+        self.table_lock = threading.Lock()
+
+    def route_label(self, path):
+        return path.replace("/rest/v1/", "")
+
+    def seed(self, table, rows):
+        with self.table_lock:
+            self.tables[table].extend(dict(r) for r in rows)
+
+    @staticmethod
+    def _matches(row, filters):
+        for column, op, value in filters:
+            current = row.get(column)
+            current_str = "" if current is None else str(current)
+            if op == "eq" and current_str != value:
+                return False
+            if op == "in" and current_str not in value:
+                return False
+            if op in ("gte", "gt", "lte", "lt") and current is None:
+                return False
+            if op == "gte" and not current_str >= value:
+                return False
+            if op == "gt" and not current_str > value:
+                return False
+            if op == "lte" and not current_str <= value:
+                return False
+            if op == "lt" and not current_str < value:
+                return False
+            if op == "is" and value == "null" and current is not None:
+                return False
+        return True
+
+    @staticmethod
+    def _filters(query):
+        filters = []
+        for column, values in query.items():
+            if column in ("select", "order", "offset", "limit", "on_conflict", "columns"):
+                continue
+            for raw in values:
+                op, _, value = raw.partition(".")
+                if op == "in":
+                    value = {v.strip().strip('"') for v in value.strip("()").split(",")}
+                filters.append((column, op, value))
+        return filters
+
+    def handle(self, method, path, query, headers, body):
+        parts = path.replace("/rest/v1/", "").strip("/").split("/")
+        if parts[0] == "rpc":
+            return 404, {"code": "PGRST202", "message": f"Could not find the function public.{parts[1]}"}, None
+
+        table = unquote(parts[0])
+        filters = self._filters(query)
+        prefer = headers.get("Prefer", "")
+
+        with self.table_lock:
+            rows = self.tables[table]
+
+            if method == "GET":
+                result = [r for r in rows if self._matches(r, filters)]
+                for spec in reversed(query.get("order", [""])[0].split(",")):
+                    if spec:
+                        column, _, direction = spec.partition(".")
+                        result.sort(key=lambda r: (r.get(column) is None, str(r.get(column))), reverse=direction.startswith("desc"))
+                offset, limit = int(query.get("offset", ["0"])[0]), query.get("limit", [None])[0]
+                if headers.get("Range"):
+                    first, _, last = headers["Range"].partition("-")
+                    offset, limit = int(first), int(last) - int(first) + 1
+                result = result[offset:offset + int(limit)] if limit is not None else result[offset:]
+                columns = [c.strip() for c in query.get("select", ["*"])[0].split(",")]
+                if columns != ["*"]:
+                    result = [{c: r.get(c) for c in columns} for r in result]
+                return 200, result, None
+
+            if method == "POST":
+                new_rows = json.loads(body or b"[]")
+                new_rows = new_rows if isinstance(new_rows, list) else [new_rows]
+                if "merge-duplicates" in prefer or "ignore-duplicates" in prefer:
+                    keys = [k.strip() for k in query.get("on_conflict", [""])[0].split(",") if k.strip()] or PRIMARY_KEYS.get(table, ["id"])
+                    index = {tuple(str(r.get(k)) for k in keys): r for r in rows}
+                    for new in new_rows:
+                        existing = index.get(tuple(str(new.get(k)) for k in keys))
+                        if existing is not None:
+                            if "merge-duplicates" in prefer:
+                                existing.update(new)
+                        else:
+                            rows.append(new)
+                            index[tuple(str(new.get(k)) for k in keys)] = new
+                else:
+                    rows.extend(new_rows)
+                return 201, new_rows if "return=representation" in prefer else None, None
+
+            if method == "PATCH":
+                changes = json.loads(body or b"{}")
+                updated = [r for r in rows if self._matches(r, filters)]
+                for r in updated:
+                    r.update(changes)
+                return 200, updated if "return=representation" in prefer else None, None
+
+            if method == "DELETE":
+                deleted = [r for r in rows if self._matches(r, filters)]
+                self.tables[table] = [r for r in rows if not self._matches(r, filters)]
+                return 200, deleted if "return=representation" in prefer else None, None
+
+        return 405, {"message": f"{method} not supported"}, None
+
+    def row_counts(self):
+        with self.table_lock:
+            return {table: len(rows) for table, rows in self.tables.items()}
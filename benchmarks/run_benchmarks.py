@@ -0,0 +1,172 @@
+"""End-to-end sync benchmarks against local fakes of Konnektive, the Graph API and Supabase.
+
+Runs backfill_sales, sync_fb_ads, sync_data and generate_insights (in that
+order, so later scripts read what earlier ones wrote) at each volume and
+reports wall time, requests per service and peak memory. Each script runs in
+its own child process because the scripts connect and read their config at
+import time.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--volumes 1000 10000 100000]
+        [--save baseline.json] [--baseline baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import resource
+import subprocess
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(BENCH_DIR, "..", "scripts")
+sys.path.insert(0, BENCH_DIR)
+
+SCRIPTS = ["backfill_sales", "sync_fb_ads", "sync_data", "generate_insights"]
+DEFAULT_VOLUMES = [1_000, 10_000, 100_000]
+SYNC_DAYS = 3  # backfill covers SYNC_DAYS + 1 days including today
+AD_ACCOUNTS = "act_101,act_202"
+RESULT_PREFIX = "BENCH_RESULT "
+# A regression is flagged when a script gets this much slower than the baseline
+SLOWER_THRESHOLD = 1.10
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_child(script):
+    """Runs one script as __main__ in this process, then prints its timings as JSON."""
+    sys.path.insert(0, SCRIPTS_DIR)
+    sys.argv = [os.path.join(SCRIPTS_DIR, f"{script}.py")]
+    started = time.perf_counter()
+    error = None
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"exit {e.code}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    sys.stdout.flush()
+    print(RESULT_PREFIX + json.dumps({"seconds": elapsed, "peak_rss_mb": peak_rss_mb(), "error": error}))
+
+# --- 🌱 SEED DATA (so sync_data has batches to allocate from) ---
+def seed_inventory(postgrest):
+    postgrest.seed("product_map", [
+        {"product_id": "2489", "offer_name": "Cooling Roller - 1x Roller", "base_product": "Cooling Roller", "units_per_variant": 1},
+        {"product_id": "3011", "offer_name": "Warming Oil - 2x Bottles", "base_product": "Warming Oil", "units_per_variant": 2},
+    ])
+    postgrest.seed("inventory_batches", [
+        {"batch_id": 1, "base_product": "Cooling Roller", "remaining_qty": 100_000, "unit_cost": 1.59, "status": "active"},
+        {"batch_id": 2, "base_product": "Warming Oil", "remaining_qty": 100_000, "unit_cost": 1.79, "status": "active"},
+    ])
+
+def child_env(konnektive, graph, postgrest, archive_dir):
+    env = dict(os.environ)
+    env.update({
+        "NEXT_PUBLIC_SUPABASE_URL": postgrest.url,
+        # supabase-py only checks the key looks like a JWT
+        "NEXT_PUBLIC_SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.fake",
+        "KONNEKTIVE_ORDER_QUERY_URL": f"{konnektive.url}/order/query/",
+        "CHECKOUT_CHAMP_ID": "bench",
+        "CHECKOUT_CHAMP_PASS": "bench",
+        "FB_GRAPH_URL": graph.url,
+        "FACEBOOK_ACCESS_TOKEN": "bench",
+        "FACEBOOK_AD_ACCOUNT_ID": AD_ACCOUNTS,
+        "SYNC_DAYS": str(SYNC_DAYS),
+        "GITHUB_ACTIONS": "true",
+        "RAW_ARCHIVE_DIR": archive_dir,
+        "HTTP_MAX_RETRIES": "1",
+    })
+    return env
+
+def run_script(script, env, cwd, fakes):
+    for fake in fakes:
+        fake.reset_counters()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", script],
+        env=env, cwd=cwd, capture_output=True, text=True
+    )
+    result = {"seconds": None, "peak_rss_mb": None, "error": None}
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+    if proc.returncode != 0 and not result["error"]:
+        result["error"] = (proc.stderr.strip().splitlines() or [f"exit {proc.returncode}"])[-1]
+    result["requests"] = {fake.name: fake.total_requests() for fake in fakes}
+    result["kb_served"] = {fake.name: round(fake.bytes_out / 1024) for fake in fakes}
+    return result
+
+def run_volume(orders):
+    from fakes import FakeKonnektive, FakeGraph, FakePostgrest
+
+    orders_per_day = max(1, orders // (SYNC_DAYS + 1))
+    konnektive = FakeKonnektive(orders_per_day).start()
+    graph = FakeGraph(campaigns_per_account=max(5, orders // 2000)).start()
+    postgrest = FakePostgrest().start()
+    seed_inventory(postgrest)
+    fakes = [konnektive, graph, postgrest]
+
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = child_env(konnektive, graph, postgrest, os.path.join(workdir, "raw_archive"))
+            for script in SCRIPTS:
+                print(f"   ▶️ {script} ({orders:,} orders)...", flush=True)
+                results[script] = run_script(script, env, workdir, fakes)
+    finally:
+        for fake in fakes:
+            fake.stop()
+    results["_rows"] = postgrest.row_counts()
+    return results
+
+# --- 📊 REPORTING ---
+def print_report(all_results, baseline=None):
+    print(f"\n{'volume':>8}  {'script':<18} {'wall s':>8} {'peak MB':>8} {'konnektive':>10} {'graph':>6} {'postgrest':>9}  vs baseline")
+    for volume, results in all_results.items():
+        for script in SCRIPTS:
+            r = results[script]
+            req = r["requests"]
+            seconds = f"{r['seconds']:.2f}" if r["seconds"] is not None else "-"
+            peak = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+            line = f"{volume:>8,}  {script:<18} {seconds:>8} {peak:>8} {req['konnektive']:>10} {req['graph']:>6} {req['postgrest']:>9}"
+
+            before = (baseline or {}).get(volume, {}).get(script)
+            if before and before.get("seconds") and r["seconds"]:
+                ratio = r["seconds"] / before["seconds"]
+                flag = " ⚠️ slower" if ratio > SLOWER_THRESHOLD else ""
+                line += f"  {ratio:.2f}x time, {req['postgrest'] - before['requests']['postgrest']:+d} db requests{flag}"
+            if r["error"]:
+                line += f"  ❌ {r['error']}"
+            print(line)
+
+def load_baseline(path):
+    with open(path) as f:
+        return {int(volume): results for volume, results in json.load(f).items()}
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        run_child(sys.argv[2])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--volumes", type=int, nargs="+", default=DEFAULT_VOLUMES, help="Orders per run.")
+    parser.add_argument("--save", help="Write the results as JSON (use as a later --baseline).")
+    parser.add_argument("--baseline", help="Compare against results saved with --save.")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    all_results = {}
+    for volume in args.volumes:
+        print(f"🧪 Benchmarking {volume:,} orders...")
+        all_results[volume] = run_volume(volume)
+
+    print_report(all_results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
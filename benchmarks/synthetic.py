@@ -0,0 +1,61 @@
+"""Deterministic Konnektive- and Graph-shaped test data for the benchmarks."""
+import random
+
+STATUSES = ["COMPLETE"] * 12 + ["REFUNDED", "CANCELLED", "CHARGEBACK", "PARTIAL", "DECLINED", "FAILED", "PENDING"]
+TYPES = ["NEW_SALE", "SALE", "RECURRING", "RECURRING", "UPSELL", "OTHER"]
+TEST_VALUES = [None, None, None, False, "0", "false", True, "1", "TRUE"]
+
+def synthetic_order(i, rng, day="2026-01-01"):
+    """One raw order with a realistic mix of statuses, types and items."""
+    items = {
+        str(j): {
+            "name": rng.choice(["Cooling Roller - 1x", "Warming Oil - 2x", "Bundle (6x)", ""]),
+            "qty": str(rng.randint(1, 3)),
+            "productId": rng.randint(2000, 2100),
+            "campaignProductId": rng.choice([None, rng.randint(1, 500)]),
+            "sku": rng.choice([None, f"SKU-{rng.randint(1, 50)}"]),
+            "price": f"{rng.uniform(5, 60):.2f}"
+        } for j in range(rng.randint(1, 3))
+    }
+    return {
+        "orderId": f"ORD-{day}-{i}",
+        "orderStatus": rng.choice(STATUSES),
+        "orderType": rng.choice(TYPES),
+        "test": rng.choice(TEST_VALUES),
+        "totalAmount": rng.choice([f"{rng.uniform(10, 200):.2f}", None, ""]),
+        "dateCreated": f"{day} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        "campaignId": rng.randint(1, 20),
+        "campaignName": rng.choice(["Main Funnel", "Cooling Roller - Summer", "Warming Oil Retarget"]),
+        "UTMSource": rng.choice([None, "facebook"]),
+        "sourceValue1": "fb",
+        "affId": None,
+        "currencyCode": "USD",
+        "emailAddress": f"c{i}@example.com",
+        "state": "TX",
+        "country": "US",
+        "items": items if rng.random() < 0.8 else list(items.values())
+    }
+
+def synthetic_orders(n, seed=7, day="2026-01-01"):
+    rng = random.Random(seed)
+    return [synthetic_order(i, rng, day) for i in range(n)]
+
+def synthetic_insights(account_id, days, campaigns, seed=7):
+    """Graph API insights rows: one per campaign per day."""
+    rng = random.Random(f"{seed}-{account_id}")
+    rows = []
+    for day in days:
+        for c in range(campaigns):
+            rows.append({
+                "date_start": day,
+                "date_stop": day,
+                "account_name": f"Account {account_id}",
+                "campaign_id": f"{account_id.replace('act_', '')}{c:04d}",
+                "campaign_name": rng.choice(["Main Funnel", "Cooling Roller - Summer", "Warming Oil Retarget"]) + f" #{c}",
+                "spend": f"{rng.uniform(5, 400):.2f}",
+                "impressions": str(rng.randint(100, 50000)),
+                "clicks": str(rng.randint(1, 900)),
+                "cpc": f"{rng.uniform(0.2, 3):.2f}",
+                "ctr": f"{rng.uniform(0.5, 4):.2f}"
+            })
+    return rows
@@ -50,7 +50,9 @@ export function AIDailyInsight({ type }: { type: InsightType }) {
         .from("ai_daily_insights")
         .select("*")
         .eq("type", type)
-        .order("created_at", { ascending: false })
+        // Latest day first, then by rank (the briefing is rank 1, then the most unusual findings)
+        .order("date", { ascending: false })
+        .order("rank", { ascending: true })
         .limit(3)
 
       if (!error && data) {
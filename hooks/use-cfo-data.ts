@@ -7,8 +7,17 @@ export type DailyMetric = {
   adSpend: number
   profit: number
   margin: number
+  orders?: number
+  aov?: number
 }
 
+// scripts/metrics_service.py buckets and caches by UTC day (YYYY-MM-DD), so every key here is a UTC day
+const DAY_MS = 24 * 60 * 60 * 1000
+const utcDateKey = (d: Date) => d.toISOString().split("T")[0]
+// A date picked in the calendar (local midnight) names that calendar day
+const pickedDateKey = (d: Date) =>
+  `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`
+
 export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
   const [isLoading, setIsLoading] = useState(true)
   const [metrics, setMetrics] = useState({
@@ -27,16 +36,28 @@ export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
     async function fetchData() {
       setIsLoading(true)
       try {
-        const end = customEnd ? new Date(customEnd) : new Date()
-        end.setHours(23, 59, 59, 999) 
-
-        const start = customStart ? new Date(customStart) : new Date()
-        if (!customStart) {
-          start.setDate(end.getDate() - 30)
+        const endKey = customEnd ? pickedDateKey(customEnd) : utcDateKey(new Date())
+        const startKey = customStart
+          ? pickedDateKey(customStart)
+          : utcDateKey(new Date(Date.parse(endKey) - 30 * DAY_MS))
+        const start = new Date(`${startKey}T00:00:00.000Z`)
+        const end = new Date(`${endKey}T23:59:59.999Z`)
+
+        // --- ⚡ PRECOMPUTED: one small document from scripts/metrics_service.py ---
+        const { data: cached } = await supabase
+          .from("dashboard_metrics_cache")
+          .select("payload")
+          .eq("start_date", startKey)
+          .eq("end_date", endKey)
+          .maybeSingle()
+
+        if (cached?.payload) {
+          setMetrics(cached.payload.metrics)
+          setDailyHistory(cached.payload.dailyHistory)
+          return
         }
-        start.setHours(0, 0, 0, 0) 
 
-        // --- 🚀 FIX: RECURSIVE FETCH (Bypasses 1,000 row limit) ---
+        // --- 🚀 FALLBACK: RECURSIVE FETCH (Bypasses 1,000 row limit) ---
         let allTransactions: any[] = []
         let from = 0
         let to = 999
@@ -53,14 +74,12 @@ export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
 
           if (error) throw error
           if (data && data.length > 0) {
-            allTransactions = [...allTransactions, ...data]
+            allTransactions.push(...data)
             from += 1000
             to += 1000
-          } else {
-            finished = true
           }
-          // Safety break to prevent infinite loops
-          if (from > 10000) finished = true 
+          // Stop on the last (short) page
+          if (!data || data.length < 1000) finished = true
         }
 
         const [adsResponse] = await Promise.all([
@@ -87,18 +106,21 @@ export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
         }
 
         const dailyMap = new Map<string, DailyMetric>()
+        // Estimated COGS per day, summed per order (the fixed handling + freight is per order)
+        const dailyCOGS = new Map<string, number>()
         
         let iter = new Date(start);
         while (iter <= end) {
             const key = iter.toISOString().split('T')[0];
             dailyMap.set(key, { date: key, revenue: 0, adSpend: 0, profit: 0, margin: 0 });
-            iter.setDate(iter.getDate() + 1);
+            iter.setUTCDate(iter.getUTCDate() + 1);
         }
 
         transactions.forEach(t => {
             const key = new Date(t.date).toISOString().split('T')[0];
             if (dailyMap.has(key)) {
                 dailyMap.get(key)!.revenue += (t.total_amount || 0);
+                dailyCOGS.set(key, (dailyCOGS.get(key) || 0) + calculateOrderCOGS(t.total_amount || 0));
             }
         });
 
@@ -110,7 +132,7 @@ export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
         });
 
         const historyArray = Array.from(dailyMap.values()).map(day => {
-            const realCOGS = calculateOrderCOGS(day.revenue)
+            const realCOGS = dailyCOGS.get(day.date) || 0
             const net = day.revenue - day.adSpend - realCOGS
             return {
                 ...day,
@@ -123,7 +145,7 @@ export function useCFODashboardData(customStart?: Date, customEnd?: Date) {
 
         const totalRev = transactions.reduce((sum, t) => sum + (t.total_amount || 0), 0);
         const adSpend = ads.reduce((sum, a) => sum + (a.spend || 0), 0);
-        const totalCOGS = historyArray.reduce((sum, d) => sum + calculateOrderCOGS(d.revenue), 0);
+        const totalCOGS = Array.from(dailyCOGS.values()).reduce((sum, c) => sum + c, 0);
 
         setMetrics({
           totalRevenue: totalRev,
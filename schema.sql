@@ -21,3 +21,282 @@ CREATE TABLE IF NOT EXISTS ai_insights (
   date date PRIMARY KEY,
   insight_text text
 );
+
+-- 4. Change detection for the sales sync
+-- backfill_sales.py stores a hash of each order's status, amount and items
+-- and only rewrites orders whose hash changed since the last run.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS content_hash text;
+
+-- 5. FIFO cost allocation (optional server-side path, FIFO_USE_RPC=true)
+-- Allocates a run's line items against active inventory_batches, oldest
+-- batch first, in one transaction. An advisory lock serialises concurrent
+-- syncs and transactions already present in the ledger are skipped, so a
+-- re-run never deducts twice. Returns the number of ledger rows written.
+CREATE INDEX IF NOT EXISTS transaction_cost_ledger_transaction_id_idx
+  ON transaction_cost_ledger (transaction_id);
+
+CREATE OR REPLACE FUNCTION fifo_allocate(p_items jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  item jsonb;
+  mapping record;
+  batch record;
+  processed text[];
+  remaining integer;
+  take integer;
+  ledger_rows integer := 0;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('fifo_allocate'));
+
+  SELECT array_agg(DISTINCT l.transaction_id::text) INTO processed
+    FROM transaction_cost_ledger l
+   WHERE l.transaction_id::text IN (SELECT jsonb_array_elements(p_items)->>'transaction_id');
+
+  FOR item IN SELECT * FROM jsonb_array_elements(p_items) LOOP
+    CONTINUE WHEN item->>'transaction_id' = ANY(COALESCE(processed, ARRAY[]::text[]));
+
+    SELECT pm.base_product, COALESCE(pm.units_per_variant, 1) AS units INTO mapping
+      FROM product_map pm
+     WHERE pm.product_id::text = item->>'product_id';
+    CONTINUE WHEN NOT FOUND OR mapping.base_product IS NULL;
+
+    remaining := (item->>'qty')::integer * mapping.units;
+
+    FOR batch IN
+      SELECT * FROM inventory_batches b
+       WHERE b.base_product = mapping.base_product AND b.status = 'active' AND b.remaining_qty > 0
+       ORDER BY b.batch_id
+       FOR UPDATE
+    LOOP
+      EXIT WHEN remaining <= 0;
+      take := LEAST(batch.remaining_qty, remaining);
+
+      UPDATE inventory_batches
+         SET remaining_qty = batch.remaining_qty - take,
+             status = CASE WHEN batch.remaining_qty - take > 0 THEN 'active' ELSE 'depleted' END
+       WHERE batch_id = batch.batch_id;
+
+      INSERT INTO transaction_cost_ledger (transaction_id, product_name, batch_id, qty_deducted, cost_per_unit_at_time)
+      VALUES (item->>'transaction_id', item->>'product_name', batch.batch_id, take, batch.unit_cost);
+
+      remaining := remaining - take;
+      ledger_rows := ledger_rows + 1;
+    END LOOP;
+  END LOOP;
+
+  RETURN ledger_rows;
+END;
+$$;
+
+-- 6. Daily revenue totals for generate_insights.py
+-- Returns one row per day x revenue_type instead of every transaction.
+CREATE INDEX IF NOT EXISTS transactions_date_idx ON transactions (date);
+
+CREATE OR REPLACE FUNCTION daily_revenue_totals(p_start date, p_end date DEFAULT NULL)
+RETURNS TABLE (day date, revenue_type text, total_amount numeric, order_count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT t.date::date AS day, t.revenue_type, SUM(t.total_amount), COUNT(*)
+    FROM transactions t
+   WHERE t.date >= p_start
+     AND (p_end IS NULL OR t.date < p_end + 1)
+   GROUP BY 1, 2;
+$$;
+
+-- 7. Daily rollup maintained by backfill_sales.py and sync_fb_ads.py
+-- One row per date x revenue_type x campaign_id. Facebook spend rows use
+-- revenue_type 'Ad Spend', with ROAS taken from the same campaign_id's
+-- revenue. Every refreshed day has an 'ALL'/'ALL' total row with revenue,
+-- orders, refunds, ad spend and ROAS, even a day with no activity, so a
+-- missing ALL row means the day has not been rolled up yet.
+-- Rebuild from scratch: python scripts/daily_metrics.py --rebuild
+CREATE TABLE IF NOT EXISTS daily_metrics (
+  date date NOT NULL,
+  revenue_type text NOT NULL,
+  campaign_id text NOT NULL DEFAULT '',
+  revenue numeric NOT NULL DEFAULT 0,
+  order_count integer NOT NULL DEFAULT 0,
+  refund_count integer NOT NULL DEFAULT 0,
+  refund_amount numeric NOT NULL DEFAULT 0,
+  ad_spend numeric NOT NULL DEFAULT 0,
+  roas numeric,
+  PRIMARY KEY (date, revenue_type, campaign_id)
+);
+
+-- 8. Precomputed CFO dashboard documents (scripts/metrics_service.py)
+-- One row per (start_date, end_date) range holding the metrics block and the
+-- dailyHistory series. Sync scripts drop overlapping ranges and recompute
+-- the default 7/30/90-day ranges after every run.
+CREATE TABLE IF NOT EXISTS dashboard_metrics_cache (
+  start_date date NOT NULL,
+  end_date date NOT NULL,
+  payload jsonb NOT NULL,
+  computed_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (start_date, end_date)
+);
+
+-- 9. Real per-order COGS from the FIFO ledger (scripts/cost_lookup.py)
+-- One summed row per transaction; looked up by the indexed transaction_id.
+-- Orders with no ledger rows fall back to the supplier estimate.
+CREATE OR REPLACE VIEW transaction_costs AS
+  SELECT transaction_id, SUM(qty_deducted * cost_per_unit_at_time) AS cogs
+    FROM transaction_cost_ledger
+   GROUP BY transaction_id;
+
+ALTER TABLE daily_metrics ADD COLUMN IF NOT EXISTS cogs numeric NOT NULL DEFAULT 0;
+ALTER TABLE daily_metrics ADD COLUMN IF NOT EXISTS profit numeric NOT NULL DEFAULT 0;
+
+-- 10. Per-run timings and request counts (scripts/instrumentation.py)
+-- Append-only; written when SYNC_METRICS_TABLE=true. `summary` holds the
+-- same JSON the scripts write to SYNC_METRICS_DIR.
+CREATE TABLE IF NOT EXISTS sync_run_metrics (
+  id bigserial PRIMARY KEY,
+  job text NOT NULL,
+  started_at timestamptz NOT NULL,
+  seconds numeric NOT NULL,
+  summary jsonb NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS sync_run_metrics_job_started_idx
+  ON sync_run_metrics (job, started_at);
+
+-- 11. Campaign attribution (scripts/attribution.py)
+-- Revenue from transactions joined to Facebook spend per day and campaign.
+-- campaign_key is the Facebook campaign_id; revenue that matches no campaign
+-- is kept under 'unattributed'. Rebuilt for the touched days together with
+-- daily_metrics. campaign_map is optional: it ties a transaction's campaign_id,
+-- traffic_source, affiliate_id or campaign_name to a Facebook campaign when
+-- the values do not already match (compared lowercased, punctuation as '-').
+CREATE TABLE IF NOT EXISTS campaign_map (
+  source_value text PRIMARY KEY,
+  fb_campaign_id text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS campaign_attribution (
+  date date NOT NULL,
+  campaign_key text NOT NULL,
+  campaign_name text,
+  revenue numeric NOT NULL DEFAULT 0,
+  order_count integer NOT NULL DEFAULT 0,
+  refund_count integer NOT NULL DEFAULT 0,
+  refund_amount numeric NOT NULL DEFAULT 0,
+  spend numeric NOT NULL DEFAULT 0,
+  roas numeric,
+  cpa numeric,
+  PRIMARY KEY (date, campaign_key)
+);
+
+CREATE INDEX IF NOT EXISTS campaign_attribution_campaign_idx
+  ON campaign_attribution (campaign_key, date);
+
+-- 12. Inventory forecast (scripts/inventory_forecast.py)
+-- inventory_daily_usage holds the units each base_product used per day. It
+-- counts FIFO ledger deductions, plus items x units_per_variant for orders
+-- the ledger could not fill; refunded, cancelled and charged-back orders are
+-- left out. Only the days a sync touched are recomputed.
+-- inventory_forecast averages the last INVENTORY_BURN_DAYS of usage and
+-- projects the active batches forward in FIFO order. `batches` holds each
+-- batch's projected depletion date. `reorder` is set once reorder_by
+-- (depletion minus lead time and safety days) has passed. Products with no
+-- usage and no stock left are deleted on each refresh.
+CREATE TABLE IF NOT EXISTS inventory_daily_usage (
+  date date NOT NULL,
+  base_product text NOT NULL,
+  units numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (date, base_product)
+);
+
+CREATE TABLE IF NOT EXISTS inventory_forecast (
+  base_product text PRIMARY KEY,
+  on_hand numeric NOT NULL DEFAULT 0,
+  daily_burn numeric NOT NULL DEFAULT 0,
+  days_of_cover numeric,
+  depletion_date date,
+  reorder_by date,
+  reorder boolean NOT NULL DEFAULT false,
+  batches jsonb NOT NULL DEFAULT '[]',
+  computed_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- 13. Ranked daily insights and their rolling baselines (scripts/anomalies.py)
+-- insight_baselines keeps a running mean and variance (Welford) per metric x
+-- segment x weekday. segment is 'ALL', a revenue_type or a Facebook
+-- campaign_id; dow 0-6 is Monday-Sunday and 7 means every day. Each run
+-- folds in only the days after last_date, and rows not folded for
+-- INSIGHT_SEED_DAYS (paused campaigns) are deleted. generate_insights.py writes the
+-- briefing as rank 1, then the most unusual findings, upserting on (date, rank).
+-- Older databases keyed ai_daily_insights on date alone (one insight per
+-- day); the DO block below drops that key so a day can hold several ranks.
+CREATE TABLE IF NOT EXISTS insight_baselines (
+  metric text NOT NULL,
+  segment text NOT NULL,
+  dow smallint NOT NULL,
+  n integer NOT NULL DEFAULT 0,
+  mean double precision NOT NULL DEFAULT 0,
+  m2 double precision NOT NULL DEFAULT 0,
+  last_date date,
+  PRIMARY KEY (metric, segment, dow)
+);
+
+CREATE TABLE IF NOT EXISTS ai_daily_insights (
+  id bigserial PRIMARY KEY,
+  date date NOT NULL,
+  title text,
+  content text,
+  status text,
+  type text,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+DO $$
+DECLARE
+  date_col smallint;
+  con record;
+  idx record;
+BEGIN
+  SELECT attnum INTO date_col FROM pg_attribute
+   WHERE attrelid = 'ai_daily_insights'::regclass AND attname = 'date';
+
+  -- Primary key or unique constraint on date alone
+  FOR con IN
+    SELECT conname FROM pg_constraint
+     WHERE conrelid = 'ai_daily_insights'::regclass
+       AND contype IN ('p', 'u')
+       AND conkey = ARRAY[date_col]
+  LOOP
+    EXECUTE format('ALTER TABLE ai_daily_insights DROP CONSTRAINT %I', con.conname);
+  END LOOP;
+
+  -- Unique index on date alone that is not backed by a constraint
+  FOR idx IN
+    SELECT indexrelid::regclass AS name FROM pg_index
+     WHERE indrelid = 'ai_daily_insights'::regclass
+       AND indisunique AND indnatts = 1 AND indkey[0] = date_col
+  LOOP
+    EXECUTE format('DROP INDEX %s', idx.name);
+  END LOOP;
+END $$;
+
+ALTER TABLE ai_daily_insights ADD COLUMN IF NOT EXISTS id bigserial;
+ALTER TABLE ai_daily_insights ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+ALTER TABLE ai_daily_insights ADD COLUMN IF NOT EXISTS rank integer NOT NULL DEFAULT 1;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'ai_daily_insights'::regclass AND contype = 'p') THEN
+    ALTER TABLE ai_daily_insights ADD PRIMARY KEY (id);
+  END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ai_daily_insights_date_rank_idx
+  ON ai_daily_insights (date, rank);
+
+-- 14. Stable paging keys (scripts/aggregates.py ROW_KEYS)
+-- Paged reads order by a unique key so .range() pages never skip or repeat
+-- rows. The item and ledger tables are read per transaction_id, which is not
+-- unique, so they need an id to break ties.
+ALTER TABLE transaction_items ADD COLUMN IF NOT EXISTS id bigserial;
+ALTER TABLE transaction_cost_ledger ADD COLUMN IF NOT EXISTS id bigserial;
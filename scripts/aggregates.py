@@ -0,0 +1,144 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+PAGE_SIZE = 1000
+# Values per in() lookup, kept well under the URL length limit
+IN_CHUNK_SIZE = 500
+# Unique key per table, appended to every paged read's order so .range()
+# pages never skip or repeat rows that tie on the sort column
+ROW_KEYS = {
+    "transactions": ["transaction_id"],
+    "transaction_items": ["id"],
+    "transaction_cost_ledger": ["id"],
+    "transaction_costs": ["transaction_id"],
+    "facebook_ads": ["date", "campaign_id"],
+    "daily_metrics": ["date", "revenue_type", "campaign_id"],
+    "campaign_attribution": ["date", "campaign_key"],
+    "inventory_batches": ["batch_id"],
+    "inventory_daily_usage": ["date", "base_product"],
+    "insight_baselines": ["metric", "segment", "dow"],
+}
+
+def ordered(query, table, order_by=()):
+    """Orders by `order_by` (a column or list of columns), then by the table's unique key."""
+    columns = [order_by] if isinstance(order_by, str) else list(order_by)
+    for column in columns + [c for c in ROW_KEYS.get(table, []) if c not in columns]:
+        query = query.order(column)
+    return query
+
+def iter_rows(supabase, table, columns, start_date=None, end_date=None, page_size=PAGE_SIZE, order_by="date"):
+    """Streams rows from `table` one page at a time (dates are inclusive days)."""
+    start_row = 0
+    while True:
+        query = supabase.table(table).select(columns)
+        if start_date:
+            query = query.gte("date", start_date.isoformat())
+        if end_date:
+            query = query.lt("date", (end_date + timedelta(days=1)).isoformat())
+        res = ordered(query, table, order_by).range(start_row, start_row + page_size - 1).execute()
+
+        rows = res.data or []
+        yield from rows
+        if len(rows) < page_size:
+            break
+        start_row += page_size
+
+def iter_in(supabase, table, columns, column, values, chunk_size=IN_CHUNK_SIZE, page_size=PAGE_SIZE, eq=None):
+    """Streams every row of `table` whose `column` is one of `values` (and matches `eq`).
+
+    Looks the values up `chunk_size` at a time with in(). PostgREST returns
+    at most `page_size` rows per request, so a chunk that comes back full is
+    split in half and read again rather than silently truncated.
+    """
+    values = list(values)
+    for i in range(0, len(values), chunk_size):
+        yield from _iter_in_chunk(supabase, table, columns, column, values[i:i + chunk_size], page_size, eq or {})
+
+def _select(supabase, table, columns, eq):
+    query = supabase.table(table).select(columns)
+    for key, value in eq.items():
+        query = query.eq(key, value)
+    return query
+
+def _iter_in_chunk(supabase, table, columns, column, chunk, page_size, eq):
+    if len(chunk) == 1:
+        # One value with more rows than a page: page through it
+        start_row = 0
+        while True:
+            query = _select(supabase, table, columns, eq).eq(column, chunk[0])
+            res = ordered(query, table).range(start_row, start_row + page_size - 1).execute()
+            rows = res.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            start_row += page_size
+
+    res = _select(supabase, table, columns, eq).in_(column, chunk).range(0, page_size - 1).execute()
+    rows = res.data or []
+    if len(rows) < page_size:
+        yield from rows
+        return
+    middle = len(chunk) // 2
+    yield from _iter_in_chunk(supabase, table, columns, column, chunk[:middle], page_size, eq)
+    yield from _iter_in_chunk(supabase, table, columns, column, chunk[middle:], page_size, eq)
+
+def add_totals(totals, day, revenue_type, amount, orders):
+    bucket = totals[(day, revenue_type)]
+    bucket["total_amount"] += float(amount or 0)
+    bucket["order_count"] += int(orders or 0)
+
+def stream_daily_totals(rows):
+    """Single pass over raw transaction rows -> {(day, revenue_type): totals}."""
+    totals = defaultdict(lambda: {"total_amount": 0.0, "order_count": 0})
+    for row in rows:
+        add_totals(totals, date.fromisoformat(row["date"][:10]), row.get("revenue_type"), row.get("total_amount"), 1)
+    return totals
+
+def daily_revenue_totals(supabase, start_date, end_date=None, store=None):
+    """Daily revenue and order count per revenue_type.
+
+    Answers from the local mirror (`store`, see local_store.py) when it holds
+    the whole window. Otherwise reads the `daily_metrics` rollup when it has
+    an ALL row for every day of the window, then the `daily_revenue_totals`
+    SQL function (schema.sql), so only a few rows per day cross the network.
+    If neither is available, falls back to streaming the raw rows through one
+    Python pass.
+    """
+    if store is not None and store.covers("transactions", start_date, end_date):
+        return store.daily_revenue_totals(start_date, end_date)
+
+    try:
+        totals = defaultdict(lambda: {"total_amount": 0.0, "order_count": 0})
+        rolled_up = set()
+        for row in iter_rows(supabase, "daily_metrics", "date, revenue_type, revenue, order_count, refund_count", start_date, end_date):
+            day = date.fromisoformat(row["date"][:10])
+            if row["revenue_type"] == "ALL":
+                rolled_up.add(day)
+            if row["revenue_type"] in ["ALL", "Ad Spend"]:
+                continue
+            add_totals(totals, day, row["revenue_type"], row["revenue"],
+                       (row.get("order_count") or 0) + (row.get("refund_count") or 0))
+        last_day = end_date or date.today()
+        missing = [start_date + timedelta(days=i) for i in range((last_day - start_date).days + 1)
+                   if start_date + timedelta(days=i) not in rolled_up]
+        if not missing:
+            return totals
+        print(f"   ℹ️ daily_metrics is missing {len(missing)} day(s) of the window (first {missing[0]}), "
+              f"rebuild with `python scripts/daily_metrics.py --rebuild`.")
+    except Exception as e:
+        print(f"   ℹ️ daily_metrics rollup unavailable ({e}).")
+
+    try:
+        res = supabase.rpc("daily_revenue_totals", {
+            "p_start": start_date.isoformat(),
+            "p_end": end_date.isoformat() if end_date else None
+        }).execute()
+        totals = defaultdict(lambda: {"total_amount": 0.0, "order_count": 0})
+        for row in res.data or []:
+            add_totals(totals, date.fromisoformat(str(row["day"])[:10]), row.get("revenue_type"), row.get("total_amount"), row.get("order_count"))
+        return totals
+    except Exception as e:
+        print(f"   ℹ️ daily_revenue_totals RPC unavailable ({e}), streaming raw rows instead.")
+
+    rows = iter_rows(supabase, "transactions", "total_amount, date, revenue_type", start_date, end_date)
+    return stream_daily_totals(rows)
@@ -0,0 +1,178 @@
+import os
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from aggregates import iter_rows
+
+# --- ⚙️ CONFIGURATION ---
+Z_THRESHOLD = float(os.environ.get("INSIGHT_Z_THRESHOLD", 2.5))
+CRITICAL_Z = float(os.environ.get("INSIGHT_CRITICAL_Z", 4.0))
+# History folded into brand-new baselines on the first run, and the furthest
+# back any run reads; baselines not folded for this long are aged out
+SEED_DAYS = int(os.environ.get("INSIGHT_SEED_DAYS", 56))
+# Baselines are running means until they hold this many samples, then decay
+# with weight 1/N per new day, so they follow the business rather than its whole history
+MAX_SAMPLES = {"dow": 12, "all": 90}
+MIN_SAMPLES = {"dow": 4, "all": 14}
+ALL_DAYS = 7  # `dow` value of the every-day baseline (0-6 are Monday-Sunday)
+WINDOWS = [1, 7]
+
+# metric -> (label, higher is better, insight type, formatter)
+METRICS = {
+    "revenue": ("Revenue", True, "performance", lambda v: f"${v:,.0f}"),
+    "refund_rate": ("Refund rate", False, "cfo", lambda v: f"{v * 100:.1f}%"),
+    "spend": ("Ad spend", None, "cfo", lambda v: f"${v:,.0f}"),
+    "roas": ("ROAS", True, "performance", lambda v: f"{v:.2f}x"),
+}
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# --- 📥 DAILY SERIES (from the daily_metrics and campaign_attribution rollups) ---
+def daily_series(supabase, start, end, names=None):
+    """{(metric, segment): {day: value}} for start..end, read from the rollups only.
+
+    Campaign segments are keyed by campaign_id (names can change); pass a
+    dict as `names` to collect campaign_id -> campaign_name for display.
+    """
+    series = defaultdict(dict)
+    revenue_by_type = defaultdict(float)
+    for row in iter_rows(supabase, "daily_metrics", "date, revenue_type, revenue, order_count, refund_count, ad_spend, roas", start, end):
+        day = date.fromisoformat(row["date"][:10])
+        if row["revenue_type"] == "ALL":
+            series[("revenue", "ALL")][day] = float(row["revenue"] or 0)
+            series[("spend", "ALL")][day] = float(row["ad_spend"] or 0)
+            orders = (row.get("order_count") or 0) + (row.get("refund_count") or 0)
+            if orders:
+                series[("refund_rate", "ALL")][day] = (row.get("refund_count") or 0) / orders
+            if row.get("roas") is not None:
+                series[("roas", "ALL")][day] = float(row["roas"])
+        elif row["revenue_type"] != "Ad Spend":
+            revenue_by_type[(row["revenue_type"], day)] += float(row["revenue"] or 0)
+    for (revenue_type, day), revenue in revenue_by_type.items():
+        series[("revenue", revenue_type)][day] = revenue
+
+    try:
+        for row in iter_rows(supabase, "campaign_attribution", "date, campaign_key, campaign_name, spend, roas", start, end):
+            if row["campaign_key"] == "unattributed" or not row.get("spend"):
+                continue
+            day = date.fromisoformat(row["date"][:10])
+            segment = row["campaign_key"]
+            if names is not None and row.get("campaign_name"):
+                names[segment] = row["campaign_name"]
+            series[("spend", segment)][day] = float(row["spend"])
+            if row.get("roas") is not None:
+                series[("roas", segment)][day] = float(row["roas"])
+    except Exception as e:
+        print(f"   ℹ️ campaign_attribution unavailable ({e}), skipping per-campaign baselines.")
+    return series
+
+# --- 📐 BASELINES (insight_baselines, one row per metric x segment x dow) ---
+def load_baselines(supabase):
+    rows = iter_rows(supabase, "insight_baselines", "*", order_by=["metric", "segment", "dow"])
+    return {(row["metric"], row["segment"], row["dow"]): row for row in rows}
+
+def update_baseline(baseline, value):
+    """Welford's running mean/variance; past MAX_SAMPLES an exponentially weighted one."""
+    cap = MAX_SAMPLES["all" if baseline["dow"] == ALL_DAYS else "dow"]
+    n, mean, m2 = baseline["n"], float(baseline["mean"]), float(baseline["m2"])
+    if n < cap:
+        n += 1
+        delta = value - mean
+        mean += delta / n
+        m2 += delta * (value - mean)
+    else:
+        alpha = 1 / cap
+        variance = m2 / (n - 1)
+        delta = value - mean
+        mean += alpha * delta
+        variance = (1 - alpha) * (variance + alpha * delta * delta)
+        m2 = variance * (n - 1)
+    baseline.update(n=n, mean=mean, m2=m2)
+
+def fold_days(baselines, series, through):
+    """Adds every day after each baseline's last_date (up to `through`). Returns the rows that changed."""
+    changed = {}
+    for (metric, segment), values in series.items():
+        for day in sorted(values):
+            if day > through:
+                continue
+            for dow in (day.weekday(), ALL_DAYS):
+                key = (metric, segment, dow)
+                baseline = baselines.setdefault(key, {"metric": metric, "segment": segment, "dow": dow,
+                                                      "n": 0, "mean": 0.0, "m2": 0.0, "last_date": None})
+                if baseline["last_date"] and day <= date.fromisoformat(str(baseline["last_date"])[:10]):
+                    continue
+                update_baseline(baseline, values[day])
+                baseline["last_date"] = day.isoformat()
+                changed[key] = baseline
+    return list(changed.values())
+
+def unfolded_start(baselines, today):
+    """First day to read: the day after the every-day ALL revenue baseline's last_date.
+
+    Capped at SEED_DAYS back, so a paused campaign's stale baseline never
+    stretches the read; its old rows age out (see stale_before).
+    """
+    floor = today - timedelta(days=SEED_DAYS)
+    watermark = baselines.get(("revenue", "ALL", ALL_DAYS), {}).get("last_date")
+    if not watermark:
+        return floor
+    return max(date.fromisoformat(str(watermark)[:10]) + timedelta(days=1), floor)
+
+def stale_before(today):
+    """Baselines last folded before this day have aged out."""
+    return today - timedelta(days=SEED_DAYS)
+
+# --- 🚨 DETECTION ---
+def z_score(value, baseline, window):
+    """How unusual a `window`-day mean is against a baseline (None = not enough history)."""
+    kind = "all" if baseline["dow"] == ALL_DAYS else "dow"
+    if baseline["n"] < MIN_SAMPLES[kind]:
+        return None
+    std = math.sqrt(float(baseline["m2"]) / (baseline["n"] - 1)) / math.sqrt(window)
+    if std <= 1e-9:
+        return None
+    return (value - float(baseline["mean"])) / std
+
+def detect(series, baselines, day):
+    """Anomalies for the window ending on `day`, most unusual first.
+
+    The 1-day window compares `day` with the same weekday's baseline; the
+    7-day window compares the week's mean with the every-day baseline.
+    """
+    found = []
+    for (metric, segment), values in series.items():
+        for window in WINDOWS:
+            days = [day - timedelta(days=i) for i in range(window)]
+            if any(d not in values for d in days):
+                continue
+            value = sum(values[d] for d in days) / window
+            baseline = baselines.get((metric, segment, day.weekday() if window == 1 else ALL_DAYS))
+            z = z_score(value, baseline, window) if baseline else None
+            if z is None or abs(z) < Z_THRESHOLD:
+                continue
+            found.append({"metric": metric, "segment": segment, "window": window, "value": value,
+                          "mean": float(baseline["mean"]), "z": z, "day": day})
+    return sorted(found, key=lambda a: abs(a["z"]), reverse=True)
+
+def to_insight(anomaly, names=None):
+    label, higher_is_better, insight_type, fmt = METRICS[anomaly["metric"]]
+    direction = "above" if anomaly["z"] > 0 else "below"
+    good = higher_is_better is not None and (anomaly["z"] > 0) == higher_is_better
+    if good:
+        status = "success"
+    else:
+        status = "critical" if abs(anomaly["z"]) >= CRITICAL_Z else "warning"
+    segment = "" if anomaly["segment"] == "ALL" else f" ({(names or {}).get(anomaly['segment'], anomaly['segment'])})"
+    if anomaly["window"] == 1:
+        period, typical = DAY_NAMES[anomaly["day"].weekday()], f"a typical {DAY_NAMES[anomaly['day'].weekday()]}"
+    else:
+        period, typical = f"{anomaly['window']}-day average", "the usual day"
+    if anomaly["metric"] == "revenue" and anomaly["segment"] == "MRR Revenue":
+        insight_type = "mrr"
+    return {
+        "title": f"{label}{segment} {'up' if anomaly['z'] > 0 else 'down'} ({period})",
+        "content": f"{label}{segment} was {fmt(anomaly['value'])}, {abs(anomaly['z']):.1f}σ {direction} "
+                   f"{typical} ({fmt(anomaly['mean'])}).",
+        "status": status,
+        "type": insight_type
+    }
@@ -0,0 +1,170 @@
+import re
+import argparse
+from collections import defaultdict
+from datetime import date, timedelta
+from aggregates import iter_rows
+from order_transform import REFUND_EVENTS
+
+# One row per date x campaign_key in `campaign_attribution` (schema.sql section 11).
+# campaign_key is the Facebook campaign_id; revenue we cannot tie to a campaign
+# lands on UNATTRIBUTED so the per-day totals still add up.
+UNATTRIBUTED = "unattributed"
+WRITE_CHUNK_SIZE = 500
+
+# Transaction columns tried in order when looking for the Facebook campaign
+TRANSACTION_KEYS = ["campaign_id", "traffic_source", "affiliate_id", "campaign_name"]
+TRANSACTION_COLUMNS = "date, total_amount, event_type, " + ", ".join(TRANSACTION_KEYS)
+AD_COLUMNS = "date, campaign_id, campaign_name, spend"
+
+def normalize_key(value):
+    """'FB | Sleep Cold ' -> 'fb-sleep-cold': what both sides are compared on."""
+    if value is None:
+        return ""
+    return re.sub(r"[^a-z0-9]+", "-", str(value).strip().lower()).strip("-")
+
+def load_campaign_map(supabase):
+    """{normalized source value: Facebook campaign_id} from the optional `campaign_map` table."""
+    try:
+        res = supabase.table("campaign_map").select("source_value, fb_campaign_id").execute()
+    except Exception as e:
+        print(f"   ℹ️ campaign_map unavailable ({e}), matching on IDs and names only.")
+        return {}
+    return {normalize_key(row["source_value"]): str(row["fb_campaign_id"]) for row in res.data or []}
+
+class AttributionIndex:
+    """Folds transactions and ad rows into per-day, per-campaign revenue and spend.
+
+    Both sides are grouped as they stream past, so memory is bounded by the
+    number of distinct (day, campaign) pairs rather than the number of rows.
+    Transactions are resolved to a Facebook campaign only in `build_rows`,
+    once every ad row (and therefore every campaign name) has been seen.
+    """
+
+    def __init__(self, campaign_map=None):
+        self.campaign_map = campaign_map or {}
+        # (day, candidate keys) -> revenue totals
+        self.revenue = defaultdict(lambda: {"revenue": 0.0, "order_count": 0, "refund_count": 0, "refund_amount": 0.0})
+        # (day, fb campaign_id) -> spend
+        self.spend = defaultdict(float)
+        # normalized campaign_id / campaign_name -> fb campaign_id
+        self.campaigns = {}
+        self.names = {}
+
+    def add_transaction(self, t):
+        keys = tuple(normalize_key(t.get(column)) for column in TRANSACTION_KEYS)
+        bucket = self.revenue[(t["date"][:10], keys)]
+        amount = float(t.get("total_amount") or 0)
+        bucket["revenue"] += amount
+        if t.get("event_type") in REFUND_EVENTS:
+            bucket["refund_count"] += 1
+            bucket["refund_amount"] += amount
+        else:
+            bucket["order_count"] += 1
+
+    def add_ad(self, a):
+        campaign_id = str(a.get("campaign_id") or "")
+        if not campaign_id:
+            return
+        self.spend[(a["date"][:10], campaign_id)] += float(a.get("spend") or 0)
+        self.campaigns[normalize_key(campaign_id)] = campaign_id
+        if a.get("campaign_name"):
+            self.names[campaign_id] = a["campaign_name"]
+            self.campaigns.setdefault(normalize_key(a["campaign_name"]), campaign_id)
+
+    def tap(self, rows, add):
+        """Passes `rows` through unchanged, feeding each one to `add` on the way."""
+        for row in rows:
+            add(row)
+            yield row
+
+    def resolve(self, keys):
+        """The Facebook campaign for one set of transaction keys: campaign_map first, then a direct match."""
+        for key in keys:
+            if key and key in self.campaign_map:
+                return self.campaign_map[key]
+        for key in keys:
+            if key and key in self.campaigns:
+                return self.campaigns[key]
+        return UNATTRIBUTED
+
+    def build_rows(self):
+        rows = {}
+
+        def row_for(day, campaign_key):
+            if (day, campaign_key) not in rows:
+                rows[(day, campaign_key)] = {
+                    "date": day,
+                    "campaign_key": campaign_key,
+                    "campaign_name": self.names.get(campaign_key),
+                    "revenue": 0.0,
+                    "order_count": 0,
+                    "refund_count": 0,
+                    "refund_amount": 0.0,
+                    "spend": 0.0,
+                    "roas": None,
+                    "cpa": None
+                }
+            return rows[(day, campaign_key)]
+
+        # Each distinct key tuple is resolved once, however many orders share it
+        resolved = {}
+        for (day, keys), totals in self.revenue.items():
+            if keys not in resolved:
+                resolved[keys] = self.resolve(keys)
+            row = row_for(day, resolved[keys])
+            for field, value in totals.items():
+                row[field] += value
+
+        for (day, campaign_id), spend in self.spend.items():
+            row_for(day, campaign_id)["spend"] += spend
+
+        for row in rows.values():
+            row["revenue"] = round(row["revenue"], 2)
+            row["refund_amount"] = round(row["refund_amount"], 2)
+            row["spend"] = round(row["spend"], 2)
+            if row["spend"] > 0:
+                row["roas"] = round(row["revenue"] / row["spend"], 4)
+                if row["order_count"] > 0:
+                    row["cpa"] = round(row["spend"] / row["order_count"], 2)
+        return list(rows.values())
+
+def write_rows(supabase, start, end, rows):
+    """Replaces campaign_attribution for start..end (inclusive) with `rows`."""
+    day_strings = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    supabase.table("campaign_attribution").delete().in_("date", day_strings).execute()
+    for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+        supabase.table("campaign_attribution").insert(rows[i:i + WRITE_CHUNK_SIZE]).execute()
+    return len(rows)
+
+def refresh_range(supabase, start, end, campaign_map=None):
+    """Recomputes campaign_attribution for start..end straight from the fact tables.
+
+    The sync scripts do not call this: daily_metrics.refresh_days feeds the
+    same rows it already reads for the rollup through an AttributionIndex.
+    """
+    index = AttributionIndex(load_campaign_map(supabase) if campaign_map is None else campaign_map)
+    for t in iter_rows(supabase, "transactions", TRANSACTION_COLUMNS, start, end):
+        index.add_transaction(t)
+    for a in iter_rows(supabase, "facebook_ads", AD_COLUMNS, start, end):
+        index.add_ad(a)
+    return write_rows(supabase, start, end, index.build_rows())
+
+if __name__ == "__main__":
+    from clients import get_supabase
+
+    parser = argparse.ArgumentParser(description="Recompute the campaign_attribution table.")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD).")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD). Defaults to today.")
+    parser.add_argument("--window-days", type=int, default=31)
+    args = parser.parse_args()
+
+    client = get_supabase()
+    campaign_map = load_campaign_map(client)
+    end_date = args.end or date.today()
+    current = args.start
+    while current <= end_date:
+        window_end = min(current + timedelta(days=args.window_days - 1), end_date)
+        written = refresh_range(client, current, window_end, campaign_map)
+        print(f"🎯 campaign_attribution {current} → {window_end}: {written} rows.")
+        current = window_end + timedelta(days=1)
+    print("✅ campaign_attribution rebuild complete.")
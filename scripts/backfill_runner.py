@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+import instrumentation
+
+# --- ⚙️ CONFIGURATION ---
+# Completed (source, day) units are checkpointed as marker files under
+# BACKFILL_STATE_DIR/<source>/<YYYY-MM-DD>.done, so a re-run skips them.
+# Days written but not yet rolled up wait under BACKFILL_STATE_DIR/refresh/.
+STATE_DIR = os.environ.get("BACKFILL_STATE_DIR", "backfill_state")
+WORKERS = int(os.environ.get("BACKFILL_WORKERS", 4))
+SHARD_DAYS = int(os.environ.get("BACKFILL_SHARD_DAYS", 7))
+SOURCES = ["konnektive", "facebook"]
+
+# --- 📍 CHECKPOINTS ---
+def marker_path(state_dir, source, day):
+    return os.path.join(state_dir, source, f"{day.isoformat()}.done")
+
+def is_done(state_dir, source, day):
+    return os.path.exists(marker_path(state_dir, source, day))
+
+def mark_done(state_dir, source, day, details):
+    """Writes the marker atomically so a killed worker never leaves a half-written one."""
+    path = marker_path(state_dir, source, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"finished_at": datetime.now(timezone.utc).isoformat(), **details}, f)
+    os.replace(tmp_path, path)
+
+def mark_refresh_pending(state_dir, days):
+    """Records written days before they are checkpointed, so a killed run still refreshes them."""
+    refresh_dir = os.path.join(state_dir, "refresh")
+    os.makedirs(refresh_dir, exist_ok=True)
+    for day in days:
+        open(os.path.join(refresh_dir, f"{day.isoformat()}.pending"), "a").close()
+
+def refresh_pending_days(state_dir):
+    refresh_dir = os.path.join(state_dir, "refresh")
+    if not os.path.isdir(refresh_dir):
+        return set()
+    return {date.fromisoformat(name[:10]) for name in os.listdir(refresh_dir) if name.endswith(".pending")}
+
+def clear_refresh_pending(state_dir, days):
+    for day in days:
+        try:
+            os.remove(os.path.join(state_dir, "refresh", f"{day.isoformat()}.pending"))
+        except FileNotFoundError:
+            pass
+
+def pending_days(state_dir, source, start_date, end_date):
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    return [day for day in days if not is_done(state_dir, source, day)]
+
+def make_shards(days, shard_days):
+    """Groups pending days into runs of at most `shard_days` consecutive days."""
+    shards = []
+    for day in days:
+        if shards and len(shards[-1]) < shard_days and (day - shards[-1][-1]).days == 1:
+            shards[-1].append(day)
+        else:
+            shards.append([day])
+    return shards
+
+# --- 👷 WORKERS (one process per shard, each with its own clients) ---
+def run_konnektive_shard(days, state_dir, deadline):
+    """Syncs a shard one day at a time, checkpointing each day that fully landed."""
+    import backfill_sales
+
+    completed, touched = [], set()
+    for day in days:
+        if deadline and time.time() > deadline:
+            break
+        result = backfill_sales.run_backfill(day, day, refresh=False)
+        touched.update(result["touched_days"])
+        mark_refresh_pending(state_dir, result["touched_days"])
+        if result["failed_chunks"] or result["fetch_errors"]:
+            print(f"   ⚠️ konnektive {day}: not checkpointed, will retry on the next run.")
+            continue
+        mark_done(state_dir, "konnektive", day, {"saved": result["saved"], **result["counts"]})
+        completed.append(day)
+    return completed, touched
+
+def run_facebook_shard(days, state_dir, deadline):
+    """Syncs a shard as one Graph API request stream per account (the API pages by range)."""
+    import sync_fb_ads
+
+    if deadline and time.time() > deadline:
+        return [], set()
+    all_stats = sync_fb_ads.fetch_all_accounts(days[0], days[-1], refresh=False)
+    touched = set()
+    for stats in all_stats:
+        touched.update(stats["days"])
+    mark_refresh_pending(state_dir, touched)
+    if not all_stats or any(stats["error"] for stats in all_stats):
+        print(f"   ⚠️ facebook {days[0]}..{days[-1]}: not checkpointed, will retry on the next run.")
+        return [], touched
+    for day in days:
+        mark_done(state_dir, "facebook", day, {"accounts": len(all_stats)})
+    return days, touched
+
+SHARD_RUNNERS = {"konnektive": run_konnektive_shard, "facebook": run_facebook_shard}
+
+def run_shard(source, days, state_dir, deadline):
+    metrics = instrumentation.start_run(f"backfill_{source}")
+    completed, touched = SHARD_RUNNERS[source](days, state_dir, deadline)
+    return source, completed, touched, metrics.summary()
+
+# --- 🚀 RUNNER ---
+def run(start_date, end_date, sources=None, workers=WORKERS, shard_days=SHARD_DAYS, state_dir=STATE_DIR, max_minutes=None):
+    """Runs every pending (source, day) in start_date..end_date across worker processes.
+
+    Returns the number of days still pending (0 = the range is complete).
+    """
+    sources = sources or SOURCES
+    deadline = time.time() + max_minutes * 60 if max_minutes else None
+    metrics = instrumentation.current()
+
+    jobs = []
+    for source in sources:
+        days = pending_days(state_dir, source, start_date, end_date)
+        shards = make_shards(days, shard_days)
+        print(f"📋 {source}: {len(days)} pending day(s) in {len(shards)} shard(s).")
+        jobs.extend((source, shard) for shard in shards)
+
+    touched_days = set()
+    done_count = 0
+    # spawn: each worker builds its own HTTP and Supabase clients instead of inheriting ours
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as pool:
+        futures = {pool.submit(run_shard, source, shard, state_dir, deadline): (source, shard) for source, shard in jobs}
+        for future in as_completed(futures):
+            source, shard = futures[future]
+            try:
+                _, completed, touched, summary = future.result()
+            except Exception as e:
+                print(f"   ❌ {source} {shard[0]}..{shard[-1]} crashed: {e}")
+                continue
+            touched_days.update(touched)
+            done_count += len(completed)
+            metrics.merge(summary)
+            print(f"   ✅ {source} {shard[0]}..{shard[-1]}: {len(completed)}/{len(shard)} day(s) checkpointed.")
+
+    # One rollup + cache refresh for everything the shards wrote, plus any
+    # days a crashed shard or a killed earlier run left unrefreshed
+    leftover = refresh_pending_days(state_dir) - touched_days
+    if leftover:
+        print(f"   🔁 {len(leftover)} day(s) left by a crashed shard or an earlier run still need their rollups refreshed.")
+    touched_days |= leftover
+    if touched_days:
+        from clients import get_supabase
+        from daily_metrics import refresh_days
+        from metrics_service import refresh_cache
+
+        supabase = get_supabase()
+        try:
+            with instrumentation.span("daily_metrics refresh", days=len(touched_days)):
+                refresh_days(supabase, touched_days)
+            with instrumentation.span("dashboard cache refresh"):
+                refresh_cache(supabase, touched_days)
+            clear_refresh_pending(state_dir, touched_days)
+        except Exception as e:
+            print(f"⚠️ daily_metrics refresh failed, kept for the next run: {e}")
+
+    remaining = sum(len(pending_days(state_dir, source, start_date, end_date)) for source in sources)
+    print(f"\n🏁 Backfill {start_date} → {end_date}: {done_count} day(s) done this run, {remaining} still pending.")
+    return remaining
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded, resumable backfill of Konnektive orders and Facebook ad spend.")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD).")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(), help="Last day (YYYY-MM-DD). Defaults to today.")
+    parser.add_argument("--source", choices=SOURCES + ["all"], default="all")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes.")
+    parser.add_argument("--shard-days", type=int, default=SHARD_DAYS, help="Days per shard.")
+    parser.add_argument("--state-dir", default=STATE_DIR, help="Where checkpoints are kept.")
+    parser.add_argument("--max-minutes", type=float, help="Stop starting new days after this long (leave room to save state).")
+    args = parser.parse_args()
+
+    metrics = instrumentation.start_run("backfill_runner")
+    remaining = run(
+        args.start, args.end,
+        sources=SOURCES if args.source == "all" else [args.source],
+        workers=args.workers, shard_days=args.shard_days,
+        state_dir=args.state_dir, max_minutes=args.max_minutes
+    )
+    metrics.finish()
+    # Non-zero so a workflow can tell a partial run from a finished one
+    exit(3 if remaining else 0)
@@ -1,263 +1,510 @@
 import os
-import requests
+import sys
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import date, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from clients import supabase
+from product_map import ProductMapCache
+from daily_metrics import safe_refresh_days
+from metrics_service import refresh_cache
+from raw_archive import RawArchive
+from order_transform import transform_page
+import config
+import instrumentation
+import inventory_forecast
+import local_store
+import write_queue
+import http_client
 
 # --- 📅 CONFIGURATION ---
 # 1. Check for Sync Mode (Full vs. Refunds Only)
 # 'FULL' = Download everything. 'REFUNDS' = Only check for bad statuses (fast).
 SYNC_MODE = os.environ.get("SYNC_MODE", "FULL") 
 
-# 2. Date Logic
-if os.environ.get("SYNC_DAYS"):
-    # If workflow sets days explicitly (e.g. 3 or 30)
-    days = int(os.environ.get("SYNC_DAYS"))
-    print(f"🤖 AUTOMATION MODE: Syncing last {days} days ({SYNC_MODE} sweep)...")
-    START_DATE = date.today() - timedelta(days=days)
-    END_DATE = date.today()
-elif os.environ.get("GITHUB_ACTIONS") == "true":
-    # Default fallback for GitHub Actions if variable missing
-    print("🤖 AUTOMATION MODE: Defaulting to last 3 days...")
-    START_DATE = date.today() - timedelta(days=3)
-    END_DATE = date.today()
-else:
-    # MANUAL RE-RUN (Local Computer)
-    print("🛠️ MANUAL MODE: Backfilling from Dec 27...")
-    START_DATE = date(2026, 1, 13) 
-    END_DATE = date(2026, 2, 2)
-
-# --- 🔐 CREDENTIALS ---
-load_dotenv(".env.local")
-CHECKOUT_CHAMP_ID = os.environ.get("CHECKOUT_CHAMP_ID") 
-CHECKOUT_CHAMP_PASS = os.environ.get("CHECKOUT_CHAMP_PASS") 
-
-if not CHECKOUT_CHAMP_ID or not CHECKOUT_CHAMP_PASS:
-    if os.environ.get("GITHUB_ACTIONS") != "true":
-        print("⚠️ WARNING: Credentials not found. Please check .env.local")
+# 2. Date Logic (SYNC_DAYS / GitHub Actions / manual re-run range, see config.py)
+START_DATE, END_DATE, DATE_MODE = config.sync_date_range(date(2026, 1, 13), date(2026, 2, 2))
 
-# SUPABASE
-url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key = os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-supabase: Client = create_client(url, key)
-
-def determine_event_type(raw):
-    order_type = raw.get('orderType', '').upper()
-    order_status = raw.get('orderStatus', '').upper()
-
-    if order_status == 'REFUNDED':
-        return 'refunded', 'Refund'
-    if order_status == 'CANCELLED':
-        return 'cancelled', 'Cancelled'
-    if order_status == 'CHARGEBACK':
-        return 'chargeback', 'Chargeback'
-    
-    if order_type == 'NEW_SALE' or order_type == 'SALE':
-        return 'sale_new', 'Cold Traffic Revenue'
-    elif order_type == 'RECURRING':
-        return 'sale_recurring', 'MRR Revenue'
-    elif order_type == 'UPSELL':
-        return 'sale_upsell', 'Cold Traffic Revenue'
-    
-    return 'unknown', 'Other'
+# 3. Write Batching (rows per bulk call to Supabase, batches allowed to queue for the writer)
+WRITE_CHUNK_SIZE = int(os.environ.get("WRITE_CHUNK_SIZE", 500))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", 4))
 
-def fetch_orders_for_date(target_date):
-    formatted_date = target_date.strftime("%m/%d/%Y")
-    endpoint = "https://api.konnektive.com/order/query/"
-    
+# 4. Change Detection (SYNC_FORCE=true rewrites every order, even unchanged ones)
+SYNC_FORCE = os.environ.get("SYNC_FORCE", "").lower() in ["true", "1"]
+
+# 5. Konnektive Paging & Concurrency
+KONNEKTIVE_ORDER_QUERY_URL = os.environ.get("KONNEKTIVE_ORDER_QUERY_URL", "https://api.konnektive.com/order/query/")
+RESULTS_PER_PAGE = 200
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 8))
+
+# 6. Refund Detection (used when SYNC_MODE=REFUNDS, see refund_tracker.py)
+# 'delta'    = ask Konnektive for orders *updated* since the last run (falls back to 'adaptive')
+# 'adaptive' = re-check each order day on a schedule that slows down as the day ages
+# 'sweep'    = re-query every day x refund status in the SYNC_DAYS window
+REFUND_STRATEGY = os.environ.get("REFUND_STRATEGY", "delta").lower()
+
+# 7. Raw Response Archive (set RAW_ARCHIVE_DIR to keep every API page on disk)
+# `python scripts/backfill_sales.py --replay` re-processes the archive with no network.
+# STORE_RAW_DATA=false stops copying the raw order JSON into transactions.raw_data.
+REPLAY = "--replay" in sys.argv[1:]
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR") or ("raw_archive" if REPLAY else None)
+STORE_RAW_DATA = os.environ.get("STORE_RAW_DATA", "true").lower() not in ["false", "0"]
+raw_archive = RawArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None
+
+# --- 🔐 CREDENTIALS (Supabase connects lazily on first use, see clients.py) ---
+CHECKOUT_CHAMP_ID = config.CHECKOUT_CHAMP_ID
+CHECKOUT_CHAMP_PASS = config.CHECKOUT_CHAMP_PASS
+
+def statuses_for_mode(sync_mode):
     # ⚡ OPTIMIZATION: Define which statuses to check based on mode
-    if SYNC_MODE == "REFUNDS":
+    if sync_mode == "REFUNDS":
         # In audit mode, we ONLY ask for these. API returns tiny payload. Fast.
-        statuses_to_check = ["REFUNDED", "CANCELLED", "CHARGEBACK", "PARTIAL"]
-    else:
-        # In full mode, we ask for everything (None = no filter)
-        statuses_to_check = [None] 
-
-    all_cleaned_orders = []
-
-    for status_filter in statuses_to_check:
-        
-        params = {
-            "loginId": CHECKOUT_CHAMP_ID,
-            "password": CHECKOUT_CHAMP_PASS,
-            "startDate": formatted_date,
-            "endDate": formatted_date,
-            "resultsPerPage": 200
-        }
-        
-        # Apply filter if we are checking a specific status
-        if status_filter:
-            print(f"   🔎 Checking {formatted_date} for [{status_filter}]...", end=" ")
-            params["orderStatus"] = status_filter
+        return ["REFUNDED", "CANCELLED", "CHARGEBACK", "PARTIAL"]
+    # In full mode, we ask for everything (None = no filter)
+    return [None]
+
+def fetch_order_page(target_date, status_filter, page):
+    """Fetches one page of order/query. Returns (raw_orders, total_results)."""
+    formatted_date = target_date.strftime("%m/%d/%Y")
+    params = {
+        "loginId": CHECKOUT_CHAMP_ID,
+        "password": CHECKOUT_CHAMP_PASS,
+        "startDate": formatted_date,
+        "endDate": formatted_date,
+        "resultsPerPage": RESULTS_PER_PAGE,
+        "page": page
+    }
+
+    # Apply filter if we are checking a specific status
+    if status_filter:
+        params["orderStatus"] = status_filter
+
+    # Pages are fetched on worker threads, so these seconds add up across workers
+    with instrumentation.span("fetch"):
+        response = http_client.get(KONNEKTIVE_ORDER_QUERY_URL, params=params)
+        json_resp = response.json()
+
+    # Results live either in `data` or in `message` (with the paging info)
+    body = json_resp
+    raw_orders = json_resp.get('data')
+    if not raw_orders:
+        msg = json_resp.get('message')
+        if isinstance(msg, dict):
+            body = msg
+            raw_orders = msg.get('data', [])
         else:
-            print(f"   🔎 Querying {formatted_date} (Full Sync)...", end=" ")
+            # A string message is the standard "No records" answer
+            raw_orders = []
 
-        try:
-            response = requests.get(endpoint, params=params)
-            json_resp = response.json()
-            
-            raw_orders = json_resp.get('data')
-            
-            if not raw_orders:
-                msg = json_resp.get('message')
-                if isinstance(msg, dict):
-                    raw_orders = msg.get('data', [])
-                elif isinstance(msg, str):
-                    if "totalResults" not in str(json_resp): 
-                        # Only print actual errors, skip standard "No records" messages
-                        pass 
-                    raw_orders = []
-
-            if not raw_orders:
-                # Silence "0 orders" spam if we are just sweeping for refunds
-                if not status_filter: 
-                    print("0 orders.")
-                else: 
-                    print("0.")
-                continue # Move to next status check
-
-            # --- PROCESS THE BATCH ---
-            clean_orders = []
-            skipped_count = 0
-            
-            for raw in raw_orders:
-                # 1. Skip Declined/Failed
-                status = raw.get('orderStatus', '').upper()
-                if status in ['DECLINED', 'FAILED', 'ERROR', 'PENDING']:
-                    skipped_count += 1
+    raw_orders = raw_orders or []
+    if isinstance(raw_orders, dict):
+        raw_orders = list(raw_orders.values())
+
+    try:
+        total_results = int(body.get('totalResults') or len(raw_orders))
+    except (TypeError, ValueError):
+        total_results = len(raw_orders)
+
+    if raw_archive:
+        if page == 1:
+            # A re-fetch can come back with fewer pages than the archived one
+            raw_archive.clear("konnektive", target_date, archive_page_prefix(status_filter))
+        raw_archive.write_records("konnektive", target_date, archive_page_name(status_filter, page), raw_orders)
+
+    return raw_orders, total_results
+
+def archive_page_prefix(status_filter):
+    return f"{status_filter or 'ALL'}-p"
+
+def archive_page_name(status_filter, page):
+    return f"{archive_page_prefix(status_filter)}{page:04d}"
+
+def replay_order_pages(start_date, end_date, sync_mode=None, errors=None):
+    """Same pages as stream_order_pages, read from the raw archive instead of Konnektive."""
+    statuses = statuses_for_mode(sync_mode or SYNC_MODE)
+    day = start_date
+    while day <= end_date:
+        day_total = 0
+        for status in statuses:
+            for name in raw_archive.names("konnektive", day, prefix=archive_page_prefix(status)):
+                try:
+                    with instrumentation.span("fetch"):
+                        raw_orders = list(raw_archive.iter_records("konnektive", day, name))
+                    with instrumentation.span("transform", rows=len(raw_orders)):
+                        orders = transform_page(raw_orders)
+                except Exception as e:
+                    print(f"   ❌ Error replaying {day.strftime('%m/%d/%Y')} {name}: {e}")
+                    if errors is not None:
+                        errors.append((day, status, name, str(e)))
                     continue
-                
-                # 2. Skip TEST transactions
-                is_test = raw.get('test')
-                if is_test is True or str(is_test).lower() in ['true', '1']:
-                    skipped_count += 1
+                day_total += len(orders)
+                yield day, status, name, orders
+        print(f"   📼 {day.strftime('%m/%d/%Y')}: replayed {day_total} valid orders.")
+        day += timedelta(days=1)
+
+def stream_order_pages(start_date, end_date, sync_mode=None, concurrency=None, errors=None):
+    """Yields (day, status, page, cleaned_orders) for every page in the range as it arrives.
+
+    Page 1 of each (day, status) is queued first; the remaining pages jump the
+    queue as soon as `totalResults` is known, so days finish roughly in order.
+    At most `concurrency` pages are in flight or waiting for the consumer, so
+    memory stays flat however long the range is. Pages that failed to fetch
+    or transform are appended to `errors` as (day, status, page, message).
+    """
+    statuses = statuses_for_mode(sync_mode or SYNC_MODE)
+    concurrency = concurrency or FETCH_CONCURRENCY
+    queued = deque((start_date + timedelta(days=i), status, 1)
+                   for i in range((end_date - start_date).days + 1) for status in statuses)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while queued or pending:
+            while queued and len(pending) < concurrency:
+                key = queued.popleft()
+                pending[pool.submit(fetch_order_page, *key)] = key
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                day, status, page = pending.pop(future)
+                label = f"{day.strftime('%m/%d/%Y')} [{status or 'ALL'}] p{page}"
+                try:
+                    raw_orders, total_results = future.result()
+                except Exception as e:
+                    print(f"   ❌ Error on {label}: {e}")
+                    if errors is not None:
+                        errors.append((day, status, page, str(e)))
                     continue
 
-                # --- LOGIC MAPPING ---
-                event_type, revenue_type = determine_event_type(raw)
-                
-                # Handle Refund Values (Make them negative)
-                total_amount = float(raw.get('totalAmount', 0) or 0)
-                if event_type in ['refunded', 'cancelled', 'chargeback']:
-                    total_amount = -abs(total_amount)
-
-                # --- ITEM PARSING ---
-                raw_items = raw.get('items', [])
-                items_list = []
-                if isinstance(raw_items, dict):
-                    items_list = list(raw_items.values())
-                elif isinstance(raw_items, list):
-                    items_list = raw_items
-
-                clean_items = []
-                for item in items_list:
-                    if not item.get('name'): continue
-                    
-                    clean_items.append({
-                        "product_name": item.get('name'),
-                        "qty": int(item.get('qty', 1)),
-                        "external_product_id": item.get('productId'),
-                        "campaign_product_id": item.get('campaignProductId') or item.get('variantDetailId'),
-                        "sku": item.get('sku') or item.get('productSku'),
-                        "price": float(item.get('price', 0))
-                    })
-
-                # --- TRANSACTION BUILDING ---
-                clean_orders.append({
-                    "transaction_id": raw.get('orderId'),
-                    "order_id": raw.get('orderId'),
-                    "date": raw.get('dateCreated'),
-                    "total_amount": total_amount,
-                    "status": "sale",
-                    "event_type": event_type,
-                    "revenue_type": revenue_type,
-                    "payment_status": raw.get('orderStatus'),
-                    "campaign_id": raw.get('campaignId'),
-                    "campaign_name": raw.get('campaignName'),
-                    "traffic_source": raw.get('UTMSource') or raw.get('sourceValue1'),
-                    "affiliate_id": raw.get('affId'),
-                    "currency": raw.get('currencyCode', 'USD'),
-                    "customer_email": raw.get('emailAddress'),
-                    "customer_state": raw.get('state') or raw.get('shipState'),
-                    "customer_country": raw.get('country') or raw.get('shipCountry'),
-                    "raw_data": raw,  
-                    "items": clean_items
-                })
-            
-            # Print specific success message per status check
-            if status_filter:
-                print(f"✅ Found {len(clean_orders)} [{status_filter}].")
-            else:
-                print(f"✅ Found {len(clean_orders)} valid orders!")
+                if page == 1:
+                    total_pages = max(1, -(-total_results // RESULTS_PER_PAGE))
+                    queued.extendleft((day, status, next_page) for next_page in range(total_pages, 1, -1))
+                    if total_pages > 1:
+                        print(f"   📄 {label}: {total_results} results across {total_pages} pages.")
 
-            # Add this batch to the master list
-            all_cleaned_orders.extend(clean_orders)
+                try:
+                    with instrumentation.span("transform", rows=len(raw_orders)):
+                        orders = transform_page(raw_orders)
+                except Exception as e:
+                    # One malformed order loses its page, not the whole range
+                    print(f"   ❌ Error transforming {label}: {e}")
+                    if errors is not None:
+                        errors.append((day, status, page, str(e)))
+                    continue
+                print(f"   🔎 {label}: ✅ {len(orders)} valid orders.")
+                yield day, status, page, orders
 
-        except Exception as e:
-            print(f"\n   ❌ Error on {formatted_date}: {e}")
+def fetch_orders_for_range(start_date, end_date, sync_mode=None, concurrency=None, errors=None):
+    """Collects stream_order_pages into [(day, cleaned_orders), ...] in date order.
+
+    Orders are kept in status/page order within each day. Holds the whole
+    range in memory; run_backfill streams instead.
+    """
+    statuses = statuses_for_mode(sync_mode or SYNC_MODE)
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    pages = {}
+    for day, status, page, orders in stream_order_pages(start_date, end_date, sync_mode, concurrency, errors):
+        pages[(day, status, page)] = orders
+
+    results = []
+    for day in days:
+        day_orders = []
+        for status in statuses:
+            for key in sorted(k for k in pages if k[0] == day and k[1] == status):
+                day_orders.extend(pages[key])
+        results.append((day, day_orders))
+    return results
+
+def fetch_orders_for_date(target_date):
+    return fetch_orders_for_range(target_date, target_date)[0][1]
+
+def chunked(rows, size):
+    """Yields successive slices of `rows` with at most `size` entries."""
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def load_stored_hashes(transaction_ids, chunk_size=WRITE_CHUNK_SIZE):
+    """Returns {transaction_id: content_hash} for the given IDs already in Supabase."""
+    stored = {}
+    for chunk in chunked(list(transaction_ids), chunk_size):
+        res = supabase.table("transactions") \
+            .select("transaction_id, content_hash") \
+            .in_("transaction_id", chunk) \
+            .execute()
+        for row in res.data or []:
+            stored[str(row["transaction_id"])] = row.get("content_hash")
+    return stored
+
+def select_changed_orders(orders):
+    """Splits orders into new/changed/unchanged against the stored hashes.
+
+    Returns (orders_to_write, counts). If the stored hashes cannot be read,
+    every order is written so nothing is skipped by mistake.
+    """
+    counts = {"unchanged": 0, "new": 0, "changed": 0}
+    if SYNC_FORCE:
+        counts["changed"] = len(orders)
+        return orders, counts
+
+    try:
+        stored = load_stored_hashes({str(order["transaction_id"]) for order in orders})
+    except Exception as e:
+        print(f"   ⚠️ Could not read stored hashes, writing all orders: {e}")
+        counts["changed"] = len(orders)
+        return orders, counts
+
+    to_write = []
+    for order in orders:
+        tid = str(order["transaction_id"])
+        if tid not in stored:
+            counts["new"] += 1
+        elif stored[tid] != order["content_hash"]:
+            counts["changed"] += 1
+        else:
+            counts["unchanged"] += 1
             continue
+        to_write.append(order)
+    return to_write, counts
 
-    return all_cleaned_orders
+def clear_content_hashes(transaction_ids, chunk_size=WRITE_CHUNK_SIZE):
+    """Forgets the stored hash of orders whose items did not land, so the next run rewrites them."""
+    for chunk in chunked(sorted(transaction_ids), chunk_size):
+        try:
+            supabase.table("transactions").update({"content_hash": None}).in_("transaction_id", chunk).execute()
+        except Exception as e:
+            print(f"   ⚠️ Could not clear the content hash of {len(chunk)} order(s), re-run with SYNC_FORCE=true: {e}")
 
-def run_backfill():
-    print(f"\n🚀 STARTING INTELLIGENT BACKFILL ({START_DATE} to {END_DATE})")
-    print(f"   🔑 Using Login ID: {str(CHECKOUT_CHAMP_ID)[:4]}****") 
-    
-    current_date = START_DATE
-    total_imported = 0
+def item_rows_for(chunk):
+    return [{
+        "transaction_id": order["transaction_id"],
+        "product_name": item["product_name"],
+        "qty": item["qty"],
+        "external_product_id": str(item["external_product_id"]),
+        "campaign_product_id": str(item["campaign_product_id"]),
+        "sku": item["sku"]
+    } for order in chunk for item in order["items"]]
+
+def write_orders(orders, product_cache, chunk_size=WRITE_CHUNK_SIZE):
+    """Writes cleaned orders as bulk calls, one chunk at a time.
+
+    Each chunk is one `transactions` upsert, one `transaction_items` delete and
+    one `transaction_items` insert. A failing chunk is reported and skipped so
+    the rest of the batch still lands; if it got past the upsert, its stored
+    hashes are cleared so the next run rewrites it. Unknown products are queued on
+    `product_cache` and inserted in one batched write before the items.
 
-    while current_date <= END_DATE:
-        orders = fetch_orders_for_date(current_date)
-        
-        if orders:
-            total_imported += len(orders)
-            for order in orders:
-                # 1. Upsert Transaction (Overwrites if exists = Handles Status Changes)
-                trans_data = {k:v for k,v in order.items() if k != "items"}
-                
+    With WRITE_QUEUE_PATH set the chunk goes to the durable write queue
+    instead (write_queue.py), which flushes and retries it in the background.
+    """
+    # One row per transaction_id: Postgres rejects an upsert that touches the same row twice
+    unique_orders = list({order["transaction_id"]: order for order in orders}.values())
+
+    # Product Map (Only insert if new) - answered from the cache, no network calls
+    try:
+        for order in unique_orders:
+            for item in order["items"]:
+                product_cache.discover(item["external_product_id"], item["product_name"])
+        # Register new products before their items reference them (no-op when nothing is new)
+        product_cache.flush()
+    except Exception as e:
+        print(f"   ⚠️ Product map update failed: {e}")
+
+    saved = 0
+    failed_chunks = []
+    queue = write_queue.get_queue(supabase)
+    skip_keys = ["items"] if STORE_RAW_DATA else ["items", "raw_data"]
+
+    for index, chunk in enumerate(chunked(unique_orders, chunk_size)):
+        transaction_ids = [order["transaction_id"] for order in chunk]
+        trans_rows = [{k:v for k,v in order.items() if k not in skip_keys} for order in chunk]
+        item_rows = item_rows_for(chunk)
+        stage = "transactions"
+        try:
+            if queue is not None:
+                # The queue mirrors the rows into the local store once they land
+                stage = "write queue"
+                queue.upsert("transactions", trans_rows, ["transaction_id"])
+                queue.replace("transaction_items", "transaction_id", transaction_ids, item_rows)
+            else:
+                # 1. Upsert Transactions (Overwrites if exists = Handles Status Changes)
                 try:
-                    supabase.table("transactions").upsert(trans_data).execute()
+                    supabase.table("transactions").upsert(trans_rows).execute()
                 except Exception as e:
-                    # Ignore known RLS errors if using anon key, but print others
-                    if '42501' not in str(e):
-                        print(f"⚠️ Error saving transaction {order['transaction_id']}: {e}")
+                    # RLS rejected the write: the anon key cannot write here, and the items would be orphaned
+                    if '42501' in str(e):
+                        stage = "transactions (row-level security, use a key with write access)"
+                    raise
 
                 # 2. CLEAN UP OLD ITEMS
-                try:
-                    supabase.table("transaction_items").delete().eq("transaction_id", order["transaction_id"]).execute()
-                except:
-                    pass 
+                stage = "transaction_items delete"
+                supabase.table("transaction_items").delete().in_("transaction_id", transaction_ids).execute()
 
                 # 3. Insert Fresh Items
-                for item in order["items"]:
-                    # Product Map (Only insert if new)
-                    pid = str(item["external_product_id"])
-                    try:
-                        exists = supabase.table("product_map").select("product_id").eq("product_id", pid).execute()
-                        if not exists.data:
-                             supabase.table("product_map").insert({
-                                "product_id": pid,
-                                "offer_name": item["product_name"],
-                                "units_per_variant": 1,
-                                "status": "needs_review"
-                            }).execute()
-                    except:
-                        pass 
-
-                    # Save Item Details
-                    supabase.table("transaction_items").insert({
-                        "transaction_id": order["transaction_id"],
-                        "product_name": item["product_name"],
-                        "qty": item["qty"],
-                        "external_product_id": pid,
-                        "campaign_product_id": str(item["campaign_product_id"]),
-                        "sku": item["sku"]
-                    }).execute()
-
-        current_date += timedelta(days=1)
-    
+                stage = "transaction_items insert"
+                if item_rows:
+                    supabase.table("transaction_items").insert(item_rows).execute()
+
+                local_store.mirror_orders(trans_rows, transaction_ids, item_rows)
+            saved += len(chunk)
+        except Exception as e:
+            print(f"   ⚠️ Chunk {index + 1} ({len(chunk)} orders) failed at {stage}: {e}")
+            failed_chunks.append({"chunk": index + 1, "stage": stage, "transaction_ids": transaction_ids, "error": str(e)})
+            # The transactions upsert already stored the new hashes; without this the
+            # next run would see these orders as unchanged and never rewrite their items
+            if stage != "transactions" and not stage.startswith("transactions ("):
+                clear_content_hashes(transaction_ids)
+
+    return saved, failed_chunks
+
+def drain_write_queue():
+    """Waits (up to WRITE_DRAIN_SECONDS) for queued order writes to land.
+
+    Returns a failed chunk for the transactions still queued, so callers
+    treat them like any other failed write: they stay in the queue file and
+    go out on a later flush.
+    """
+    queue = write_queue.get_queue(supabase)
+    if queue is None:
+        return []
+    with instrumentation.span("write queue drain"):
+        stats = queue.drain(timeout=write_queue.WRITE_DRAIN_SECONDS)
+    # Only this run's orders: other shards and older dead ops report themselves
+    pending_ids = {json.loads(key)[0] for key in queue.pop_unsettled("transactions", "upsert")}
+    pending_ids.update(queue.pop_unsettled("transaction_items", "replace"))
+    if not pending_ids:
+        return []
+    print(f"   📬 {len(pending_ids)} order(s) still in the write queue ({stats['pending']} pending, {stats['dead']} dead).")
+    clear_content_hashes(pending_ids)
+    return [{"chunk": "write queue", "stage": "write queue", "transaction_ids": sorted(pending_ids),
+             "error": f"{stats['pending'] + stats['in_flight']} op(s) queued, {stats['dead']} dead"}]
+
+def order_batches(pages, batch_size):
+    """Regroups the page stream into batches of about `batch_size` orders."""
+    batch = []
+    for _, _, _, orders in pages:
+        instrumentation.add("fetch", rows=len(orders))
+        batch.extend(orders)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_batch(index, orders, product_cache):
+    """Change detection + write for one batch (runs on the writer thread)."""
+    # Only new or changed orders are written
+    with instrumentation.span("change detection", rows=len(orders)):
+        changed_orders, counts = select_changed_orders(orders)
+
+    saved, failed_chunks = 0, []
+    if changed_orders:
+        with instrumentation.span("supabase write"):
+            saved, failed_chunks = write_orders(changed_orders, product_cache)
+        instrumentation.add("supabase write", rows=saved, failed_chunks=len(failed_chunks))
+    print(f"   💾 Batch {index}: saved {saved}/{len(changed_orders)} orders "
+          f"({counts['unchanged']} unchanged / {counts['new']} new / {counts['changed']} changed).")
+    return {
+        "saved": saved,
+        "failed_chunks": failed_chunks,
+        "counts": counts,
+        "touched_days": {date.fromisoformat(str(o["date"])[:10]) for o in changed_orders if o.get("date")}
+    }
+
+def write_pipeline(pages, product_cache, batch_size=WRITE_CHUNK_SIZE, queue_size=WRITE_QUEUE_SIZE):
+    """fetch -> transform -> write with bounded hand-offs between the stages.
+
+    The calling thread pulls pages from the fetch pool and groups them into
+    batches; one writer thread checks and writes them in order. At most
+    `queue_size` batches wait for the writer, so a slow database slows the
+    fetching down instead of piling orders up in memory.
+    """
+    slots = threading.BoundedSemaphore(queue_size)
+    futures = []
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for index, batch in enumerate(order_batches(pages, batch_size), start=1):
+            slots.acquire()
+            future = writer.submit(write_batch, index, batch, product_cache)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+    return [future.result() for future in futures]
+
+def run_backfill(start_date=None, end_date=None, sync_mode=None, refresh=True):
+    """Syncs start_date..end_date (defaults: the configured range and SYNC_MODE).
+
+    Returns a summary with the orders saved, the failed chunks and fetch
+    errors, and the days touched. `refresh=False` leaves the daily rollup and
+    dashboard cache to the caller (backfill_runner.py refreshes them once).
+    """
+    # Refund passes only write orders whose status changed (unless the old sweep is asked for)
+    if (sync_mode or SYNC_MODE) == "REFUNDS" and REFUND_STRATEGY != "sweep" and not REPLAY:
+        import refund_tracker
+        return refund_tracker.run_tracker(refresh=refresh)
+
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
+    print(f"\n🚀 STARTING INTELLIGENT BACKFILL ({start_date} to {end_date})")
+    if not REPLAY:
+        print(f"   🔑 Using Login ID: {str(CHECKOUT_CHAMP_ID)[:4]}****") 
+
+    total_imported = 0
+    all_failed_chunks = []
+    product_cache = ProductMapCache(supabase)
+    change_counts = {"unchanged": 0, "new": 0, "changed": 0}
+    touched_days = set()
+    fetch_errors = []
+
+    # Pages stream in (or replay from the archive) while earlier batches are written
+    if REPLAY:
+        print(f"   📼 REPLAY MODE: reading raw pages from {RAW_ARCHIVE_DIR}/konnektive")
+        pages = replay_order_pages(start_date, end_date, sync_mode, errors=fetch_errors)
+    else:
+        pages = stream_order_pages(start_date, end_date, sync_mode, errors=fetch_errors)
+
+    with instrumentation.span("pipeline"):
+        results = write_pipeline(pages, product_cache)
+
+    for result in results:
+        for k, v in result["counts"].items():
+            change_counts[k] += v
+        touched_days.update(result["touched_days"])
+        total_imported += result["saved"]
+        all_failed_chunks.extend(result["failed_chunks"])
+    # Queued writes must land before the rollups read them back
+    all_failed_chunks.extend(drain_write_queue())
+
+    # Keep the daily rollup in step with the days we just wrote
+    if refresh:
+        with instrumentation.span("daily_metrics refresh", days=len(touched_days)):
+            safe_refresh_days(supabase, touched_days)
+        if touched_days:
+            with instrumentation.span("dashboard cache refresh"):
+                refresh_cache(supabase, touched_days)
+            with instrumentation.span("inventory forecast"):
+                inventory_forecast.safe_refresh(supabase, touched_days, product_cache)
+
     print(f"\n✨ COMPLETE! Processed {total_imported} records.")
+    print(f"   🧮 {change_counts['unchanged']} unchanged / {change_counts['new']} new / {change_counts['changed']} changed.")
+    if all_failed_chunks:
+        failed_orders = sum(len(c["transaction_ids"]) for c in all_failed_chunks)
+        print(f"⚠️ {len(all_failed_chunks)} chunk(s) failed ({failed_orders} orders). Re-run the sync to retry them.")
+    if fetch_errors:
+        print(f"⚠️ {len(fetch_errors)} page(s) could not be fetched. Re-run the sync to retry them.")
+
+    return {
+        "saved": total_imported,
+        "failed_chunks": all_failed_chunks,
+        "fetch_errors": fetch_errors,
+        "touched_days": touched_days,
+        "counts": change_counts
+    }
 
 if __name__ == "__main__":
-    run_backfill()
\ No newline at end of file
+    print(f"{DATE_MODE} ({SYNC_MODE} sweep)...")
+    if (not CHECKOUT_CHAMP_ID or not CHECKOUT_CHAMP_PASS) and not config.IS_AUTOMATION and not REPLAY:
+        print("⚠️ WARNING: Credentials not found. Please check .env.local")
+
+    metrics = instrumentation.start_run("backfill_sales")
+    try:
+        run_backfill()
+    finally:
+        metrics.finish(supabase)
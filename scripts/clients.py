@@ -0,0 +1,32 @@
+import threading
+import config
+import instrumentation
+
+_supabase = None
+_lock = threading.Lock()
+
+def get_supabase():
+    """The process-wide Supabase client, created (and instrumented) on first use.
+
+    `supabase` is imported here rather than at module level: it is by far the
+    heaviest import, and scripts or tests that never touch the database
+    should not pay for it.
+    """
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+                _supabase = instrumentation.instrument_supabase(create_client(config.SUPABASE_URL, config.SUPABASE_KEY))
+    return _supabase
+
+def has_supabase_credentials():
+    return bool(config.SUPABASE_URL and config.SUPABASE_KEY)
+
+class LazySupabase:
+    """Module-level stand-in for the client: `supabase.table(...)` connects on first use."""
+
+    def __getattr__(self, name):
+        return getattr(get_supabase(), name)
+
+supabase = LazySupabase()
@@ -0,0 +1,53 @@
+import os
+from datetime import date, timedelta
+
+# --- 📄 ENVIRONMENT (read once, the first time any script imports this module) ---
+ROOT_ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env.local")
+
+def load_env():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        # GitHub Actions passes everything as real environment variables
+        return
+    # The working directory first (as the scripts always did), then the repo root
+    load_dotenv(".env.local")
+    load_dotenv(ROOT_ENV_FILE)
+
+load_env()
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in ["true", "1"]
+
+IS_AUTOMATION = os.environ.get("GITHUB_ACTIONS") == "true"
+
+# --- 🔐 CREDENTIALS ---
+SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+CHECKOUT_CHAMP_ID = os.environ.get("CHECKOUT_CHAMP_ID")
+CHECKOUT_CHAMP_PASS = os.environ.get("CHECKOUT_CHAMP_PASS")
+FB_ACCESS_TOKEN = os.environ.get("FACEBOOK_ACCESS_TOKEN")
+# Expecting a comma-separated string: "act_111,act_222,act_333"
+FB_AD_ACCOUNT_IDS_RAW = os.environ.get("FACEBOOK_AD_ACCOUNT_ID")
+
+# --- 📅 DATE RANGE ---
+SYNC_DAYS = int(os.environ["SYNC_DAYS"]) if os.environ.get("SYNC_DAYS") else None
+# GitHub Actions runs without SYNC_DAYS look back this far
+AUTOMATION_DAYS = 3
+
+def sync_date_range(manual_start, manual_end=None, today=None):
+    """(start, end, description) for a script run.
+
+    SYNC_DAYS wins (e.g. 3 or 30), then the 3-day GitHub Actions default,
+    then the script's own manual backfill range (`manual_end` None = today).
+    """
+    today = today or date.today()
+    if SYNC_DAYS is not None:
+        return today - timedelta(days=SYNC_DAYS), today, f"🤖 AUTOMATION MODE: Syncing last {SYNC_DAYS} days"
+    if IS_AUTOMATION:
+        return today - timedelta(days=AUTOMATION_DAYS), today, f"🤖 AUTOMATION MODE: Defaulting to last {AUTOMATION_DAYS} days"
+    end = manual_end or today
+    return manual_start, end, f"🛠️ MANUAL MODE: Backfilling {manual_start} to {end}"
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from aggregates import iter_in
+
+LOOKUP_CHUNK_SIZE = 500
+
+# --- CALCULATIONS (Same Supplier Math as hooks/use-cfo-data.ts) ---
+def calculate_order_cogs(revenue):
+    """Estimated COGS of one order, used only for orders with no FIFO ledger entries."""
+    if revenue <= 0:
+        return 0
+    # Supplier Math: Handling ($0.48) + Avg Freight ($3.43 + Weight Fee)
+    product_cost = revenue * 0.15
+    handling = 0.48
+    shipping = 3.43 + (0.15 * 20.40)
+    return product_cost + handling + shipping
+
+class CostLookup:
+    """Real per-order COGS from `transaction_cost_ledger`, looked up in bulk.
+
+    Reads the `transaction_costs` view (one summed row per transaction, see
+    schema.sql) with chunked, paged in() queries on the indexed transaction_id.
+    If the view is missing it sums the raw ledger rows in Python instead.
+    """
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.use_view = True
+
+    def _fetch_view(self, chunk):
+        rows = iter_in(self.supabase, "transaction_costs", "transaction_id, cogs", "transaction_id", chunk)
+        return {str(row["transaction_id"]): float(row["cogs"] or 0) for row in rows}
+
+    def _fetch_ledger(self, chunk):
+        # Several ledger rows per order: iter_in pages past the 1000-row response cap
+        rows = iter_in(self.supabase, "transaction_cost_ledger", "transaction_id, qty_deducted, cost_per_unit_at_time",
+                       "transaction_id", chunk)
+        costs = defaultdict(float)
+        for row in rows:
+            costs[str(row["transaction_id"])] += float(row["qty_deducted"] or 0) * float(row["cost_per_unit_at_time"] or 0)
+        return dict(costs)
+
+    def costs_for(self, transaction_ids):
+        """Returns {transaction_id: cogs} for the IDs that have ledger rows."""
+        ids = sorted({str(t) for t in transaction_ids if t is not None})
+        costs = {}
+        for i in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+            chunk = ids[i:i + LOOKUP_CHUNK_SIZE]
+            if self.use_view:
+                try:
+                    costs.update(self._fetch_view(chunk))
+                    continue
+                except Exception as e:
+                    print(f"   ℹ️ transaction_costs view unavailable ({e}), summing ledger rows instead.")
+                    self.use_view = False
+            costs.update(self._fetch_ledger(chunk))
+        return costs
+
+    def attach_costs(self, transactions, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Streams transactions back with a `cogs` key (None = no ledger entries).
+
+        Works chunk by chunk, so memory stays bounded by `chunk_size`.
+        """
+        chunk = []
+        for t in transactions:
+            chunk.append(t)
+            if len(chunk) >= chunk_size:
+                yield from self._join(chunk)
+                chunk = []
+        if chunk:
+            yield from self._join(chunk)
+
+    def _join(self, chunk):
+        costs = self.costs_for(t.get("transaction_id") for t in chunk)
+        for t in chunk:
+            t["cogs"] = costs.get(str(t.get("transaction_id")))
+            yield t
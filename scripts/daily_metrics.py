@@ -0,0 +1,172 @@
+import argparse
+from datetime import date, timedelta
+from aggregates import iter_rows
+from cost_lookup import CostLookup, calculate_order_cogs
+import attribution
+
+# Rollup keys: date x revenue_type x campaign_id.
+# Ad spend rows use revenue_type "Ad Spend"; the day total uses "ALL"/"ALL".
+ALL = "ALL"
+AD_SPEND = "Ad Spend"
+REFUND_EVENTS = ["refunded", "cancelled", "chargeback"]
+WRITE_CHUNK_SIZE = 500
+
+def empty_row(day, revenue_type, campaign_id):
+    return {
+        "date": day.isoformat(),
+        "revenue_type": revenue_type,
+        "campaign_id": campaign_id,
+        "revenue": 0.0,
+        "order_count": 0,
+        "refund_count": 0,
+        "refund_amount": 0.0,
+        "ad_spend": 0.0,
+        "cogs": 0.0,
+        "profit": 0.0,
+        "roas": None
+    }
+
+def build_rows(transactions, ads, days=()):
+    """Folds raw transaction and ad rows into daily_metrics rows (one pass each).
+
+    Transactions with a `cogs` key (CostLookup.attach_costs) use their real
+    FIFO cost; the others are costed with the supplier estimate per order,
+    so the revenue_type x campaign rows add up to the day's ALL row.
+    Every day in `days` gets an ALL row, even with no activity, so readers
+    can tell a quiet day from one the rollup has not covered. Each
+    "Ad Spend" row's ROAS is the revenue of the same campaign_id that day.
+    """
+    rows = {}
+    campaign_revenue = {}
+
+    def row_for(day, revenue_type, campaign_id):
+        key = (day, revenue_type, campaign_id)
+        if key not in rows:
+            rows[key] = empty_row(day, revenue_type, campaign_id)
+        return rows[key]
+
+    for t in transactions:
+        day = date.fromisoformat(t["date"][:10])
+        amount = float(t.get("total_amount") or 0)
+        cogs = t["cogs"] if t.get("cogs") is not None else calculate_order_cogs(amount)
+        for row in (row_for(day, t.get("revenue_type") or "Other", str(t.get("campaign_id") or "")), row_for(day, ALL, ALL)):
+            row["revenue"] += amount
+            if t.get("event_type") in REFUND_EVENTS:
+                row["refund_count"] += 1
+                row["refund_amount"] += amount
+            else:
+                row["order_count"] += 1
+            row["cogs"] += cogs
+        campaign_key = (day.isoformat(), str(t.get("campaign_id") or ""))
+        campaign_revenue[campaign_key] = campaign_revenue.get(campaign_key, 0.0) + amount
+
+    for a in ads:
+        day = date.fromisoformat(a["date"][:10])
+        spend = float(a.get("spend") or 0)
+        row_for(day, AD_SPEND, str(a.get("campaign_id") or ""))["ad_spend"] += spend
+        row_for(day, ALL, ALL)["ad_spend"] += spend
+
+    for day in days:
+        row_for(day, ALL, ALL)
+
+    for row in rows.values():
+        row["profit"] = round(row["revenue"] - row["cogs"] - row["ad_spend"], 2)
+        row["cogs"] = round(row["cogs"], 2)
+        row["revenue"] = round(row["revenue"], 2)
+        row["refund_amount"] = round(row["refund_amount"], 2)
+        row["ad_spend"] = round(row["ad_spend"], 2)
+        if row["ad_spend"] > 0:
+            revenue = row["revenue"]
+            if row["revenue_type"] == AD_SPEND:
+                revenue = campaign_revenue.get((row["date"], row["campaign_id"]), 0.0)
+            row["roas"] = round(revenue / row["ad_spend"], 4)
+
+    return list(rows.values())
+
+def day_ranges(days):
+    """Groups a set of days into contiguous (start, end) ranges."""
+    ranges = []
+    for day in sorted(set(days)):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(start, end) for start, end in ranges]
+
+def refresh_days(supabase, days):
+    """Recomputes daily_metrics for only the given days from the fact tables."""
+    days = sorted(set(days))
+    if not days:
+        return 0
+
+    written = 0
+    campaign_map = attribution.load_campaign_map(supabase)
+    for start, end in day_ranges(days):
+        # campaign_attribution is built from the same rows in the same pass
+        index = attribution.AttributionIndex(campaign_map)
+        transactions = iter_rows(supabase, "transactions", "transaction_id, " + attribution.TRANSACTION_COLUMNS + ", revenue_type", start, end)
+        transactions = CostLookup(supabase).attach_costs(index.tap(transactions, index.add_transaction))
+        ads = index.tap(iter_rows(supabase, "facebook_ads", attribution.AD_COLUMNS, start, end), index.add_ad)
+        range_days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        rows = build_rows(transactions, ads, range_days)
+
+        day_strings = [day.isoformat() for day in range_days]
+        supabase.table("daily_metrics").delete().in_("date", day_strings).execute()
+        for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+            supabase.table("daily_metrics").insert(rows[i:i + WRITE_CHUNK_SIZE]).execute()
+        written += len(rows)
+
+        try:
+            attribution.write_rows(supabase, start, end, index.build_rows())
+        except Exception as e:
+            print(f"⚠️ campaign_attribution refresh failed for {start} → {end}: {e}")
+
+    print(f"📊 daily_metrics refreshed for {len(days)} day(s) ({written} rows).")
+    return written
+
+def safe_refresh_days(supabase, days):
+    """refresh_days for the sync scripts: a rollup failure never fails the sync."""
+    try:
+        return refresh_days(supabase, days)
+    except Exception as e:
+        print(f"⚠️ daily_metrics refresh failed: {e}")
+        return 0
+
+def first_fact_date(supabase):
+    res = supabase.table("transactions").select("date").order("date").limit(1).execute()
+    return date.fromisoformat(res.data[0]["date"][:10]) if res.data else None
+
+def rebuild(supabase, start_date=None, end_date=None, window_days=31):
+    """Rebuilds daily_metrics from scratch, a month-sized window at a time."""
+    start_date = start_date or first_fact_date(supabase)
+    end_date = end_date or date.today()
+    if not start_date:
+        print("ℹ️ No transactions found, nothing to rebuild.")
+        return
+
+    print(f"🔁 Rebuilding daily_metrics from {start_date} to {end_date}...")
+    current = start_date
+    while current <= end_date:
+        window_end = min(current + timedelta(days=window_days - 1), end_date)
+        refresh_days(supabase, [current + timedelta(days=i) for i in range((window_end - current).days + 1)])
+        current = window_end + timedelta(days=1)
+    print("✅ daily_metrics rebuild complete.")
+
+if __name__ == "__main__":
+    from clients import get_supabase
+
+    parser = argparse.ArgumentParser(description="Maintain the daily_metrics rollup table.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollup from the fact tables.")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD). Defaults to the oldest transaction.")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD). Defaults to today.")
+    args = parser.parse_args()
+
+    client = get_supabase()
+
+    if args.rebuild:
+        rebuild(client, args.start, args.end)
+    else:
+        # Refresh a single day or range (defaults to today)
+        start = args.start or date.today()
+        end = args.end or start
+        refresh_days(client, [start + timedelta(days=i) for i in range((end - start).days + 1)])
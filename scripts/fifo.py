@@ -0,0 +1,187 @@
+from collections import defaultdict
+from aggregates import iter_in
+import local_store
+
+LEDGER_CHUNK_SIZE = 500
+
+def _chunked(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+class FifoEngine:
+    """Set-based FIFO cost allocation for a whole sync run.
+
+    Active batches are loaded once per base_product and every line item of the
+    run is allocated in memory, oldest batch first. The ledger rows and batch
+    updates are then written as bulk calls. Transactions that already have
+    ledger rows are skipped, so re-running a sync never deducts twice.
+
+    The client-side path is idempotent but not atomic: each batch is updated
+    only if its remaining_qty is still what this run loaded, so a concurrent
+    run makes this one back off instead of overwriting its decrements. Set
+    `use_rpc=True` to hand the allocation to the `fifo_allocate` Postgres
+    function (schema.sql), which locks the batches and runs in one
+    transaction on the server.
+    """
+
+    def __init__(self, supabase, product_cache, use_rpc=False):
+        self.supabase = supabase
+        self.product_cache = product_cache
+        self.use_rpc = use_rpc
+        self.batches = {}
+        self.loaded_qty = {}
+        self.touched_batches = {}
+        self.ledger_rows = []
+        self.shortfalls = []
+
+    def processed_transactions(self, transaction_ids):
+        """Returns the transaction IDs that already have cost ledger rows.
+
+        Each order has a ledger row per item per batch, so the lookup is paged
+        (iter_in): a truncated answer would deduct the missing orders twice.
+        """
+        rows = iter_in(self.supabase, "transaction_cost_ledger", "transaction_id", "transaction_id",
+                       sorted(transaction_ids), LEDGER_CHUNK_SIZE)
+        return {str(row["transaction_id"]) for row in rows}
+
+    def load_batches(self, base_products):
+        """Loads active batches for all base products (paged), FIFO ordered."""
+        self.batches = defaultdict(list)
+        self.loaded_qty = {}
+        if not base_products:
+            return self.batches
+        rows = iter_in(self.supabase, "inventory_batches", "*", "base_product", sorted(base_products),
+                       eq={"status": "active"})
+        for batch in sorted(rows, key=lambda b: b["batch_id"]):
+            self.batches[batch["base_product"]].append(dict(batch))
+            self.loaded_qty[batch["batch_id"]] = batch["remaining_qty"]
+        return self.batches
+
+    def line_items(self, orders):
+        """Flattens orders into line items: (transaction_id, product_id, product_name, qty)."""
+        for order in orders:
+            for item in order["items"]:
+                yield str(order["transaction_id"]), item["external_product_id"], item["product_name"], item["qty"]
+
+    def allocate(self, items):
+        """Deducts each line item from the in-memory batches, oldest first."""
+        for transaction_id, product_id, product_name, qty_sold in items:
+            mapping = self.product_cache.get(product_id)
+            if not mapping:
+                print(f"   ⚠️ Inventory Skip: Product ID {product_id} is not mapped to a base product yet.")
+                continue
+
+            base_product = mapping.get("base_product")
+            units_per_variant = mapping.get("units_per_variant") or 1
+            if not base_product:
+                print(f"   ⚠️ Inventory Skip: No base product defined for '{mapping['offer_name']}'.")
+                continue
+
+            remaining_needed = qty_sold * units_per_variant
+            for batch in self.batches.get(base_product, []):
+                if remaining_needed <= 0:
+                    break
+                if batch["remaining_qty"] <= 0:
+                    continue
+
+                take = min(batch["remaining_qty"], remaining_needed)
+                batch["remaining_qty"] -= take
+                batch["status"] = "active" if batch["remaining_qty"] > 0 else "depleted"
+                self.touched_batches[batch["batch_id"]] = batch
+
+                self.ledger_rows.append({
+                    "transaction_id": transaction_id,
+                    "product_name": product_name,
+                    "batch_id": batch["batch_id"],
+                    "qty_deducted": take,
+                    "cost_per_unit_at_time": batch["unit_cost"]
+                })
+                remaining_needed -= take
+
+            if remaining_needed > 0:
+                self.shortfalls.append((transaction_id, base_product, remaining_needed))
+                print(f"      ❌ OUT OF STOCK! Could not fulfill {remaining_needed} units of {base_product}.")
+
+    def set_batch(self, batch_id, expected_qty, remaining_qty):
+        """Sets a batch's remaining_qty if it still holds `expected_qty`. Returns False if it did not."""
+        res = self.supabase.table("inventory_batches") \
+            .update({"remaining_qty": remaining_qty, "status": "active" if remaining_qty > 0 else "depleted"}) \
+            .eq("batch_id", batch_id) \
+            .eq("remaining_qty", expected_qty) \
+            .execute()
+        return bool(res.data)
+
+    def release(self, claimed):
+        """Puts back the decrements of `claimed` batches (best effort)."""
+        for batch in claimed:
+            try:
+                self.set_batch(batch["batch_id"], batch["remaining_qty"], self.loaded_qty[batch["batch_id"]])
+            except Exception as e:
+                print(f"   ❌ Could not restore batch {batch['batch_id']} to {self.loaded_qty[batch['batch_id']]}: {e}")
+
+    def commit(self):
+        """Writes the batch decrements, then the ledger rows. Returns False if another run got there first.
+
+        Each batch is decremented only if it still holds what this run loaded.
+        If one was changed by a concurrent run, or the ledger insert fails, the
+        decrements already made are put back and no ledger rows are kept, so
+        the orders stay uncosted and the next run allocates them again.
+        """
+        claimed = []
+        for batch in self.touched_batches.values():
+            if not self.set_batch(batch["batch_id"], self.loaded_qty[batch["batch_id"]], batch["remaining_qty"]):
+                print(f"   ⚠️ Batch {batch['batch_id']} changed under this run (concurrent sync?), FIFO backed off.")
+                self.release(claimed)
+                return False
+            claimed.append(batch)
+
+        try:
+            for chunk in _chunked(self.ledger_rows, LEDGER_CHUNK_SIZE):
+                self.supabase.table("transaction_cost_ledger").insert(chunk).execute()
+        except Exception:
+            transaction_ids = sorted({row["transaction_id"] for row in self.ledger_rows})
+            self.release(claimed)
+            try:
+                for chunk in _chunked(transaction_ids, LEDGER_CHUNK_SIZE):
+                    self.supabase.table("transaction_cost_ledger").delete().in_("transaction_id", chunk).execute()
+            except Exception as e:
+                print(f"   ❌ Could not remove partial ledger rows: {e}")
+            raise
+
+        local_store.mirror("inventory_batches", claimed)
+        return True
+
+    def run(self, orders):
+        """Allocates costs for every not-yet-costed order in the run."""
+        self.touched_batches = {}
+        self.ledger_rows = []
+        self.shortfalls = []
+
+        items = list(self.line_items(orders))
+        if not items:
+            return 0
+
+        if self.use_rpc:
+            payload = [{"transaction_id": t, "product_id": str(p), "product_name": n, "qty": q} for t, p, n, q in items]
+            res = self.supabase.rpc("fifo_allocate", {"p_items": payload}).execute()
+            print(f"📦 FIFO (server): wrote {res.data} ledger rows.")
+            return res.data
+
+        processed = self.processed_transactions({t for t, _, _, _ in items})
+        if processed:
+            print(f"   ⏭️ Skipping {len(processed)} transaction(s) already in the cost ledger.")
+        items = [item for item in items if item[0] not in processed]
+
+        base_products = set()
+        for _, product_id, _, _ in items:
+            base_product = self.product_cache.base_product(product_id)
+            if base_product:
+                base_products.add(base_product)
+
+        self.load_batches(base_products)
+        self.allocate(items)
+        if not self.commit():
+            return 0
+
+        print(f"📦 FIFO: {len(self.ledger_rows)} ledger rows across {len(self.touched_batches)} batch(es).")
+        return len(self.ledger_rows)
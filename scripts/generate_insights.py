@@ -1,71 +1,135 @@
-import os
 import json
 from datetime import date, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from clients import supabase, has_supabase_credentials
+from aggregates import daily_revenue_totals
+from local_store import get_store
+import anomalies
+import instrumentation
 
-# --- 🔐 CREDENTIALS & SETUP ---
-script_dir = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(os.path.join(script_dir, '..', '.env.local'))
+# --- 🔐 CREDENTIALS & SETUP (config.py reads .env.local, clients.py connects on first use) ---
 
-url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key = os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-
-if not url or not key:
-    print("❌ ERROR: Supabase credentials missing from .env.local")
-    exit(1)
-
-supabase: Client = create_client(url, key)
+# Anomaly insights written per day after the briefing, most unusual first (see anomalies.py)
+MAX_ANOMALIES = 7
 
 def generate_insights():
-    print("🧠 Starting AI Analysis on 2,000+ records...")
+    print("🧠 Starting AI Analysis...")
     
     today = date.today()
     today_str = today.isoformat() 
     seven_days_ago = today - timedelta(days=7)
     fourteen_days_ago = today - timedelta(days=14)
 
-    all_data = []
-    start_row = 0
-    while True:
-        res = supabase.table("transactions") \
-            .select("total_amount, date, revenue_type") \
-            .gte("date", fourteen_days_ago.isoformat()) \
-            .range(start_row, start_row + 999) \
-            .execute()
-        
-        if not res.data:
-            break
-        all_data.extend(res.data)
-        start_row += 1000
-    
-    print(f"📈 Analyzed {len(all_data)} recent transactions.")
+    # Daily totals per revenue_type, from the local store or aggregated server-side when possible
+    with instrumentation.span("daily totals"):
+        totals = daily_revenue_totals(supabase, fourteen_days_ago, store=get_store())
+    instrumentation.add("daily totals", rows=len(totals))
 
-    # CALCULATIONS
-    this_week_total = sum(item['total_amount'] for item in all_data if date.fromisoformat(item['date'][:10]) >= seven_days_ago)
-    last_week_total = sum(item['total_amount'] for item in all_data if date.fromisoformat(item['date'][:10]) < seven_days_ago)
-    mrr_revenue = sum(item['total_amount'] for item in all_data if item.get('revenue_type') == 'MRR Revenue')
+    # CALCULATIONS (one pass over the daily totals)
+    this_week_total = 0.0
+    last_week_total = 0.0
+    mrr_revenue = 0.0
+    order_count = 0
+    for (day, revenue_type), bucket in totals.items():
+        if day >= seven_days_ago:
+            this_week_total += bucket['total_amount']
+        else:
+            last_week_total += bucket['total_amount']
+        if revenue_type == 'MRR Revenue':
+            mrr_revenue += bucket['total_amount']
+        order_count += bucket['order_count']
     growth = ((this_week_total - last_week_total) / last_week_total * 100) if last_week_total > 0 else 0
 
-    # --- ONE MASTER INSIGHT (To avoid Primary Key duplicate error) ---
-    master_insight = {
-        "date": today_str,
+    print(f"📈 Analyzed {order_count} recent transactions across {len(totals)} daily totals.")
+
+    # --- 🚨 ANOMALIES against the rolling baselines (only days since the last run are read) ---
+    yesterday = today - timedelta(days=1)
+    anomaly_insights, roas_7d = [], None
+    try:
+        with instrumentation.span("baselines"):
+            baselines = anomalies.load_baselines(supabase)
+            start = min(anomalies.unfolded_start(baselines, yesterday), yesterday - timedelta(days=max(anomalies.WINDOWS) - 1))
+            names = {}
+            series = anomalies.daily_series(supabase, start, yesterday, names)
+            # Judge yesterday before it becomes part of its own baseline
+            found = anomalies.detect(series, baselines, yesterday)
+            changed = anomalies.fold_days(baselines, series, yesterday)
+            if changed:
+                supabase.table("insight_baselines").upsert(changed, on_conflict="metric, segment, dow").execute()
+            # Paused campaigns (and the old name-keyed segments) age out
+            supabase.table("insight_baselines").delete().lt("last_date", anomalies.stale_before(yesterday).isoformat()).execute()
+        instrumentation.add("baselines", rows=len(changed))
+        anomaly_insights = [anomalies.to_insight(a, names) for a in found[:MAX_ANOMALIES]]
+        week = [d for d in series.get(("spend", "ALL"), {}) if d > yesterday - timedelta(days=7)]
+        spend_7d = sum(series[("spend", "ALL")][d] for d in week)
+        if spend_7d > 0:
+            roas_7d = sum(series.get(("revenue", "ALL"), {}).get(d, 0.0) for d in week) / spend_7d
+        print(f"🚨 {len(found)} anomaly(ies) across {len(series)} series; {len(changed)} baseline(s) updated.")
+    except Exception as e:
+        print(f"⚠️ Anomaly detection skipped: {e}")
+
+    # --- 📦 STOCK (inventory_forecast, see inventory_forecast.py) ---
+    stock_insights = []
+    try:
+        res = supabase.table("inventory_forecast").select("base_product, depletion_date, days_of_cover").eq("reorder", True).execute()
+        for row in res.data or []:
+            stock_insights.append({
+                "title": f"Reorder {row['base_product']}",
+                "content": f"{row['base_product']} runs out around {row['depletion_date']} "
+                           f"({float(row['days_of_cover'] or 0):.0f} days of cover at the current burn rate).",
+                "status": "critical" if float(row["days_of_cover"] or 0) < 7 else "warning",
+                "type": "stock"
+            })
+    except Exception as e:
+        print(f"   ℹ️ inventory_forecast unavailable ({e}).")
+
+    # --- 📝 RANKED INSIGHTS: the briefing first, then the most unusual findings ---
+    briefing = f"Revenue: ${this_week_total:,.0f} ({growth:+.1f}% vs last week). MRR contributed ${mrr_revenue:,.0f}."
+    if roas_7d is not None:
+        briefing += f" Blended ROAS over the last 7 days: {roas_7d:.2f}x."
+    if anomaly_insights:
+        briefing += f" {len(anomaly_insights)} metric(s) moved outside their usual range yesterday."
+    insights = [{
         "title": "Daily Executive Briefing",
-        "content": f"Revenue: ${this_week_total:,.0f} ({growth:+.1f}% vs last week). MRR contributed ${mrr_revenue:,.0f}. Freight costs are stable at $20.40/kg based on current scale.",
+        "content": briefing,
         "status": "success" if growth > 0 else "warning",
         "type": "performance"
-    }
+    }] + anomaly_insights + stock_insights
+    rows = [{"date": today_str, "rank": rank, **insight} for rank, insight in enumerate(insights, start=1)]
 
+    # The briefing goes out on its own, so a failure on the ranked rows cannot take it down too
     try:
-        print(f"🧹 Clearing old data for {today_str}...")
-        supabase.table("ai_daily_insights").delete().eq("date", today_str).execute()
-        
-        print(f"📝 Uploading briefing for {today_str}...")
-        supabase.table("ai_daily_insights").insert(master_insight).execute()
-        
+        with instrumentation.span("supabase write", rows=1):
+            print(f"📝 Upserting the briefing for {today_str}...")
+            supabase.table("ai_daily_insights").upsert(rows[:1], on_conflict="date, rank").execute()
         print("✅ SUCCESS: AI Daily Briefing updated.")
     except Exception as e:
-        print(f"❌ DATABASE ERROR: {e}")
+        # No (date, rank) key yet: the schema.sql section 13 migration has not been run
+        print(f"⚠️ Ranked insights need the schema.sql section 13 migration ({e}), writing the briefing alone...")
+        try:
+            supabase.table("ai_daily_insights").delete().eq("date", today_str).execute()
+            supabase.table("ai_daily_insights").insert({"date": today_str, **insights[0]}).execute()
+            print("✅ SUCCESS: AI Daily Briefing updated.")
+        except Exception as e:
+            print(f"❌ DATABASE ERROR: {e}")
+        return
+
+    try:
+        with instrumentation.span("supabase write", rows=len(rows) - 1):
+            if len(rows) > 1:
+                print(f"📝 Upserting {len(rows) - 1} ranked insight(s)...")
+                supabase.table("ai_daily_insights").upsert(rows[1:], on_conflict="date, rank").execute()
+            # An earlier run today may have written more ranks than this one
+            supabase.table("ai_daily_insights").delete().eq("date", today_str).gt("rank", len(rows)).execute()
+    except Exception as e:
+        print(f"❌ DATABASE ERROR on the ranked insights: {e}")
 
 if __name__ == "__main__":
-    generate_insights()
\ No newline at end of file
+    if not has_supabase_credentials():
+        print("❌ ERROR: Supabase credentials missing from .env.local")
+        exit(1)
+
+    metrics = instrumentation.start_run("generate_insights")
+    try:
+        generate_insights()
+    finally:
+        metrics.finish(supabase)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import random
+import threading
+from urllib.parse import urlparse
+import instrumentation
+
+# --- ⚙️ CONFIGURATION ---
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 5))
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 60))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Graph API throttling codes (app, user, page, ads account and business use case limits)
+FB_THROTTLE_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+# Start slowing down above this share of the Graph API quota, pause near the cap
+FB_SLOWDOWN_PCT = 75
+FB_PAUSE_PCT = 95
+
+_sessions = {}
+_pacers = {}
+_lock = threading.Lock()
+
+class Pacer:
+    """Per-host spacing between requests, widened or relaxed from usage headers."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.next_allowed = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_allowed)
+            self.next_allowed = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next_allowed = max(self.next_allowed, time.monotonic() + seconds)
+
+    def adapt(self, usage_pct, regain_seconds):
+        if regain_seconds:
+            print(f"   ⏳ Graph API quota exhausted, pausing {regain_seconds:.0f}s...")
+            self.pause(regain_seconds)
+        if usage_pct >= FB_PAUSE_PCT:
+            self.delay = min(BACKOFF_CAP, max(self.delay * 2, 5.0))
+        elif usage_pct >= FB_SLOWDOWN_PCT:
+            self.delay = min(BACKOFF_CAP, max(self.delay * 1.5, 0.5))
+        else:
+            # Plenty of headroom: relax back towards full speed
+            self.delay = self.delay / 2 if self.delay > 0.05 else 0.0
+
+def host_key(url):
+    parts = urlparse(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def get_session(url):
+    """Returns the shared keep-alive session for the URL's host."""
+    key = host_key(url)
+    with _lock:
+        if key not in _sessions:
+            # Deferred so importing the sync modules stays cheap
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+            _pacers[key] = Pacer()
+        return _sessions[key], _pacers[key]
+
+def parse_usage_headers(headers):
+    """Reads Facebook's usage headers. Returns (highest usage %, seconds until access regained)."""
+    usage_pct = 0.0
+    regain_seconds = 0.0
+
+    def read(name):
+        raw = headers.get(name)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    app_usage = read("x-app-usage")
+    if isinstance(app_usage, dict):
+        usage_pct = max([usage_pct] + [float(v) for v in app_usage.values() if isinstance(v, (int, float))])
+
+    account_usage = read("x-ad-account-usage")
+    if isinstance(account_usage, dict):
+        usage_pct = max(usage_pct, float(account_usage.get("acc_id_util_pct") or 0))
+
+    business_usage = read("x-business-use-case-usage")
+    if isinstance(business_usage, dict):
+        for entries in business_usage.values():
+            for entry in entries if isinstance(entries, list) else []:
+                for field in ["call_count", "total_cputime", "total_time"]:
+                    usage_pct = max(usage_pct, float(entry.get(field) or 0))
+                # Reported in minutes
+                regain_seconds = max(regain_seconds, float(entry.get("estimated_time_to_regain_access") or 0) * 60)
+
+    return usage_pct, regain_seconds
+
+def is_throttle_error(response):
+    """True for Graph API errors that mean 'slow down' (they arrive as HTTP 400/403)."""
+    if response.status_code not in (400, 403):
+        return False
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        return False
+    return error.get("code") in FB_THROTTLE_CODES or bool(error.get("is_transient"))
+
+def backoff_seconds(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(BACKOFF_CAP, float(retry_after))
+        except ValueError:
+            pass
+    # Full jitter exponential backoff
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+def get(url, params=None, timeout=TIMEOUT, max_retries=MAX_RETRIES):
+    """GET through the pooled session for the host, with retries on 5xx/429/throttling.
+
+    Returns the final response (callers still inspect error payloads). Raises
+    the last network error if every attempt failed to connect.
+    """
+    import requests
+
+    session, pacer = get_session(url)
+    service = instrumentation.service_name(url)
+
+    for attempt in range(max_retries + 1):
+        pacer.wait()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                instrumentation.record_request(service, retries=attempt, error=True)
+                raise
+            delay = backoff_seconds(attempt)
+            print(f"   🔁 {type(e).__name__} on {host_key(url)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+            time.sleep(delay)
+            continue
+
+        usage_pct, regain_seconds = parse_usage_headers(response.headers)
+        if usage_pct or regain_seconds:
+            pacer.adapt(usage_pct, regain_seconds)
+
+        retryable = response.status_code in RETRY_STATUSES or is_throttle_error(response)
+        if not retryable or attempt == max_retries:
+            instrumentation.record_request(service, bytes_in=len(response.content), retries=attempt,
+                                           error=response.status_code >= 400)
+            return response
+
+        # Push back every thread talking to this host, not just this one
+        delay = backoff_seconds(attempt, response.headers.get("Retry-After"))
+        print(f"   🔁 HTTP {response.status_code} from {host_key(url)}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+        pacer.pause(delay)
+
+    return response
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# --- ⚙️ CONFIGURATION ---
+# One JSON summary per run lands in SYNC_METRICS_DIR; SYNC_METRICS_TABLE=true also
+# appends it to the `sync_run_metrics` table (see schema.sql).
+METRICS_DIR = os.environ.get("SYNC_METRICS_DIR", "sync_metrics")
+# Summaries kept per job, oldest deleted first (288 = a day of 5-minute daemon runs; 0 keeps all)
+METRICS_KEEP = int(os.environ.get("SYNC_METRICS_KEEP", 288))
+METRICS_TABLE = os.environ.get("SYNC_METRICS_TABLE", "").lower() in ["true", "1"]
+
+# Friendly names for the hosts we talk to (anything else is reported by host)
+SERVICE_NAMES = {
+    "api.konnektive.com": "konnektive",
+    "graph.facebook.com": "graph",
+}
+
+def service_name(url):
+    host = urlparse(url).netloc
+    if host.endswith(".supabase.co"):
+        return "supabase"
+    return SERVICE_NAMES.get(host, host)
+
+class RunMetrics:
+    """Timings and counters for one script run, safe to update from worker threads.
+
+    Stages hold span timings (`seconds`, `calls`) plus any counters the script
+    adds (rows, failed chunks...). Services hold the HTTP side: requests,
+    bytes in/out, retries and errors per host. Span seconds are summed across
+    threads, so a stage fetched by 8 workers can exceed the wall time.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.stages = defaultdict(lambda: defaultdict(float))
+        self.services = defaultdict(lambda: defaultdict(float))
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **counts):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, seconds=time.perf_counter() - started, calls=1, **counts)
+
+    def add(self, stage, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.stages[stage][name] += value
+
+    def record_request(self, service, bytes_in=0, bytes_out=0, retries=0, error=False):
+        with self.lock:
+            counters = self.services[service]
+            counters["requests"] += 1
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+            counters["retries"] += retries
+            counters["errors"] += 1 if error else 0
+
+    def merge(self, summary):
+        """Folds another run's summary (e.g. from a worker process) into this one."""
+        with self.lock:
+            for stage, counters in summary.get("stages", {}).items():
+                for name, value in counters.items():
+                    self.stages[stage][name] += value
+            for service, counters in summary.get("services", {}).items():
+                for name, value in counters.items():
+                    self.services[service][name] += value
+
+    def summary(self):
+        def clean(counters):
+            return {k: round(v, 3) if k == "seconds" else int(v) if float(v).is_integer() else v for k, v in counters.items()}
+
+        with self.lock:
+            return {
+                "job": self.job,
+                "started_at": self.started_at.isoformat(),
+                "seconds": round(time.perf_counter() - self.started, 3),
+                "stages": {stage: clean(counters) for stage, counters in self.stages.items()},
+                "services": {service: clean(counters) for service, counters in self.services.items()}
+            }
+
+    def write_json(self, summary):
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{self.job}-{self.started_at.strftime('%Y%m%dT%H%M%SZ')}.json")
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        prune_metrics_files(self.job)
+        return path
+
+    def finish(self, supabase=None):
+        """Prints the stage table and writes the JSON summary (and the table row if enabled)."""
+        summary = self.summary()
+        print(f"\n⏱️ RUN METRICS: {self.job} took {summary['seconds']:.1f}s")
+        for stage, counters in sorted(summary["stages"].items(), key=lambda s: -s[1].get("seconds", 0)):
+            extra = "  ".join(f"{k}={v}" for k, v in counters.items() if k not in ("seconds", "calls"))
+            print(f"   {stage:<28} {counters.get('seconds', 0):>8.2f}s  x{counters.get('calls', 0):<5} {extra}")
+        for service, counters in sorted(summary["services"].items()):
+            print(f"   🌐 {service:<25} {counters['requests']:>6} requests  {counters['bytes_in'] / 1024:>9.0f} KB in  "
+                  f"{counters['bytes_out'] / 1024:>7.0f} KB out  {counters['retries']} retries  {counters['errors']} errors")
+
+        try:
+            print(f"   📝 Metrics written to {self.write_json(summary)}")
+        except OSError as e:
+            print(f"   ⚠️ Could not write metrics file: {e}")
+
+        if METRICS_TABLE and supabase is not None:
+            try:
+                supabase.table("sync_run_metrics").insert({
+                    "job": self.job,
+                    "started_at": summary["started_at"],
+                    "seconds": summary["seconds"],
+                    "summary": summary
+                }).execute()
+            except Exception as e:
+                print(f"   ⚠️ Could not store run metrics: {e}")
+        return summary
+
+def prune_metrics_files(job, keep=None):
+    """Deletes all but the newest `keep` summaries of `job` (names sort by start time)."""
+    keep = METRICS_KEEP if keep is None else keep
+    if keep <= 0:
+        return
+    prefix = f"{job}-"
+    # <job>-YYYYMMDDTHHMMSSZ.json, so "sales" never matches "sales_backfill" files
+    names = sorted(f for f in os.listdir(METRICS_DIR)
+                   if f.startswith(prefix) and f.endswith("Z.json") and len(f) == len(prefix) + len("YYYYMMDDTHHMMSSZ.json"))
+    for name in names[:-keep]:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+# --- 🧵 CURRENT RUN (module-level so http_client and helpers can report into it) ---
+_current = RunMetrics("unnamed")
+
+def start_run(job):
+    global _current
+    _current = RunMetrics(job)
+    return _current
+
+def current():
+    return _current
+
+def span(stage, **counts):
+    return _current.span(stage, **counts)
+
+def add(stage, **counts):
+    _current.add(stage, **counts)
+
+def record_request(service, bytes_in=0, bytes_out=0, retries=0, error=False):
+    _current.record_request(service, bytes_in, bytes_out, retries, error)
+
+def instrument_supabase(client):
+    """Counts every PostgREST call made through `client` under the `supabase` service.
+
+    Hooks the underlying httpx session; clients without one are left as they are.
+    """
+    try:
+        session = client.postgrest.session
+        hooks = session.event_hooks
+    except Exception:
+        return client
+
+    def on_response(response):
+        try:
+            bytes_out = len(response.request.content or b"")
+        except Exception:
+            bytes_out = 0
+        record_request("supabase", bytes_in=int(response.headers.get("content-length") or 0),
+                       bytes_out=bytes_out, error=response.status_code >= 400)
+
+    hooks.setdefault("response", []).append(on_response)
+    session.event_hooks = hooks
+    return client
@@ -0,0 +1,176 @@
+import os
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from aggregates import iter_in, iter_rows
+from daily_metrics import day_ranges
+from order_transform import REFUND_EVENTS
+from product_map import ProductMapCache
+
+# --- ⚙️ CONFIGURATION ---
+# Days of usage averaged into the daily burn rate
+BURN_WINDOW_DAYS = int(os.environ.get("INVENTORY_BURN_DAYS", 28))
+# Supplier lead time plus a safety margin: reorder this many days before stock runs out
+LEAD_TIME_DAYS = int(os.environ.get("INVENTORY_LEAD_TIME_DAYS", 21))
+SAFETY_DAYS = int(os.environ.get("INVENTORY_SAFETY_DAYS", 7))
+LOOKUP_CHUNK_SIZE = 500
+WRITE_CHUNK_SIZE = 500
+
+def _chunked(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+# --- 📉 DAILY USAGE (inventory_daily_usage, one row per date x base_product) ---
+def batch_rows(supabase):
+    """Every inventory_batches row, depleted ones included, paged and in FIFO order."""
+    return list(iter_rows(supabase, "inventory_batches", "batch_id, base_product, remaining_qty, status", order_by="batch_id"))
+
+def batch_products(supabase):
+    """{batch_id: base_product} for every batch, depleted ones included."""
+    return {str(row["batch_id"]): row["base_product"] for row in batch_rows(supabase)}
+
+def usage_for_range(supabase, start, end, product_cache, batches):
+    """{(day, base_product): units} for start..end (inclusive).
+
+    Allocated orders count the units their ledger rows deducted. Orders FIFO
+    could not allocate (stock-outs, products mapped after the sale) count
+    their items' qty x units_per_variant, so demand still shows while a
+    product is out of stock. Refunded, cancelled and charged-back orders are
+    left out, so they do not inflate the burn rate.
+    """
+    usage = defaultdict(float)
+    day_of = {str(t["transaction_id"]): t["date"][:10]
+              for t in iter_rows(supabase, "transactions", "transaction_id, date, event_type", start, end)
+              if t.get("event_type") not in REFUND_EVENTS}
+    ids = sorted(day_of)
+
+    # Both lookups return several rows per order, so they are paged (iter_in)
+    allocated = set()
+    for row in iter_in(supabase, "transaction_cost_ledger", "transaction_id, batch_id, qty_deducted",
+                       "transaction_id", ids, LOOKUP_CHUNK_SIZE):
+        base_product = batches.get(str(row["batch_id"]))
+        if base_product:
+            transaction_id = str(row["transaction_id"])
+            allocated.add(transaction_id)
+            usage[(day_of[transaction_id], base_product)] += float(row["qty_deducted"] or 0)
+
+    unallocated = [t for t in ids if t not in allocated]
+    for row in iter_in(supabase, "transaction_items", "transaction_id, external_product_id, qty",
+                       "transaction_id", unallocated, LOOKUP_CHUNK_SIZE):
+        base_product = product_cache.base_product(row["external_product_id"])
+        if base_product:
+            units = (row.get("qty") or 1) * product_cache.units_per_variant(row["external_product_id"])
+            usage[(day_of[str(row["transaction_id"])], base_product)] += units
+    return usage
+
+def refresh_usage(supabase, days, product_cache=None):
+    """Recomputes inventory_daily_usage for only the given days."""
+    days = sorted(set(days))
+    if not days:
+        return 0
+    product_cache = product_cache or ProductMapCache(supabase)
+    batches = batch_products(supabase)
+
+    written = 0
+    for start, end in day_ranges(days):
+        usage = usage_for_range(supabase, start, end, product_cache, batches)
+        rows = [{"date": day, "base_product": base_product, "units": round(units, 2)}
+                for (day, base_product), units in usage.items()]
+        day_strings = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        supabase.table("inventory_daily_usage").delete().in_("date", day_strings).execute()
+        for chunk in _chunked(rows, WRITE_CHUNK_SIZE):
+            supabase.table("inventory_daily_usage").insert(chunk).execute()
+        written += len(rows)
+    return written
+
+# --- 🔮 FORECAST (inventory_forecast, one row per base_product) ---
+def build_forecast(usage_rows, batches, today, window_days=BURN_WINDOW_DAYS):
+    """Projects every active batch forward at the product's rolling burn rate.
+
+    `usage_rows` are inventory_daily_usage rows for the window, `batches` the
+    active inventory_batches rows. Batches drain in FIFO order (batch_id), so
+    each one's depletion date is the cumulative stock up to it / daily burn.
+    """
+    burned = defaultdict(float)
+    for row in usage_rows:
+        burned[row["base_product"]] += float(row["units"] or 0)
+
+    stock = defaultdict(list)
+    for batch in sorted(batches, key=lambda b: b["batch_id"]):
+        if (batch.get("remaining_qty") or 0) > 0:
+            stock[batch["base_product"]].append(batch)
+
+    computed_at = datetime.now(timezone.utc).isoformat()
+    forecast = []
+    for base_product in sorted(set(burned) | set(stock)):
+        daily_burn = burned[base_product] / window_days
+        on_hand = 0.0
+        projected = []
+        for batch in stock[base_product]:
+            on_hand += float(batch["remaining_qty"])
+            runs_out = today + timedelta(days=int(on_hand / daily_burn)) if daily_burn > 0 else None
+            projected.append({"batch_id": batch["batch_id"], "remaining_qty": batch["remaining_qty"],
+                              "depletion_date": runs_out.isoformat() if runs_out else None})
+
+        days_of_cover = on_hand / daily_burn if daily_burn > 0 else None
+        depletion_date = today + timedelta(days=int(days_of_cover)) if days_of_cover is not None else None
+        reorder_by = depletion_date - timedelta(days=LEAD_TIME_DAYS + SAFETY_DAYS) if depletion_date else None
+        forecast.append({
+            "base_product": base_product,
+            "on_hand": round(on_hand, 2),
+            "daily_burn": round(daily_burn, 3),
+            "days_of_cover": round(days_of_cover, 1) if days_of_cover is not None else None,
+            "depletion_date": depletion_date.isoformat() if depletion_date else None,
+            "reorder_by": reorder_by.isoformat() if reorder_by else None,
+            "reorder": reorder_by is not None and reorder_by <= today,
+            "batches": projected,
+            "computed_at": computed_at
+        })
+    return forecast
+
+def refresh_forecast(supabase, today=None):
+    """Rebuilds inventory_forecast from the usage window and the active batches.
+
+    Products with neither usage nor stock left are deleted, so the dashboard
+    never shows a dead forecast.
+    """
+    today = today or date.today()
+    window_start = today - timedelta(days=BURN_WINDOW_DAYS)
+    usage_rows = iter_rows(supabase, "inventory_daily_usage", "date, base_product, units", window_start, today - timedelta(days=1))
+    batches = [row for row in batch_rows(supabase) if row.get("status") == "active"]
+    forecast = build_forecast(usage_rows, batches, today)
+    computed_at = forecast[0]["computed_at"] if forecast else datetime.now(timezone.utc).isoformat()
+    if forecast:
+        supabase.table("inventory_forecast").upsert(forecast, on_conflict="base_product").execute()
+    # Every row this run wrote carries its computed_at; anything older was not rebuilt
+    supabase.table("inventory_forecast").delete().lt("computed_at", computed_at).execute()
+    return forecast
+
+def safe_refresh(supabase, touched_days, product_cache=None):
+    """Called by the sync scripts: a forecast failure never fails the sync."""
+    try:
+        refresh_usage(supabase, touched_days, product_cache)
+        forecast = refresh_forecast(supabase)
+        flagged = [f["base_product"] for f in forecast if f["reorder"]]
+        print(f"📦 Inventory forecast refreshed ({len(forecast)} products"
+              f"{', reorder: ' + ', '.join(flagged) if flagged else ''}).")
+    except Exception as e:
+        print(f"⚠️ Inventory forecast refresh failed: {e}")
+
+if __name__ == "__main__":
+    from clients import get_supabase
+
+    parser = argparse.ArgumentParser(description="Project inventory depletion and reorder dates per base_product.")
+    parser.add_argument("--rebuild", action="store_true", help=f"Recompute usage for the last {BURN_WINDOW_DAYS} days first.")
+    args = parser.parse_args()
+
+    client = get_supabase()
+    if args.rebuild:
+        today = date.today()
+        written = refresh_usage(client, [today - timedelta(days=i) for i in range(BURN_WINDOW_DAYS + 1)])
+        print(f"📉 inventory_daily_usage rebuilt ({written} rows).")
+
+    for row in refresh_forecast(client):
+        flag = "🚨 REORDER" if row["reorder"] else "✅"
+        print(f"{flag} {row['base_product']}: {row['on_hand']:g} on hand, {row['daily_burn']:g}/day, "
+              f"runs out {row['depletion_date'] or 'never'} (reorder by {row['reorder_by'] or '-'})")
@@ -0,0 +1,294 @@
+"""Optional local SQLite mirror of the synced fact tables.
+
+Set LOCAL_STORE_PATH (e.g. local_store.sqlite3) and the sync scripts copy every
+successful write into it. `python scripts/local_store.py --sync` pulls what the
+mirror has not seen from Supabase, incrementally by date watermark, and
+`--sql "..."` runs an ad-hoc query against it.
+
+Usage: python scripts/local_store.py [--sync [--start YYYY-MM-DD]] [--sql QUERY]
+"""
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+# --- ⚙️ CONFIGURATION ---
+LOCAL_STORE_PATH = os.environ.get("LOCAL_STORE_PATH")
+# A first --sync with no --start mirrors this many days
+LOCAL_STORE_DAYS = int(os.environ.get("LOCAL_STORE_DAYS", 120))
+# Days before the watermark re-pulled each --sync (late status changes, re-synced days)
+OVERLAP_DAYS = int(os.environ.get("LOCAL_STORE_OVERLAP_DAYS", 3))
+PULL_CHUNK_SIZE = 500
+
+# Mirrored tables: primary key and the columns kept locally
+TABLES = {
+    "transactions": (["transaction_id"], [
+        "transaction_id", "date", "total_amount", "status", "event_type", "revenue_type", "payment_status",
+        "campaign_id", "campaign_name", "traffic_source", "affiliate_id", "currency", "customer_state",
+        "customer_country", "content_hash"
+    ]),
+    "transaction_items": (None, [
+        "transaction_id", "product_name", "qty", "external_product_id", "campaign_product_id", "sku"
+    ]),
+    "facebook_ads": (["date", "campaign_id"], [
+        "date", "ad_account_id", "ad_account_name", "campaign_id", "campaign_name", "spend", "impressions",
+        "clicks", "cpc", "ctr"
+    ]),
+    # Everything else about a batch is kept in `data`, the store never needs to query it
+    "inventory_batches": (["batch_id"], ["batch_id", "base_product", "remaining_qty", "unit_cost", "status", "data"]),
+}
+# Tables pulled by date watermark; inventory_batches is small and reloaded whole
+DATED_TABLES = ["transactions", "facebook_ads"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+  transaction_id TEXT PRIMARY KEY, date TEXT, total_amount REAL, status TEXT, event_type TEXT,
+  revenue_type TEXT, payment_status TEXT, campaign_id TEXT, campaign_name TEXT, traffic_source TEXT,
+  affiliate_id TEXT, currency TEXT, customer_state TEXT, customer_country TEXT, content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_date_idx ON transactions (date);
+CREATE TABLE IF NOT EXISTS transaction_items (
+  transaction_id TEXT NOT NULL, product_name TEXT, qty INTEGER, external_product_id TEXT,
+  campaign_product_id TEXT, sku TEXT
+);
+CREATE INDEX IF NOT EXISTS transaction_items_transaction_idx ON transaction_items (transaction_id);
+CREATE TABLE IF NOT EXISTS facebook_ads (
+  date TEXT NOT NULL, ad_account_id TEXT, ad_account_name TEXT, campaign_id TEXT NOT NULL, campaign_name TEXT,
+  spend REAL, impressions INTEGER, clicks INTEGER, cpc REAL, ctr REAL,
+  PRIMARY KEY (date, campaign_id)
+);
+CREATE TABLE IF NOT EXISTS inventory_batches (
+  batch_id TEXT PRIMARY KEY, base_product TEXT, remaining_qty REAL, unit_cost REAL, status TEXT, data TEXT
+);
+CREATE TABLE IF NOT EXISTS store_coverage (
+  table_name TEXT PRIMARY KEY, covered_from TEXT NOT NULL, covered_through TEXT NOT NULL
+);
+"""
+
+def day_after(day):
+    return (day + timedelta(days=1)).isoformat()
+
+def to_sqlite(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return str(value)
+
+class LocalStore:
+    """SQLite file holding a copy of the fact tables for local analytics.
+
+    One connection shared by the sync threads (writes are serialised with a
+    lock) in WAL mode, so a notebook or a second script can read while a sync
+    writes. `store_coverage` records the date range each dated table holds in
+    full; analytics only answer from the store inside that range.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    # --- ✍️ WRITES ---
+    def _local_row(self, table, row):
+        _, columns = TABLES[table]
+        if table == "inventory_batches":
+            row = dict(row, data=json.dumps(row, default=str))
+        return tuple(to_sqlite(row.get(c)) for c in columns)
+
+    def upsert(self, table, rows):
+        """INSERT OR REPLACE on the table's primary key; rows may carry extra keys."""
+        _, columns = TABLES[table]
+        values = [self._local_row(table, row) for row in rows]
+        if not values:
+            return 0
+        sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self.lock, self.conn:
+            self.conn.executemany(sql, values)
+        return len(values)
+
+    def replace_items(self, transaction_ids, item_rows):
+        """Same delete-then-insert the sync does for `transaction_items`."""
+        _, columns = TABLES["transaction_items"]
+        ids = [(str(t),) for t in transaction_ids]
+        values = [self._local_row("transaction_items", row) for row in item_rows]
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM transaction_items WHERE transaction_id = ?", ids)
+            self.conn.executemany(
+                f"INSERT INTO transaction_items ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+
+    def replace_table(self, table, rows):
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM {table}")
+        return self.upsert(table, rows)
+
+    # --- 📏 COVERAGE ---
+    def coverage(self, table):
+        with self.lock:
+            row = self.conn.execute("SELECT covered_from, covered_through FROM store_coverage WHERE table_name = ?", (table,)).fetchone()
+        return (date.fromisoformat(row[0]), date.fromisoformat(row[1])) if row else None
+
+    def set_coverage(self, table, covered_from, covered_through):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO store_coverage VALUES (?, ?, ?)",
+                              (table, covered_from.isoformat(), covered_through.isoformat()))
+
+    def covers(self, table, start_date, end_date=None):
+        covered = self.coverage(table)
+        return bool(covered) and covered[0] <= start_date and (end_date or date.today()) <= covered[1]
+
+    # --- 🔎 READS ---
+    def query(self, sql, params=()):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def iter_rows(self, table, columns, start_date=None, end_date=None):
+        """Local twin of aggregates.iter_rows (same arguments, no paging)."""
+        where, params = [], []
+        if start_date:
+            where.append("date >= ?")
+            params.append(start_date.isoformat())
+        if end_date:
+            where.append("date < ?")
+            params.append(day_after(end_date))
+        sql = f"SELECT {columns} FROM {table}" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY date"
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+        while True:
+            # The lock is only held per batch, so a sync thread can write in between
+            with self.lock:
+                rows = cursor.fetchmany(PULL_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+    def daily_revenue_totals(self, start_date, end_date=None):
+        """Same shape as aggregates.daily_revenue_totals, grouped by SQLite."""
+        totals = defaultdict(lambda: {"total_amount": 0.0, "order_count": 0})
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT substr(date, 1, 10) AS day, revenue_type, SUM(total_amount), COUNT(*) FROM transactions "
+                "WHERE date >= ? AND date < ? GROUP BY 1, 2",
+                (start_date.isoformat(), day_after(end_date or date.today()))
+            ).fetchall()
+        for day, revenue_type, total_amount, order_count in rows:
+            totals[(date.fromisoformat(day), revenue_type)] = {"total_amount": float(total_amount or 0), "order_count": order_count}
+        return totals
+
+    # --- 🔄 INCREMENTAL PULL FROM SUPABASE ---
+    def pull_items(self, supabase, transaction_ids):
+        """Replaces the local items of `transaction_ids` with every item row Supabase has for them."""
+        from aggregates import iter_in
+
+        # iter_in pages, so an order's items are never cut off by the 1000-row cap
+        rows = list(iter_in(supabase, "transaction_items", ", ".join(TABLES["transaction_items"][1]),
+                            "transaction_id", transaction_ids, chunk_size=PULL_CHUNK_SIZE))
+        self.replace_items(transaction_ids, rows)
+
+    def sync(self, supabase, start_date=None, today=None):
+        """Pulls each dated table from its watermark (minus OVERLAP_DAYS) through today."""
+        from aggregates import iter_rows
+
+        today = today or date.today()
+        for table in DATED_TABLES:
+            covered = self.coverage(table)
+            if start_date and (not covered or start_date < covered[0]):
+                since = start_date
+            elif covered:
+                since = covered[1] - timedelta(days=OVERLAP_DAYS)
+            else:
+                since = today - timedelta(days=LOCAL_STORE_DAYS)
+
+            columns = ", ".join(TABLES[table][1])
+            pulled, batch = 0, []
+            for row in iter_rows(supabase, table, columns, since, today):
+                batch.append(row)
+                if len(batch) >= PULL_CHUNK_SIZE:
+                    pulled += self._store_pulled(supabase, table, batch)
+                    batch = []
+            pulled += self._store_pulled(supabase, table, batch)
+
+            self.set_coverage(table, min(since, covered[0]) if covered else since, today)
+            print(f"   🗄️ {table}: {pulled} row(s) pulled from {since}.")
+
+        batches = list(iter_rows(supabase, "inventory_batches", "*", order_by="batch_id"))
+        print(f"   🗄️ inventory_batches: {self.replace_table('inventory_batches', batches)} row(s) reloaded.")
+
+    def _store_pulled(self, supabase, table, rows):
+        self.upsert(table, rows)
+        if table == "transactions" and rows:
+            self.pull_items(supabase, [str(r["transaction_id"]) for r in rows])
+        return len(rows)
+
+# --- 🔌 USED BY THE SYNC SCRIPTS (no-ops when LOCAL_STORE_PATH is unset) ---
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The shared LocalStore, or None when LOCAL_STORE_PATH is not set."""
+    global _store
+    if LOCAL_STORE_PATH and _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LocalStore(LOCAL_STORE_PATH)
+    return _store
+
+def mirror(table, rows):
+    """Copies rows just written to Supabase; a mirror failure never fails the sync."""
+    store = get_store()
+    if store is None:
+        return
+    try:
+        store.upsert(table, rows)
+    except Exception as e:
+        print(f"   ⚠️ Local store mirror failed for {table}: {e}")
+
+def mirror_landed(table, kind, parent_ids, rows):
+    """write_queue listener: mirrors a queued write once it has landed in Supabase."""
+    if table not in TABLES or get_store() is None:
+        return
+    if kind == "replace":
+        if table == "transaction_items":
+            get_store().replace_items(parent_ids, rows)
+    else:
+        mirror(table, rows)
+
+def mirror_orders(transaction_rows, transaction_ids, item_rows):
+    store = get_store()
+    if store is None:
+        return
+    try:
+        store.upsert("transactions", transaction_rows)
+        store.replace_items(transaction_ids, item_rows)
+    except Exception as e:
+        print(f"   ⚠️ Local store mirror failed for transactions: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=LOCAL_STORE_PATH or "local_store.sqlite3")
+    parser.add_argument("--sync", action="store_true", help="Pull new and changed rows from Supabase.")
+    parser.add_argument("--start", type=date.fromisoformat, help="Mirror from this day (YYYY-MM-DD) on the next --sync.")
+    parser.add_argument("--sql", help="Run a query against the store and print the rows as JSON lines.")
+    args = parser.parse_args()
+
+    store = LocalStore(args.path)
+    if args.sync:
+        from clients import get_supabase
+        print(f"🔄 Syncing local store {args.path}...")
+        store.sync(get_supabase(), args.start)
+        print("✅ Local store up to date.")
+    if args.sql:
+        for row in store.query(args.sql):
+            print(json.dumps(row, default=str))
+    if not args.sync and not args.sql:
+        for table in TABLES:
+            covered = store.coverage(table)
+            count = store.query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+            print(f"{table:<20} {count:>9} rows  {f'{covered[0]} → {covered[1]}' if covered else ''}")
@@ -0,0 +1,187 @@
+import json
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from aggregates import iter_rows
+from cost_lookup import CostLookup, calculate_order_cogs
+
+# Same ranges the dashboard asks for by default (days back from today)
+STANDARD_RANGES = [7, 30, 90]
+
+def utc_today():
+    """Today as a UTC day: the cache keys and day buckets are UTC dates (see hooks/use-cfo-data.ts)."""
+    return datetime.now(timezone.utc).date()
+
+def empty_day():
+    return {"revenue": 0.0, "cold": 0.0, "mrr": 0.0, "orders": 0, "adSpend": 0.0, "ledgerCogs": 0.0, "estimatedCogs": 0.0}
+
+def day_cogs(day):
+    """Real FIFO cost where the ledger has it, the per-order supplier estimate for the rest."""
+    return day["ledgerCogs"] + day["estimatedCogs"]
+
+def scan_days(transactions, ads):
+    """One streaming pass over raw rows -> per-day buckets keyed by UTC date.
+
+    Transactions may carry a `cogs` key from CostLookup.attach_costs.
+    """
+    days = defaultdict(empty_day)
+    for t in transactions:
+        bucket = days[t["date"][:10]]
+        amount = float(t.get("total_amount") or 0)
+        bucket["revenue"] += amount
+        bucket["orders"] += 1
+        if t.get("cogs") is not None:
+            bucket["ledgerCogs"] += t["cogs"]
+        else:
+            bucket["estimatedCogs"] += calculate_order_cogs(amount)
+        if t.get("revenue_type") == "Cold Traffic Revenue":
+            bucket["cold"] += amount
+        elif t.get("revenue_type") == "MRR Revenue":
+            bucket["mrr"] += amount
+    for a in ads:
+        days[a["date"][:10]]["adSpend"] += float(a.get("spend") or 0)
+    return days
+
+def build_payload(days, start_date, end_date):
+    """The useCFODashboardData document (metrics + dailyHistory) for one range."""
+    history = []
+    totals = empty_day()
+    total_cogs = 0.0
+
+    current = start_date
+    while current <= end_date:
+        key = current.isoformat()
+        day = days.get(key) or empty_day()
+        cogs = day_cogs(day)
+        net = day["revenue"] - day["adSpend"] - cogs
+        history.append({
+            "date": key,
+            "revenue": day["revenue"],
+            "adSpend": day["adSpend"],
+            "profit": net,
+            "margin": (net / day["revenue"]) * 100 if day["revenue"] > 0 else 0,
+            "orders": day["orders"],
+            "aov": day["revenue"] / day["orders"] if day["orders"] > 0 else 0
+        })
+        for field in totals:
+            totals[field] += day[field]
+        total_cogs += cogs
+        current += timedelta(days=1)
+
+    net_profit = totals["revenue"] - totals["adSpend"] - total_cogs
+    return {
+        "metrics": {
+            "totalRevenue": totals["revenue"],
+            "coldTrafficRevenue": totals["cold"],
+            "mrrRevenue": totals["mrr"],
+            "adSpend": totals["adSpend"],
+            "netProfit": net_profit,
+            "orderCount": totals["orders"],
+            "aov": totals["revenue"] / totals["orders"] if totals["orders"] > 0 else 0,
+            "margin": (net_profit / totals["revenue"]) * 100 if totals["revenue"] > 0 else 0
+        },
+        "dailyHistory": history
+    }
+
+def compute_payloads(supabase, ranges):
+    """Computes payloads for several (start, end) ranges with one pass over their union."""
+    if not ranges:
+        return {}
+    first = min(start for start, _ in ranges)
+    last = max(end for _, end in ranges)
+    transactions = iter_rows(supabase, "transactions", "transaction_id, total_amount, revenue_type, date", first, last)
+    transactions = CostLookup(supabase).attach_costs(transactions)
+    ads = iter_rows(supabase, "facebook_ads", "spend, date", first, last)
+    days = scan_days(transactions, ads)
+    return {(start, end): build_payload(days, start, end) for start, end in ranges}
+
+def compute_payload(supabase, start_date, end_date):
+    return compute_payloads(supabase, [(start_date, end_date)])[(start_date, end_date)]
+
+# --- CACHE (dashboard_metrics_cache, one row per range) ---
+def store_payloads(supabase, payloads):
+    computed_at = datetime.now(timezone.utc).isoformat()
+    rows = [{
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "payload": payload,
+        "computed_at": computed_at
+    } for (start, end), payload in payloads.items()]
+    if rows:
+        supabase.table("dashboard_metrics_cache").upsert(rows, on_conflict="start_date, end_date").execute()
+
+def get_payload(supabase, start_date, end_date):
+    """Cached payload for the range, computed and stored on a miss."""
+    res = supabase.table("dashboard_metrics_cache") \
+        .select("payload") \
+        .eq("start_date", start_date.isoformat()) \
+        .eq("end_date", end_date.isoformat()) \
+        .execute()
+    if res.data:
+        return res.data[0]["payload"]
+    payload = compute_payload(supabase, start_date, end_date)
+    store_payloads(supabase, {(start_date, end_date): payload})
+    return payload
+
+def standard_ranges(today=None):
+    today = today or utc_today()
+    return [(today - timedelta(days=n), today) for n in STANDARD_RANGES]
+
+def uncached_ranges(supabase, ranges):
+    """The ranges with no row in dashboard_metrics_cache."""
+    if not ranges:
+        return []
+    res = supabase.table("dashboard_metrics_cache") \
+        .select("start_date, end_date") \
+        .in_("start_date", sorted({start.isoformat() for start, _ in ranges})) \
+        .in_("end_date", sorted({end.isoformat() for _, end in ranges})) \
+        .execute()
+    cached = {(str(row["start_date"])[:10], str(row["end_date"])[:10]) for row in res.data or []}
+    return [(start, end) for start, end in ranges if (start.isoformat(), end.isoformat()) not in cached]
+
+def invalidate_days(supabase, days):
+    """Drops every cached range that overlaps the touched days."""
+    if not days:
+        return
+    supabase.table("dashboard_metrics_cache") \
+        .delete() \
+        .lte("start_date", max(days).isoformat()) \
+        .gte("end_date", min(days).isoformat()) \
+        .execute()
+
+def refresh_cache(supabase, touched_days):
+    """Called by the sync scripts: invalidate what changed, then precompute the default ranges.
+
+    Only the default ranges that are not cached after the invalidation (they
+    held a touched day, or today is a new day) are recomputed, so a sync that
+    only touches old days does not rescan the last 90 days.
+    """
+    try:
+        invalidate_days(supabase, touched_days)
+        ranges = uncached_ranges(supabase, standard_ranges())
+        if not ranges:
+            print("🧾 Dashboard metrics cache already up to date.")
+            return
+        store_payloads(supabase, compute_payloads(supabase, ranges))
+        print(f"🧾 Dashboard metrics cache refreshed ({len(ranges)} of {len(STANDARD_RANGES)} ranges).")
+    except Exception as e:
+        print(f"⚠️ Dashboard metrics cache refresh failed: {e}")
+
+if __name__ == "__main__":
+    from clients import get_supabase
+
+    parser = argparse.ArgumentParser(description="Precompute the CFO dashboard metrics document.")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD).")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD). Defaults to today (UTC).")
+    parser.add_argument("--print", action="store_true", help="Print the payload instead of only caching it.")
+    args = parser.parse_args()
+
+    client = get_supabase()
+
+    ranges = [(args.start, args.end or utc_today())] if args.start else standard_ranges()
+    payloads = compute_payloads(client, ranges)
+    store_payloads(client, payloads)
+    for (start, end), payload in payloads.items():
+        print(f"✅ Cached {start} → {end}: revenue ${payload['metrics']['totalRevenue']:,.2f}, {payload['metrics']['orderCount']} orders.")
+        if args.print:
+            print(json.dumps(payload, indent=2))
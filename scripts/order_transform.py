@@ -0,0 +1,120 @@
+import json
+import hashlib
+
+# --- 🧭 MAPPING RULES ---
+SKIP_STATUSES = ['DECLINED', 'FAILED', 'ERROR', 'PENDING']
+TEST_FLAGS = ['true', '1']
+REFUND_EVENTS = ['refunded', 'cancelled', 'chargeback']
+
+# (event_type, revenue_type) by order status, then by order type: a refund,
+# cancel or chargeback status wins over the type
+STATUS_EVENTS = {
+    'REFUNDED': ('refunded', 'Refund'),
+    'CANCELLED': ('cancelled', 'Cancelled'),
+    'CHARGEBACK': ('chargeback', 'Chargeback'),
+}
+TYPE_EVENTS = {
+    'NEW_SALE': ('sale_new', 'Cold Traffic Revenue'),
+    'SALE': ('sale_new', 'Cold Traffic Revenue'),
+    'RECURRING': ('sale_recurring', 'MRR Revenue'),
+    'UPSELL': ('sale_upsell', 'Cold Traffic Revenue'),
+}
+UNKNOWN_EVENT = ('unknown', 'Other')
+# One shared encoder: json.dumps(sort_keys=...) builds a new encoder on every call
+HASH_ENCODER = json.JSONEncoder(sort_keys=True, default=str)
+
+def event_for(order_status, order_type):
+    """(event_type, revenue_type) for an upper-cased status and type."""
+    return STATUS_EVENTS.get(order_status) or TYPE_EVENTS.get(order_type, UNKNOWN_EVENT)
+
+def determine_event_type(raw):
+    return event_for((raw.get('orderStatus') or '').upper(), (raw.get('orderType') or '').upper())
+
+def parse_items(raw_items):
+    # --- ITEM PARSING ---
+    items_list = []
+    if isinstance(raw_items, dict):
+        items_list = list(raw_items.values())
+    elif isinstance(raw_items, list):
+        items_list = raw_items
+
+    clean_items = []
+    for item in items_list:
+        if not item.get('name'): continue
+
+        clean_items.append({
+            "product_name": item.get('name'),
+            "qty": int(item.get('qty', 1)),
+            "external_product_id": item.get('productId'),
+            "campaign_product_id": item.get('campaignProductId') or item.get('variantDetailId'),
+            "sku": item.get('sku') or item.get('productSku'),
+            "price": float(item.get('price', 0))
+        })
+    return clean_items
+
+def build_order(raw, event_type, revenue_type, total_amount):
+    # --- TRANSACTION BUILDING ---
+    order = {
+        "transaction_id": raw.get('orderId'),
+        "order_id": raw.get('orderId'),
+        "date": raw.get('dateCreated'),
+        "total_amount": total_amount,
+        "status": "sale",
+        "event_type": event_type,
+        "revenue_type": revenue_type,
+        "payment_status": raw.get('orderStatus'),
+        "campaign_id": raw.get('campaignId'),
+        "campaign_name": raw.get('campaignName'),
+        "traffic_source": raw.get('UTMSource') or raw.get('sourceValue1'),
+        "affiliate_id": raw.get('affId'),
+        "currency": raw.get('currencyCode', 'USD'),
+        "customer_email": raw.get('emailAddress'),
+        "customer_state": raw.get('state') or raw.get('shipState'),
+        "customer_country": raw.get('country') or raw.get('shipCountry'),
+        "raw_data": raw,
+        "items": parse_items(raw.get('items', []))
+    }
+    order["content_hash"] = order_content_hash(order)
+    return order
+
+def order_content_hash(order):
+    """Stable hash of the parts of an order that change after the sale (status, amount, items)."""
+    items = sorted(map(HASH_ENCODER.encode, order["items"]))
+    payload = {
+        "payment_status": order["payment_status"],
+        "event_type": order["event_type"],
+        "revenue_type": order["revenue_type"],
+        "total_amount": order["total_amount"],
+        "items": items
+    }
+    return hashlib.sha256(HASH_ENCODER.encode(payload).encode()).hexdigest()
+
+def clean_order(raw):
+    """Maps one raw Konnektive order to our transaction shape (None = skip it)."""
+    # 1. Skip Declined/Failed
+    status = (raw.get('orderStatus') or '').upper()
+    if status in SKIP_STATUSES:
+        return None
+
+    # 2. Skip TEST transactions
+    is_test = raw.get('test')
+    if is_test is True or str(is_test).lower() in TEST_FLAGS:
+        return None
+
+    # --- LOGIC MAPPING ---
+    event_type, revenue_type = determine_event_type(raw)
+
+    # Handle Refund Values (Make them negative)
+    total_amount = float(raw.get('totalAmount', 0) or 0)
+    if event_type in REFUND_EVENTS:
+        total_amount = -abs(total_amount)
+
+    return build_order(raw, event_type, revenue_type, total_amount)
+
+def transform_page(raw_orders):
+    """`[clean_order(raw) for raw in page]` with the skipped orders dropped.
+
+    A columnar version measured no faster (benchmarks/bench_transform.py):
+    most of the time is the per-order content hash.
+    """
+    return [order for order in map(clean_order, raw_orders) if order]
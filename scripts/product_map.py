@@ -0,0 +1,89 @@
+import time
+
+class ProductMapCache:
+    """In-memory copy of `product_map`, loaded with one query per run.
+
+    Lookups (known/unknown, base_product, units_per_variant) are answered
+    locally. Newly discovered products are queued and written in one batched
+    insert by `flush()`. Pass `ttl_seconds` to reload the table after it ages.
+    """
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, supabase, ttl_seconds=None):
+        self.supabase = supabase
+        self.ttl_seconds = ttl_seconds
+        self.products = {}
+        self.pending = {}
+        self.loaded_at = None
+
+    def load(self):
+        products = {}
+        start_row = 0
+        while True:
+            res = self.supabase.table("product_map") \
+                .select("*") \
+                .order("product_id") \
+                .range(start_row, start_row + self.PAGE_SIZE - 1) \
+                .execute()
+            rows = res.data or []
+            for row in rows:
+                products[str(row["product_id"])] = row
+            if len(rows) < self.PAGE_SIZE:
+                break
+            start_row += self.PAGE_SIZE
+
+        self.products = products
+        self.loaded_at = time.monotonic()
+        print(f"🗂️ Loaded {len(products)} products from product_map.")
+        return self
+
+    def _ensure_fresh(self):
+        expired = self.ttl_seconds is not None and self.loaded_at is not None \
+            and time.monotonic() - self.loaded_at > self.ttl_seconds
+        if self.loaded_at is None or expired:
+            self.load()
+
+    def get(self, product_id):
+        self._ensure_fresh()
+        pid = str(product_id)
+        return self.products.get(pid) or self.pending.get(pid)
+
+    def is_known(self, product_id):
+        return self.get(product_id) is not None
+
+    def base_product(self, product_id):
+        mapping = self.get(product_id)
+        return mapping.get("base_product") if mapping else None
+
+    def units_per_variant(self, product_id):
+        mapping = self.get(product_id)
+        return (mapping.get("units_per_variant") or 1) if mapping else 1
+
+    def discover(self, product_id, offer_name, **extra):
+        """Queues an unknown product for insert. Returns True if it was new."""
+        if self.is_known(product_id):
+            return False
+        pid = str(product_id)
+        self.pending[pid] = {
+            "product_id": pid,
+            "offer_name": offer_name,
+            "units_per_variant": 1,
+            "status": "needs_review",
+            **extra
+        }
+        return True
+
+    def flush(self):
+        """Inserts every queued product in one call and moves them into the cache.
+
+        Products another process registered in the meantime are left untouched.
+        """
+        if not self.pending:
+            return 0
+        rows = list(self.pending.values())
+        self.supabase.table("product_map").upsert(rows, on_conflict="product_id", ignore_duplicates=True).execute()
+        self.products.update(self.pending)
+        self.pending = {}
+        print(f"🚨 Registered {len(rows)} new product(s) for review.")
+        return len(rows)
@@ -0,0 +1,60 @@
+import os
+import gzip
+import json
+import threading
+
+class RawArchive:
+    """Date-partitioned archive of raw API responses as gzipped NDJSON.
+
+    Layout: <root>/<source>/<YYYY-MM-DD>/<name>.ndjson.gz, one raw record per
+    line. The first write to a file in a run replaces it and later writes in
+    the same run append, so re-running a day never duplicates records. Call
+    `clear` before re-fetching a paged response, so pages the new fetch no
+    longer has do not linger.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._written = set()
+        self._lock = threading.Lock()
+
+    def path(self, source, day, name):
+        return os.path.join(self.root, source, day.isoformat(), f"{name}.ndjson.gz")
+
+    def write_records(self, source, day, name, records):
+        path = self.path(source, day, name)
+        with self._lock:
+            mode = "at" if path in self._written else "wt"
+            self._written.add(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(path, mode, encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str))
+                    f.write("\n")
+
+    def clear(self, source, day, prefix):
+        """Deletes a day's files starting with `prefix`, except those written in this run."""
+        with self._lock:
+            for name in self.names(source, day, prefix):
+                path = self.path(source, day, name)
+                if path not in self._written:
+                    os.remove(path)
+
+    def names(self, source, day, prefix=""):
+        """Archived file names for a day, sorted (page files sort in page order)."""
+        folder = os.path.join(self.root, source, day.isoformat())
+        if not os.path.isdir(folder):
+            return []
+        return sorted(f[:-len(".ndjson.gz")] for f in os.listdir(folder)
+                      if f.endswith(".ndjson.gz") and f.startswith(prefix))
+
+    def iter_records(self, source, day, name):
+        with gzip.open(self.path(source, day, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_day(self, source, day, prefix=""):
+        """Streams every archived record for a day, file by file."""
+        for name in self.names(source, day, prefix):
+            yield from self.iter_records(source, day, name)
@@ -0,0 +1,240 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from aggregates import iter_rows
+from clients import supabase
+from daily_metrics import safe_refresh_days
+from metrics_service import refresh_cache
+from order_transform import transform_page
+from product_map import ProductMapCache
+import backfill_sales
+import config
+import instrumentation
+import http_client
+
+# --- ⚙️ CONFIGURATION (REFUND_STRATEGY lives in backfill_sales.py, which dispatches here) ---
+STATE_PATH = os.environ.get("REFUND_STATE_PATH", os.path.join("sync_state", "refund_index.json"))
+# How far back order statuses are tracked (chargebacks can land months after the sale).
+# REFUND_INDEX_DAYS wins, then SYNC_DAYS (the look-back the refund sweep used), then 120.
+INDEX_DAYS = int(os.environ.get("REFUND_INDEX_DAYS") or config.SYNC_DAYS or 120)
+INDEX_DAYS_SOURCE = "REFUND_INDEX_DAYS" if os.environ.get("REFUND_INDEX_DAYS") else "SYNC_DAYS" if config.SYNC_DAYS else "default"
+# Recent days re-read from Supabase each run so the index learns about new sales
+INDEX_REFRESH_DAYS = 3
+
+# Adaptive schedule: (max order age in days, re-check every N days)
+RECHECK_SCHEDULE = [(7, 1), (14, 2), (30, 4), (60, 7)]
+RECHECK_OLDEST = 14
+
+class DeltaUnsupported(Exception):
+    """Konnektive rejected the dateUpdated query; use the adaptive schedule instead."""
+
+# --- 🗂️ STATUS INDEX (order_id -> [status, order day]) ---
+def load_state(path=STATE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"orders": {}, "watermark": None, "checked": {}}
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def refresh_index(state, supabase, today):
+    """Adds recent transactions from Supabase to the index and drops orders past INDEX_DAYS.
+
+    A fresh index is seeded with the whole INDEX_DAYS window; after that only
+    the last INDEX_REFRESH_DAYS are re-read.
+    """
+    orders = state["orders"]
+    oldest = today - timedelta(days=INDEX_DAYS)
+    start = today - timedelta(days=INDEX_REFRESH_DAYS)
+    if not orders or not state.get("indexed_through"):
+        start = oldest
+    else:
+        # Catch up on every day since the last refresh, however long ago that was
+        start = max(oldest, min(start, date.fromisoformat(state["indexed_through"])))
+    for row in iter_rows(supabase, "transactions", "transaction_id, payment_status, date", start):
+        orders[str(row["transaction_id"])] = [row.get("payment_status"), str(row["date"])[:10]]
+    state["indexed_through"] = today.isoformat()
+
+    cutoff = oldest.isoformat()
+    for order_id in [k for k, (_, day) in orders.items() if day and day < cutoff]:
+        del orders[order_id]
+    state["checked"] = {day: checked for day, checked in state.get("checked", {}).items() if day >= cutoff}
+    return state
+
+def status_changes(orders, index):
+    """Orders whose status differs from the index (unknown orders count as changed)."""
+    return [o for o in orders if (index.get(str(o["transaction_id"])) or [None])[0] != o["payment_status"]]
+
+# --- 🔎 DELTA: orders updated since the watermark ---
+def query_updated(start_date, end_date, status, page):
+    """One page of orders whose *last update* falls in the range. Returns (raw_orders, total_results)."""
+    params = {
+        "loginId": backfill_sales.CHECKOUT_CHAMP_ID,
+        "password": backfill_sales.CHECKOUT_CHAMP_PASS,
+        "startDate": start_date.strftime("%m/%d/%Y"),
+        "endDate": end_date.strftime("%m/%d/%Y"),
+        "dateRangeType": "dateUpdated",
+        "orderStatus": status,
+        "resultsPerPage": backfill_sales.RESULTS_PER_PAGE,
+        "page": page
+    }
+    json_resp = http_client.get(backfill_sales.KONNEKTIVE_ORDER_QUERY_URL, params=params).json()
+    message = json_resp.get("message")
+    if json_resp.get("result") != "SUCCESS":
+        # "No orders matching those parameters could be found" is an empty page, anything else is a rejection
+        if isinstance(message, str) and "could be found" in message.lower():
+            return [], 0
+        raise DeltaUnsupported(message)
+
+    body = message if isinstance(message, dict) else json_resp
+    raw_orders = body.get("data") or []
+    if isinstance(raw_orders, dict):
+        raw_orders = list(raw_orders.values())
+    return raw_orders, int(body.get("totalResults") or len(raw_orders))
+
+def fetch_updated(start_date, end_date):
+    """Every refund-type order updated in the range, cleaned. Pages 2+ are fetched concurrently."""
+    orders = []
+    with ThreadPoolExecutor(max_workers=backfill_sales.FETCH_CONCURRENCY) as pool:
+        for status in backfill_sales.statuses_for_mode("REFUNDS"):
+            raw_orders, total_results = query_updated(start_date, end_date, status, 1)
+            total_pages = max(1, -(-total_results // backfill_sales.RESULTS_PER_PAGE))
+            rest = pool.map(lambda page, status=status: query_updated(start_date, end_date, status, page)[0], range(2, total_pages + 1))
+            for page in [raw_orders, *rest]:
+                orders.extend(transform_page(page))
+            print(f"   🔎 [{status}] updated {start_date} → {end_date}: {total_results} order(s).")
+    return orders
+
+def run_delta(state, today):
+    # First run: everything updated inside the tracked window
+    since = date.fromisoformat(state["watermark"]) if state.get("watermark") else today - timedelta(days=INDEX_DAYS)
+    with instrumentation.span("refund delta fetch"):
+        orders = fetch_updated(since, today)
+    # Re-query today next time: updates later today still need to be seen
+    return orders, {"watermark": today.isoformat()}
+
+# --- 📅 ADAPTIVE: re-check order days by age ---
+def recheck_interval(age_days):
+    for max_age, every in RECHECK_SCHEDULE:
+        if age_days <= max_age:
+            return every
+    return RECHECK_OLDEST
+
+def due_days(state, today):
+    checked = state.get("checked", {})
+    days = []
+    for age in range(INDEX_DAYS + 1):
+        day = today - timedelta(days=age)
+        last = checked.get(day.isoformat())
+        if not last or (today - date.fromisoformat(last)).days >= recheck_interval(age):
+            days.append(day)
+    return sorted(days)
+
+def run_adaptive(state, today):
+    days = due_days(state, today)
+    print(f"   📅 Adaptive refund check: {len(days)} of {INDEX_DAYS + 1} day(s) due.")
+    errors = []
+    orders = []
+    # Contiguous runs of due days share one fetch pool
+    runs = []
+    for day in days:
+        if runs and (day - runs[-1][-1]).days == 1:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    with instrumentation.span("refund adaptive fetch", days=len(days)):
+        for run in runs:
+            for _, day_orders in backfill_sales.fetch_orders_for_range(run[0], run[-1], "REFUNDS", errors=errors):
+                orders.extend(day_orders)
+
+    failed_days = {day for day, _, _, _ in errors}
+    checked = dict(state.get("checked", {}))
+    checked.update({day.isoformat(): today.isoformat() for day in days if day not in failed_days})
+    return orders, {"checked": checked}, errors
+
+# --- 🚀 RUN ---
+def run_tracker(strategy=None, refresh=True, today=None, state_path=STATE_PATH):
+    """Writes only the orders whose status changed since the last run.
+
+    Returns the same summary shape as backfill_sales.run_backfill.
+    """
+    strategy = strategy or backfill_sales.REFUND_STRATEGY
+    today = today or date.today()
+    print(f"\n🔁 REFUND TRACKER ({strategy})")
+    print(f"   📏 Tracking orders from the last {INDEX_DAYS} day(s) ({INDEX_DAYS_SOURCE}).")
+
+    state = load_state(state_path)
+    with instrumentation.span("refund index refresh"):
+        refresh_index(state, supabase, today)
+    index = state["orders"]
+
+    fetch_errors = []
+    if strategy == "delta":
+        try:
+            orders, updates = run_delta(state, today)
+        except DeltaUnsupported as e:
+            print(f"   ℹ️ dateUpdated query not available ({e}), using the adaptive schedule.")
+            orders, updates, fetch_errors = run_adaptive(state, today)
+        except Exception as e:
+            print(f"   ❌ Delta query failed: {e}")
+            orders, updates, fetch_errors = [], {}, [(today, None, None, str(e))]
+    else:
+        orders, updates, fetch_errors = run_adaptive(state, today)
+
+    # One row per order, last seen wins
+    orders = list({o["transaction_id"]: o for o in orders}.values())
+    changed = status_changes(orders, index)
+    counts = {"unchanged": len(orders) - len(changed), "new": 0, "changed": 0}
+    for order in changed:
+        counts["changed" if str(order["transaction_id"]) in index else "new"] += 1
+    print(f"   🧮 {counts['unchanged']} unchanged / {counts['new']} new / {counts['changed']} changed status(es).")
+
+    saved, failed_chunks, touched_days = 0, [], set()
+    if changed:
+        with instrumentation.span("supabase write"):
+            saved, failed_chunks = backfill_sales.write_orders(changed, ProductMapCache(supabase))
+        failed_chunks.extend(backfill_sales.drain_write_queue())
+        instrumentation.add("supabase write", rows=saved, failed_chunks=len(failed_chunks))
+        failed_ids = {str(t) for chunk in failed_chunks for t in chunk["transaction_ids"]}
+        for order in changed:
+            if str(order["transaction_id"]) not in failed_ids:
+                index[str(order["transaction_id"])] = [order["payment_status"], str(order["date"])[:10]]
+                if order.get("date"):
+                    touched_days.add(date.fromisoformat(str(order["date"])[:10]))
+
+    # Only move the watermark forward when nothing needs retrying
+    if not fetch_errors and not failed_chunks:
+        state.update(updates)
+    elif "checked" in updates:
+        state["checked"] = updates["checked"]
+    save_state(state, state_path)
+
+    if refresh:
+        with instrumentation.span("daily_metrics refresh", days=len(touched_days)):
+            safe_refresh_days(supabase, touched_days)
+        if touched_days:
+            with instrumentation.span("dashboard cache refresh"):
+                refresh_cache(supabase, touched_days)
+
+    print(f"✨ Refund tracker: saved {saved}/{len(changed)} changed order(s), index holds {len(index)} order(s).")
+    return {
+        "saved": saved,
+        "failed_chunks": failed_chunks,
+        "fetch_errors": fetch_errors,
+        "touched_days": touched_days,
+        "counts": counts
+    }
+
+if __name__ == "__main__":
+    metrics = instrumentation.start_run("refund_tracker")
+    try:
+        run_tracker()
+    finally:
+        metrics.finish(supabase)
@@ -0,0 +1,166 @@
+"""hypnoscale-sync: one long-running process for every scheduled sync.
+
+Imports the sync scripts once and keeps their Supabase clients and pooled
+HTTP sessions warm, so a run costs only the data it moves. Jobs run one at
+a time, earliest due first. A job that is still running (here or in another
+daemon on the same host) is never started twice. Missed ticks collapse into
+a single run.
+
+Usage: python scripts/sync_daemon.py [--jobs sales,fb_ads] [--once]
+(the `sync` process in the Procfile; the workflows run the same jobs on cron)
+"""
+import os
+import sys
+import time
+import fcntl
+import signal
+import argparse
+import tempfile
+import threading
+from datetime import date, timedelta
+import instrumentation
+
+# --- ⏰ SCHEDULE (minutes between runs; 0 disables a job) ---
+SALES_INTERVAL = float(os.environ.get("DAEMON_SALES_INTERVAL", 5))
+REFUNDS_INTERVAL = float(os.environ.get("DAEMON_REFUNDS_INTERVAL", 24 * 60))
+FB_INTERVAL = float(os.environ.get("DAEMON_FB_INTERVAL", 60))
+INSIGHTS_INTERVAL = float(os.environ.get("DAEMON_INSIGHTS_INTERVAL", 24 * 60))
+# Only scheduled when LOCAL_STORE_PATH is set (see local_store.py)
+LOCAL_STORE_INTERVAL = float(os.environ.get("DAEMON_LOCAL_STORE_INTERVAL", 60))
+
+# Look-back windows, same as the hourly and daily workflows
+SALES_DAYS = int(os.environ.get("DAEMON_SALES_DAYS", 3))
+REFUNDS_DAYS = int(os.environ.get("DAEMON_REFUNDS_DAYS", 30))
+FB_DAYS = int(os.environ.get("DAEMON_FB_DAYS", 3))
+
+LOCK_DIR = os.environ.get("DAEMON_LOCK_DIR", tempfile.gettempdir())
+# Longest sleep between checks, so a shutdown signal is noticed promptly
+MAX_SLEEP_SECONDS = 30
+
+class Job:
+    """A named callable with an interval and a host-wide, non-blocking run lock."""
+
+    def __init__(self, name, interval_minutes, fn):
+        self.name = name
+        self.interval = interval_minutes * 60
+        self.fn = fn
+        self.next_run = time.monotonic()  # everything runs once at startup
+        self.runs = 0
+        self.failures = 0
+
+    def try_lock(self):
+        """Returns an open lock file, or None if another run of this job holds it."""
+        handle = open(os.path.join(LOCK_DIR, f"hypnoscale-sync-{self.name}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+class Scheduler:
+    def __init__(self, jobs, supabase=None):
+        self.jobs = [job for job in jobs if job.interval > 0]
+        self.supabase = supabase
+        self.stop_event = threading.Event()
+
+    def run_job(self, job):
+        lock = job.try_lock()
+        if lock is None:
+            print(f"⏭️ {job.name}: previous run still going, skipping this tick.")
+        else:
+            metrics = instrumentation.start_run(job.name)
+            started = time.monotonic()
+            print(f"\n▶️ {job.name}: starting (run #{job.runs + 1})...")
+            try:
+                job.fn()
+                print(f"✅ {job.name}: done in {time.monotonic() - started:.1f}s.")
+            except Exception as e:
+                job.failures += 1
+                print(f"❌ {job.name}: failed after {time.monotonic() - started:.1f}s: {e}")
+            finally:
+                job.runs += 1
+                lock.close()
+                metrics.finish(self.supabase)
+
+        # Next tick is measured from the schedule, but never in the past (no catch-up bursts)
+        job.next_run = max(job.next_run + job.interval, time.monotonic())
+
+    def run_forever(self):
+        names = ", ".join(f"{job.name} every {job.interval / 60:g}m" for job in self.jobs)
+        print(f"🛰️ hypnoscale-sync running: {names}")
+        while not self.stop_event.is_set():
+            job = min(self.jobs, key=lambda j: j.next_run)
+            wait_seconds = job.next_run - time.monotonic()
+            if wait_seconds > 0:
+                self.stop_event.wait(min(wait_seconds, MAX_SLEEP_SECONDS))
+                continue
+            self.run_job(job)
+        print("👋 hypnoscale-sync stopped.")
+
+    def run_once(self):
+        for job in self.jobs:
+            self.run_job(job)
+
+    def stop(self, signum=None, frame=None):
+        if self.stop_event.is_set():
+            # Second signal: stop waiting for the current job
+            raise KeyboardInterrupt
+        print("\n🛑 Shutdown requested, finishing the current job first...")
+        self.stop_event.set()
+
+def build_jobs():
+    """Imports the sync scripts once; their clients and sessions stay warm between runs."""
+    import backfill_sales
+    import sync_fb_ads
+    import generate_insights
+    import local_store
+
+    def sales():
+        today = date.today()
+        backfill_sales.run_backfill(today - timedelta(days=SALES_DAYS), today, "FULL")
+
+    def refunds():
+        today = date.today()
+        backfill_sales.run_backfill(today - timedelta(days=REFUNDS_DAYS), today, "REFUNDS")
+
+    def fb_ads():
+        today = date.today()
+        sync_fb_ads.fetch_all_accounts(today - timedelta(days=FB_DAYS), today)
+
+    jobs = [
+        Job("sales", SALES_INTERVAL, sales),
+        Job("refunds", REFUNDS_INTERVAL, refunds),
+        Job("fb_ads", FB_INTERVAL, fb_ads),
+        Job("insights", INSIGHTS_INTERVAL, generate_insights.generate_insights),
+    ]
+    if local_store.get_store() is not None:
+        jobs.append(Job("local_store", LOCAL_STORE_INTERVAL, lambda: local_store.get_store().sync(backfill_sales.supabase)))
+    return jobs, backfill_sales.supabase
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", help="Comma-separated subset of jobs to run (default: all enabled).")
+    parser.add_argument("--once", action="store_true", help="Run each job once and exit.")
+    args = parser.parse_args()
+
+    jobs, supabase = build_jobs()
+    if args.jobs:
+        wanted = {name.strip() for name in args.jobs.split(",")}
+        unknown = wanted - {job.name for job in jobs}
+        if unknown:
+            print(f"❌ Unknown job(s): {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        jobs = [job for job in jobs if job.name in wanted]
+
+    scheduler = Scheduler(jobs, supabase)
+    if not scheduler.jobs:
+        print("❌ No jobs enabled (every interval is 0).")
+        sys.exit(1)
+
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    if args.once:
+        scheduler.run_once()
+    else:
+        scheduler.run_forever()
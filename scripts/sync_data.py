@@ -1,20 +1,18 @@
-import os
+import json
 import random
 from datetime import date, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-# 1. SETUP: Load keys and connect to Supabase
-load_dotenv(".env.local")
-url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key = os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-
-if not url or not key:
-    print("❌ Error: Missing API keys in .env.local")
-    exit()
-
-supabase: Client = create_client(url, key)
-print("🚀 Starting Hypnoscale Sync...")
+from clients import supabase, has_supabase_credentials
+from product_map import ProductMapCache
+from fifo import FifoEngine
+import config
+import instrumentation
+import inventory_forecast
+import local_store
+import write_queue
+
+# 1. SETUP: keys come from config.py, Supabase connects on first use (clients.py)
+# Set FIFO_USE_RPC=true to run the FIFO allocation atomically in Postgres (see schema.sql)
+FIFO_USE_RPC = config.env_flag("FIFO_USE_RPC")
 
 # ---------------------------------------------------------
 # MOCK DATA GENERATORS (Simulating your APIs)
@@ -56,123 +54,98 @@ def fetch_checkoutchamp_orders():
     return orders
 
 # ---------------------------------------------------------
-# CORE LOGIC: FIFO & Auto-Discovery
+# CORE LOGIC: Auto-Discovery & FIFO (see fifo.py)
 # ---------------------------------------------------------
 
-def process_inventory_deduction(product_id, qty_sold, transaction_id, product_name):
-    """Finds the oldest batch for the base product and deducts stock."""
-    
-    # A. Get Base Product info from Product Map
-    response = supabase.table("product_map").select("*").eq("product_id", product_id).execute()
-    
-    # Auto-Discovery Check happens in the main loop, so here we just check if mapped.
-    if not response.data:
-        print(f"   ⚠️ Inventory Skip: Product ID {product_id} is not mapped to a base product yet.")
-        return
-
-    mapping = response.data[0]
-    base_product = mapping.get("base_product")
-    units_per_variant = mapping.get("units_per_variant", 1)
-    
-    # If it's a new product (status='needs_review'), it might not have a base_product yet.
-    if not base_product:
-        print(f"   ⚠️ Inventory Skip: No base product defined for '{mapping['offer_name']}'.")
-        return
-
-    total_units_to_deduct = qty_sold * units_per_variant
-    print(f"   📉 Processing: {qty_sold} sold x {units_per_variant} units = {total_units_to_deduct} {base_product}(s)")
-
-    # B. Find Active Batches (FIFO - Ordered by ID)
-    batches = supabase.table("inventory_batches")\
-        .select("*")\
-        .eq("base_product", base_product)\
-        .eq("status", "active")\
-        .order("batch_id")\
-        .execute().data
-
-    remaining_needed = total_units_to_deduct
-
-    for batch in batches:
-        if remaining_needed <= 0:
-            break
-            
-        available = batch["remaining_qty"]
-        take = min(available, remaining_needed)
-        
-        # C. Update the Batch in Database
-        new_qty = available - take
-        status = "active" if new_qty > 0 else "depleted"
-        
-        supabase.table("inventory_batches")\
-            .update({"remaining_qty": new_qty, "status": status})\
-            .eq("batch_id", batch["batch_id"])\
-            .execute()
-
-        # D. Log the Cost (Crucial for Profit Calculation)
-        supabase.table("transaction_cost_ledger").insert({
-            "transaction_id": transaction_id,
-            "product_name": product_name,
-            "batch_id": batch["batch_id"],
-            "qty_deducted": take,
-            "cost_per_unit_at_time": batch["unit_cost"]
-        }).execute()
-        
-        remaining_needed -= take
-        print(f"      ✅ Deducted {take} from Batch #{batch['batch_id']} (Cost: ${batch['unit_cost']})")
-
-    if remaining_needed > 0:
-        print(f"      ❌ OUT OF STOCK! Could not fulfill {remaining_needed} units of {base_product}.")
+def drain_write_queue(queue):
+    """Waits for this run's queued writes; returns the transaction IDs that have not landed."""
+    with instrumentation.span("write queue drain"):
+        queue.drain(timeout=write_queue.WRITE_DRAIN_SECONDS)
+    queue.pop_unsettled("daily_marketing_spend", "upsert")
+    pending = {json.loads(key)[0] for key in queue.pop_unsettled("transactions", "upsert")}
+    pending.update(queue.pop_unsettled("transaction_items", "replace"))
+    if pending:
+        print(f"   📬 {len(pending)} order(s) still in the write queue, left out of FIFO until they land.")
+    return pending
 
 def sync():
+    # With WRITE_QUEUE_PATH set every write below goes through the durable queue (write_queue.py)
+    queue = write_queue.get_queue(supabase)
+
     # 1. Sync Marketing Spend
     spend_data = fetch_facebook_spend()
-    supabase.table("daily_marketing_spend").upsert(spend_data).execute()
+    with instrumentation.span("marketing spend", rows=1):
+        if queue is not None:
+            queue.upsert("daily_marketing_spend", [spend_data], ["date"])
+        else:
+            supabase.table("daily_marketing_spend").upsert(spend_data).execute()
     print(f"📊 Ad Spend Synced: ${spend_data['ad_spend_fb']} (FB)")
 
     # 2. Sync Orders
     orders = fetch_checkoutchamp_orders()
+    with instrumentation.span("product map load"):
+        product_cache = ProductMapCache(supabase).load()
+
+    # --- Auto-Discovery Loop ---
     for order in orders:
-        # --- Auto-Discovery Loop ---
         for item in order["items"]:
             pid = item["external_product_id"]
             
-            # Check if we know this product
-            exists = supabase.table("product_map").select("product_id").eq("product_id", pid).execute()
-            
-            if not exists.data:
+            # Check if we know this product (answered from the cache)
+            if product_cache.discover(pid, item["product_name"], unit_cost=0, base_product=None):
                 # UNKNOWN PRODUCT! Add it to DB so you can edit it in Dashboard later.
                 print(f"🚨 NEW PRODUCT DISCOVERED: {item['product_name']} (ID: {pid})")
-                supabase.table("product_map").insert({
-                    "product_id": pid,
-                    "offer_name": item["product_name"],
-                    "units_per_variant": 1,
-                    "unit_cost": 0,
-                    "status": "needs_review", # This flags it red in your dashboard
-                    "base_product": None
-                }).execute()
-
-        # Insert Transaction Header
-        trans_data = {k:v for k,v in order.items() if k != "items"}
-        supabase.table("transactions").upsert(trans_data).execute()
-        
-        # Insert Items & Calculate COGS
-        for item in order["items"]:
-            supabase.table("transaction_items").insert({
-                "transaction_id": order["transaction_id"],
-                "product_name": item["product_name"],
-                "qty": item["qty"],
-                "external_product_id": item["external_product_id"]
-            }).execute()
-            
-            # Run the FIFO cost calculator
-            process_inventory_deduction(
-                item["external_product_id"], 
-                item["qty"], 
-                order["transaction_id"],
-                item["product_name"]
-            )
+
+    # One batched insert; new products are flagged "needs_review" (red in your dashboard)
+    with instrumentation.span("product map flush"):
+        product_cache.flush()
+
+    # Transaction headers, then their items (replaced, so a re-run never duplicates them)
+    trans_rows = [{k:v for k,v in order.items() if k != "items"} for order in orders]
+    transaction_ids = [order["transaction_id"] for order in orders]
+    item_rows = [{
+        "transaction_id": order["transaction_id"],
+        "product_name": item["product_name"],
+        "qty": item["qty"],
+        "external_product_id": item["external_product_id"]
+    } for order in orders for item in order["items"]]
+
+    with instrumentation.span("supabase write", rows=len(orders)):
+        if queue is not None:
+            # The queue mirrors the rows into the local store once they land
+            queue.upsert("transactions", trans_rows, ["transaction_id"])
+            queue.replace("transaction_items", "transaction_id", transaction_ids, item_rows)
+        else:
+            supabase.table("transactions").upsert(trans_rows).execute()
+            supabase.table("transaction_items").delete().in_("transaction_id", transaction_ids).execute()
+            if item_rows:
+                supabase.table("transaction_items").insert(item_rows).execute()
+            local_store.mirror_orders(trans_rows, transaction_ids, item_rows)
+
+    # The ledger references the orders, so FIFO waits for them to land
+    if queue is not None:
+        pending = drain_write_queue(queue)
+        orders = [order for order in orders if str(order["transaction_id"]) not in pending]
+
+    # 3. Calculate COGS: one FIFO pass over every item in the run
+    with instrumentation.span("fifo"):
+        ledger_rows = FifoEngine(supabase, product_cache, use_rpc=FIFO_USE_RPC).run(orders)
+    instrumentation.add("fifo", rows=ledger_rows or 0)
+
+    # 4. Re-project depletion dates with the usage we just recorded
+    with instrumentation.span("inventory forecast"):
+        inventory_forecast.safe_refresh(supabase, {date.fromisoformat(o["date"][:10]) for o in orders}, product_cache)
             
     print(f"✅ Sync Complete: Processed {len(orders)} Orders.")
 
 if __name__ == "__main__":
-    sync()
\ No newline at end of file
+    if not has_supabase_credentials():
+        print("❌ Error: Missing API keys in .env.local")
+        exit()
+    print("🚀 Starting Hypnoscale Sync...")
+
+    metrics = instrumentation.start_run("sync_data")
+    try:
+        sync()
+    finally:
+        metrics.finish(supabase)
\ No newline at end of file
@@ -1,49 +1,110 @@
 import os
-import requests
+import sys
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import date, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from clients import supabase
+from daily_metrics import safe_refresh_days
+from metrics_service import refresh_cache
+from raw_archive import RawArchive
+import config
+import instrumentation
+import local_store
+import write_queue
+import http_client
 
 # --- 📅 CONFIGURATION ---
-load_dotenv(".env.local")
-
-# Determine Date Range
-if os.environ.get("GITHUB_ACTIONS") == "true":
-    print("🤖 AUTOMATION MODE: Syncing last 3 days...")
-    START_DATE = date.today() - timedelta(days=3)
-    END_DATE = date.today()
-else:
-    # MANUAL BACKFILL: From Dec 27, 2025 to Today
-    print("🛠️ MANUAL MODE: Backfilling from Dec 27...")
-    START_DATE = date(2025, 12, 27) 
-    END_DATE = date.today()
-
-# --- 🔐 CREDENTIALS ---
-FB_ACCESS_TOKEN = os.environ.get("FACEBOOK_ACCESS_TOKEN")
-# Expecting a comma-separated string: "act_111,act_222,act_333"
-FB_AD_ACCOUNT_IDS_RAW = os.environ.get("FACEBOOK_AD_ACCOUNT_ID")
-
-SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-
-if not FB_ACCESS_TOKEN or not FB_AD_ACCOUNT_IDS_RAW:
-    if os.environ.get("GITHUB_ACTIONS") != "true":
-        print("⚠️ WARNING: Facebook Credentials not found. Check .env.local")
+# Determine Date Range (manual backfill: from Dec 27, 2025 to today, see config.py)
+START_DATE, END_DATE, DATE_MODE = config.sync_date_range(date(2025, 12, 27))
+
+# --- 🔐 CREDENTIALS (Supabase connects lazily on first use, see clients.py) ---
+FB_ACCESS_TOKEN = config.FB_ACCESS_TOKEN
+FB_AD_ACCOUNT_IDS_RAW = config.FB_AD_ACCOUNT_IDS_RAW
+
+FB_GRAPH_URL = os.environ.get("FB_GRAPH_URL", "https://graph.facebook.com/v19.0")
+
+# How many ad accounts to sync at the same time
+ACCOUNT_CONCURRENCY = int(os.environ.get("FB_ACCOUNT_CONCURRENCY", 4))
+# facebook_ads is keyed (and upserted) on one row per day and campaign
+AD_KEY_COLUMNS = ["date", "campaign_id"]
+
+# --- 📼 RAW ARCHIVE ---
+# Set RAW_ARCHIVE_DIR to keep every insights row on disk (partitioned by date_start).
+# `python scripts/sync_fb_ads.py --replay` re-saves the archived rows with no network.
+REPLAY = "--replay" in sys.argv[1:]
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR") or ("raw_archive" if REPLAY else None)
+raw_archive = RawArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None
+
+def build_record(row, clean_acc_id):
+    return {
+        "date": row["date_start"],
+        "ad_account_id": clean_acc_id,
+        "ad_account_name": row.get("account_name", "Unknown"),
+        "campaign_id": row["campaign_id"],
+        "campaign_name": row["campaign_name"],
+        "spend": float(row.get("spend", 0)),
+        "impressions": int(row.get("impressions", 0)),
+        "clicks": int(row.get("clicks", 0)),
+        "cpc": float(row.get("cpc", 0) or 0),
+        "ctr": float(row.get("ctr", 0) or 0)
+    }
+
+def save_records(records, touched_days=None, queued_keys=None):
+    """Upserts a page of insights records in one call; returns how many were saved.
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    With the write queue on, the rows' queue keys are added to `queued_keys`
+    so the caller can tell which of them have not landed yet.
+    """
+    # One row per (date, campaign): Postgres rejects an upsert that touches a row twice
+    unique = list({(r["date"], r["campaign_id"]): r for r in records}.values())
+    if not unique:
+        return 0
+    queue = write_queue.get_queue(supabase)
+    try:
+        with instrumentation.span("supabase write", rows=len(unique)):
+            if queue is not None:
+                # Durable locally; the queue flushes, retries and mirrors it (see write_queue.py)
+                queue.upsert("facebook_ads", unique, AD_KEY_COLUMNS, on_conflict="date, campaign_id")
+                if queued_keys is not None:
+                    queued_keys.update(write_queue.row_key(r, AD_KEY_COLUMNS) for r in unique)
+            else:
+                supabase.table("facebook_ads").upsert(unique, on_conflict="date, campaign_id").execute()
+                local_store.mirror("facebook_ads", unique)
+    except Exception as e:
+        print(f"   ⚠️ Error saving {len(unique)} rows: {e}")
+        instrumentation.add("supabase write", failed_rows=len(unique))
+        return 0
+    if touched_days is not None:
+        touched_days.update(date.fromisoformat(r["date"]) for r in unique)
+    return len(unique)
+
+def archive_rows(clean_acc_id, insights):
+    by_day = {}
+    for row in insights:
+        by_day.setdefault(row["date_start"], []).append(row)
+    for day, rows in by_day.items():
+        raw_archive.write_records("facebook", date.fromisoformat(day), clean_acc_id, rows)
 
-def sync_single_account(acc_id):
+def sync_single_account(acc_id, start_date=None, end_date=None):
+    """Syncs one account, saving each page while the next one downloads.
+
+    Returns a stats dict with the records saved, pages read, timings, the
+    days touched and the error that stopped the sync (None when it finished).
+    """
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
     # Ensure ID starts with act_
     clean_acc_id = acc_id.strip()
     if not clean_acc_id.startswith("act_"):
         clean_acc_id = f"act_{clean_acc_id}"
 
-    print(f"\n🚀 Syncing Account: {clean_acc_id} ({START_DATE} to {END_DATE})...")
+    print(f"🚀 Syncing Account: {clean_acc_id} ({start_date} to {end_date})...")
 
-    base_url = f"https://graph.facebook.com/v19.0/{clean_acc_id}/insights"
-    str_start = START_DATE.strftime("%Y-%m-%d")
-    str_end = END_DATE.strftime("%Y-%m-%d")
+    base_url = f"{FB_GRAPH_URL}/{clean_acc_id}/insights"
+    str_start = start_date.strftime("%Y-%m-%d")
+    str_end = end_date.strftime("%Y-%m-%d")
 
     params = {
         "access_token": FB_ACCESS_TOKEN,
@@ -54,71 +115,157 @@ def sync_single_account(acc_id):
         "limit": 100 
     }
 
-    total_saved = 0
+    stats = {"account": clean_acc_id, "records": 0, "pages": 0, "fetch_seconds": 0.0, "total_seconds": 0.0, "days": set(),
+             "queued_keys": set(), "error": None}
+    started = time.monotonic()
+    pending_saves = []
     current_url = base_url
-    
-    while current_url:
-        try:
-            if current_url == base_url:
-                response = requests.get(current_url, params=params)
-            else:
-                response = requests.get(current_url)
+
+    # One writer per account keeps page writes in order while fetching continues
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        while current_url:
+            try:
+                fetch_started = time.monotonic()
+                if current_url == base_url:
+                    response = http_client.get(current_url, params=params)
+                else:
+                    response = http_client.get(current_url)
+                    
+                data = response.json()
+                stats["fetch_seconds"] += time.monotonic() - fetch_started
+                instrumentation.add("graph fetch", seconds=time.monotonic() - fetch_started, calls=1, rows=len(data.get("data") or []))
+
+                if "error" in data:
+                    print(f"   ❌ FB API Error for {clean_acc_id}: {data['error']['message']}")
+                    stats["error"] = data["error"]["message"]
+                    break
+
+                insights = data.get("data", [])
                 
-            data = response.json()
+                if not insights and stats["pages"] == 0:
+                    print(f"   ℹ️ {clean_acc_id}: 0 records found for this period.")
+                    break
 
-            if "error" in data:
-                print(f"   ❌ FB API Error for {clean_acc_id}: {data['error']['message']}")
-                break
+                stats["pages"] += 1
+                if raw_archive:
+                    archive_rows(clean_acc_id, insights)
+
+                records = [build_record(row, clean_acc_id) for row in insights]
+                pending_saves.append((writer.submit(save_records, records, stats["days"], stats["queued_keys"]), len(records)))
+
+                current_url = data.get("paging", {}).get("next")
+                if current_url:
+                    print(f"   ➡️ {clean_acc_id}: fetching page {stats['pages'] + 1}...")
 
-            insights = data.get("data", [])
-            
-            if not insights and total_saved == 0:
-                print(f"   ℹ️ 0 records found for this period.")
+            except Exception as e:
+                print(f"   ❌ Critical Error for {clean_acc_id}: {e}")
+                stats["error"] = str(e)
                 break
 
-            for row in insights:
-                record = {
-                    "date": row["date_start"],
-                    "ad_account_id": clean_acc_id,
-                    "ad_account_name": row.get("account_name", "Unknown"),
-                    "campaign_id": row["campaign_id"],
-                    "campaign_name": row["campaign_name"],
-                    "spend": float(row.get("spend", 0)),
-                    "impressions": int(row.get("impressions", 0)),
-                    "clicks": int(row.get("clicks", 0)),
-                    "cpc": float(row.get("cpc", 0) or 0),
-                    "ctr": float(row.get("ctr", 0) or 0)
-                }
-
-                try:
-                    supabase.table("facebook_ads").upsert(record, on_conflict="date, campaign_id").execute()
-                    total_saved += 1
-                except Exception as e:
-                    print(f"   ⚠️ Error saving row: {e}")
-
-            current_url = data.get("paging", {}).get("next")
-            if current_url:
-                print("   ➡️ Fetching next page...")
-
-        except Exception as e:
-            print(f"   ❌ Critical Error: {e}")
-            break
-
-    print(f"   ✨ Account Complete! Synced {total_saved} records.")
-
-def fetch_all_accounts():
+        saved = [(future.result(), submitted) for future, submitted in pending_saves]
+        stats["records"] = sum(count for count, _ in saved)
+        failed_pages = sum(1 for count, submitted in saved if submitted and not count)
+        if failed_pages and not stats["error"]:
+            stats["error"] = f"{failed_pages} page(s) failed to save"
+
+    stats["total_seconds"] = time.monotonic() - started
+    print(f"   ✨ {clean_acc_id} Complete! Synced {stats['records']} records.")
+    return stats
+
+def drain_write_queue():
+    """Waits for this run's queued facebook_ads rows; returns the keys still not landed."""
+    queue = write_queue.get_queue(supabase)
+    if queue is None:
+        return set()
+    with instrumentation.span("write queue drain"):
+        queue.drain(timeout=write_queue.WRITE_DRAIN_SECONDS)
+    pending = queue.pop_unsettled("facebook_ads", "upsert")
+    if pending:
+        print(f"   📬 {len(pending)} facebook_ads row(s) still in the write queue.")
+    return pending
+
+def replay_from_archive():
+    """Re-saves archived insights rows for START_DATE..END_DATE without calling the Graph API."""
+    print(f"📼 REPLAY MODE: reading {RAW_ARCHIVE_DIR}/facebook ({START_DATE} to {END_DATE})")
+    touched_days = set()
+    total_saved = 0
+    day = START_DATE
+    while day <= END_DATE:
+        # Last row wins per (date, campaign), same as the upsert key
+        records = {}
+        for clean_acc_id in raw_archive.names("facebook", day):
+            for row in raw_archive.iter_records("facebook", day, clean_acc_id):
+                record = build_record(row, clean_acc_id)
+                records[(record["date"], record["campaign_id"])] = record
+        total_saved += save_records(list(records.values()), touched_days)
+        day += timedelta(days=1)
+    drain_write_queue()
+
+    with instrumentation.span("daily_metrics refresh", days=len(touched_days)):
+        safe_refresh_days(supabase, touched_days)
+    if touched_days:
+        with instrumentation.span("dashboard cache refresh"):
+            refresh_cache(supabase, touched_days)
+    print(f"\n🏁 REPLAY COMPLETE! Re-saved {total_saved} records.")
+
+def fetch_all_accounts(start_date=None, end_date=None, refresh=True):
+    """Syncs every configured account for the range; returns their stats dicts.
+
+    `refresh=False` leaves the daily rollup and dashboard cache to the caller.
+    """
     if not FB_ACCESS_TOKEN or not FB_AD_ACCOUNT_IDS_RAW:
-        return
+        return []
 
     # Split the string by comma to get a list of IDs
     account_list = [x for x in FB_AD_ACCOUNT_IDS_RAW.split(",") if x.strip()]
     
     print(f"📋 Found {len(account_list)} Ad Accounts to sync.")
 
-    for account_id in account_list:
-        sync_single_account(account_id)
+    # Accounts run side by side; each one pipelines its own pages
+    with ThreadPoolExecutor(max_workers=max(1, min(ACCOUNT_CONCURRENCY, len(account_list)))) as pool:
+        all_stats = list(pool.map(partial(sync_single_account, start_date=start_date, end_date=end_date), account_list))
+
+    # Queued writes must land before the rollups read them back; each account
+    # only answers for the rows it queued
+    pending = drain_write_queue()
+    for stats in all_stats:
+        queued = len(stats["queued_keys"] & pending)
+        if queued:
+            stats["error"] = stats["error"] or f"{queued} row(s) still queued"
+
+    # Keep the daily rollup in step with the days we just wrote
+    touched_days = set()
+    for stats in all_stats:
+        touched_days.update(stats["days"])
+    if refresh:
+        with instrumentation.span("daily_metrics refresh", days=len(touched_days)):
+            safe_refresh_days(supabase, touched_days)
+        if touched_days:
+            with instrumentation.span("dashboard cache refresh"):
+                refresh_cache(supabase, touched_days)
+
+    print("\n⏱️ ACCOUNT TIMING SUMMARY")
+    for stats in sorted(all_stats, key=lambda s: s["total_seconds"], reverse=True):
+        print(f"   {stats['account']:<24} {stats['records']:>6} records  {stats['pages']:>4} pages  "
+              f"{stats['fetch_seconds']:>7.1f}s fetching  {stats['total_seconds']:>7.1f}s total")
     
-    print("\n🏁 ALL ACCOUNTS SYNCED SUCCESSFULLY!")
+    failed = [s["account"] for s in all_stats if s["error"]]
+    if failed:
+        print(f"\n⚠️ {len(failed)} account(s) stopped early: {', '.join(failed)}")
+    else:
+        print("\n🏁 ALL ACCOUNTS SYNCED SUCCESSFULLY!")
+    return all_stats
 
 if __name__ == "__main__":
-    fetch_all_accounts()
\ No newline at end of file
+    print(f"{DATE_MODE}...")
+    if (not FB_ACCESS_TOKEN or not FB_AD_ACCOUNT_IDS_RAW) and not config.IS_AUTOMATION and not REPLAY:
+        print("⚠️ WARNING: Facebook Credentials not found. Check .env.local")
+
+    metrics = instrumentation.start_run("sync_fb_ads")
+    try:
+        if REPLAY:
+            replay_from_archive()
+        else:
+            fetch_all_accounts()
+    finally:
+        metrics.finish(supabase)
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""Durable write-ahead queue in front of the Supabase writes.
+
+Set WRITE_QUEUE_PATH (e.g. sync_state/write_queue.sqlite3) and the sync
+scripts record their writes in a local SQLite file instead of calling
+Supabase inline. Background threads flush the file with at most
+WRITE_MAX_IN_FLIGHT calls at once. A failed write stays in the file and is
+retried with backoff, here or on the next run. It is marked dead after
+WRITE_MAX_ATTEMPTS and reported, never dropped.
+
+Usage: python scripts/write_queue.py [--flush] [--retry-dead]
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import local_store
+
+# --- ⚙️ CONFIGURATION ---
+WRITE_QUEUE_PATH = os.environ.get("WRITE_QUEUE_PATH")
+WRITE_MAX_IN_FLIGHT = int(os.environ.get("WRITE_MAX_IN_FLIGHT", 4))
+WRITE_MAX_ATTEMPTS = int(os.environ.get("WRITE_MAX_ATTEMPTS", 8))
+# How long a sync waits at the end for its queued writes to land
+WRITE_DRAIN_SECONDS = float(os.environ.get("WRITE_DRAIN_SECONDS", 60))
+FLUSH_BATCH_SIZE = 500
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
+# An op claimed longer ago than this belongs to a process that died mid-flush
+STALE_CLAIM_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ops (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  table_name TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  target TEXT,
+  payload TEXT NOT NULL,
+  version INTEGER NOT NULL DEFAULT 1,
+  state TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt REAL NOT NULL DEFAULT 0,
+  claimed_at REAL,
+  last_error TEXT,
+  UNIQUE (table_name, kind, key)
+);
+CREATE INDEX IF NOT EXISTS ops_due_idx ON ops (state, next_attempt);
+"""
+
+# Re-queueing a key replaces the payload and resets the retry clock (the newest write wins)
+ENQUEUE_SQL = """
+INSERT INTO ops (table_name, kind, key, target, payload) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (table_name, kind, key) DO UPDATE SET
+  payload = excluded.payload, target = excluded.target, version = ops.version + 1,
+  state = CASE WHEN ops.state = 'in_flight' THEN 'in_flight' ELSE 'pending' END,
+  attempts = 0, next_attempt = 0, last_error = NULL
+"""
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** attempts, RETRY_MAX_SECONDS)
+
+def row_key(row, key_columns):
+    """The key an upserted row is queued (and coalesced) under."""
+    return json.dumps([str(row.get(c)) for c in key_columns])
+
+class WriteQueue:
+    """Queued upserts and child-row replacements, flushed concurrently.
+
+    Two kinds of op, both idempotent so a retry can never double-write:
+    - `upsert`: one row, keyed by its conflict columns. Repeated upserts of
+      the same key coalesce into one pending op.
+    - `replace`: every child row of one parent (transaction_items for a
+      transaction_id), written as delete-then-insert, keyed by the parent.
+
+    Ops flush in the order they were first queued, one table group at a
+    time (transactions land before their items), with up to
+    `max_in_flight` chunk calls running inside a group. A chunk that fails
+    is retried in halves, so one bad row cannot hold back the rest.
+
+    The file is shared by every process that points at it. `pop_unsettled`
+    only reports the keys this instance queued, and each `listeners`
+    callback is called with (table, kind, parent_ids, rows) once a write has
+    landed in Supabase.
+    """
+
+    def __init__(self, supabase, path, max_in_flight=WRITE_MAX_IN_FLIGHT, batch_size=FLUSH_BATCH_SIZE):
+        self.supabase = supabase
+        self.path = path
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.flusher = None
+        # (table, kind) -> keys queued here since the last pop_unsettled
+        self.queued = defaultdict(set)
+        self.listeners = []
+        # flush_due passes running in this process (the flusher's claims count as in flight)
+        self.passes = 0
+        self.idle = threading.Condition()
+
+    # --- ✍️ ENQUEUE (local disk only, never waits on the network) ---
+    def _enqueue(self, ops):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(ENQUEUE_SQL, ops)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for op in ops:
+                self.queued[(op[0], op[1])].add(op[2])
+        self.wake.set()
+
+    def upsert(self, table, rows, key_columns, on_conflict=None):
+        self._enqueue([
+            (table, "upsert", row_key(row, key_columns), on_conflict, json.dumps(row, default=str))
+            for row in rows
+        ])
+
+    def replace(self, table, parent_column, parent_ids, rows):
+        children = {str(parent_id): [] for parent_id in parent_ids}
+        for row in rows:
+            children.setdefault(str(row[parent_column]), []).append(row)
+        self._enqueue([
+            (table, "replace", parent_id, parent_column, json.dumps(child_rows, default=str))
+            for parent_id, child_rows in children.items()
+        ])
+
+    # --- 📤 FLUSH ---
+    def _claim_due(self):
+        """Marks every due op in_flight (atomically across processes) and returns them oldest first."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("UPDATE ops SET state = 'pending' WHERE state = 'in_flight' AND claimed_at < ?",
+                                  (now - STALE_CLAIM_SECONDS,))
+                rows = self.conn.execute(
+                    "SELECT id, table_name, kind, key, target, payload, version, attempts FROM ops "
+                    "WHERE state = 'pending' AND next_attempt <= ? ORDER BY id", (now,)
+                ).fetchall()
+                self.conn.executemany("UPDATE ops SET state = 'in_flight', claimed_at = ? WHERE id = ?",
+                                      [(now, row[0]) for row in rows])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _send(self, table, kind, target, ops):
+        if kind == "upsert":
+            rows = [json.loads(op[5]) for op in ops]
+            if target:
+                self.supabase.table(table).upsert(rows, on_conflict=target).execute()
+            else:
+                self.supabase.table(table).upsert(rows).execute()
+        else:
+            self.supabase.table(table).delete().in_(target, [op[3] for op in ops]).execute()
+            rows = [row for op in ops for row in json.loads(op[5])]
+            if rows:
+                self.supabase.table(table).insert(rows).execute()
+
+    def _settle(self, ops, error=None):
+        """Deletes sent ops (unless re-queued mid-flight) or schedules their retry."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if error is None:
+                    # A newer version queued while this one was in flight still has to go out
+                    self.conn.executemany("DELETE FROM ops WHERE id = ? AND version = ?", [(op[0], op[6]) for op in ops])
+                    self.conn.executemany("UPDATE ops SET state = 'pending' WHERE id = ? AND state = 'in_flight'", [(op[0],) for op in ops])
+                else:
+                    self.conn.executemany(
+                        "UPDATE ops SET attempts = attempts + 1, last_error = ?, next_attempt = ?, "
+                        "state = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'pending' END WHERE id = ? AND version = ?",
+                        [(error, now + retry_delay(op[7]), WRITE_MAX_ATTEMPTS, op[0], op[6]) for op in ops])
+                    self.conn.executemany("UPDATE ops SET state = 'pending' WHERE id = ? AND state = 'in_flight'", [(op[0],) for op in ops])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _chunks(self, ops):
+        """Fresh ops go out in full batches; retried ones in halves per failed attempt."""
+        chunks, current, current_size = [], [], None
+        for op in ops:
+            size = max(1, self.batch_size >> op[7])
+            if current and (size != current_size or len(current) >= current_size):
+                chunks.append(current)
+                current = []
+            current.append(op)
+            current_size = size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def flush_due(self):
+        """One pass over every due op. Returns (ops written, ops failed)."""
+        with self.idle:
+            self.passes += 1
+        try:
+            return self._flush_pass()
+        finally:
+            with self.idle:
+                self.passes -= 1
+                self.idle.notify_all()
+
+    def _flush_pass(self):
+        ops = self._claim_due()
+        if not ops:
+            return 0, 0
+
+        # Consecutive ops for the same table and kind form a group; groups go in queue order
+        groups = []
+        for op in ops:
+            group_key = (op[1], op[2], op[4])
+            if groups and groups[-1][0] == group_key:
+                groups[-1][1].append(op)
+            else:
+                groups.append((group_key, [op]))
+
+        written, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for (table, kind, target), group in groups:
+                chunks = self._chunks(group)
+                results = pool.map(lambda chunk: self._flush_chunk(table, kind, target, chunk), chunks)
+                for chunk, ok in zip(chunks, results):
+                    if ok:
+                        written += len(chunk)
+                    else:
+                        failed += len(chunk)
+        return written, failed
+
+    def _flush_chunk(self, table, kind, target, chunk):
+        try:
+            self._send(table, kind, target, chunk)
+        except Exception as e:
+            if "42501" in str(e):
+                print(f"   ❌ {table}: blocked by row-level security (42501). Use a key with write access; "
+                      f"{len(chunk)} op(s) stay queued.")
+            else:
+                print(f"   ⚠️ {table} {kind} of {len(chunk)} op(s) failed, will retry: {e}")
+            self._settle(chunk, str(e))
+            return False
+        self._settle(chunk)
+        self._landed(table, kind, chunk)
+        return True
+
+    def _landed(self, table, kind, chunk):
+        if not self.listeners:
+            return
+        if kind == "upsert":
+            parent_ids, rows = None, [json.loads(op[5]) for op in chunk]
+        else:
+            parent_ids, rows = [op[3] for op in chunk], [row for op in chunk for row in json.loads(op[5])]
+        for listener in self.listeners:
+            try:
+                listener(table, kind, parent_ids, rows)
+            except Exception as e:
+                print(f"   ⚠️ Write queue listener failed for {table}: {e}")
+
+    # --- 🧵 BACKGROUND FLUSHER ---
+    def start(self):
+        """Flushes in the background while the caller keeps queueing."""
+        if self.flusher is None:
+            self.stop_event.clear()
+            self.flusher = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self.flusher.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wake.wait(timeout=1.0)
+            self.wake.clear()
+            try:
+                self.flush_due()
+            except Exception as e:
+                print(f"   ⚠️ Write queue flush pass failed: {e}")
+
+    def stop(self):
+        if self.flusher is not None:
+            self.stop_event.set()
+            self.wake.set()
+            self.flusher.join()
+            self.flusher = None
+
+    def drain(self, timeout=None):
+        """Flushes from the calling thread until nothing is due (or `timeout` runs out).
+
+        The background flusher keeps running; claims are atomic, so the two
+        never send the same op. Ops waiting on a retry delay longer than the
+        timeout stay queued for the next run.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            self.flush_due()
+            # Ops the background flusher claimed are not due, but they have not landed either
+            with self.idle:
+                self.idle.wait_for(lambda: self.passes == 0,
+                                   timeout=max(0.0, deadline - time.time()) if deadline is not None else None)
+            next_due = self.next_due()
+            if next_due is None or (deadline is not None and next_due > deadline):
+                break
+            time.sleep(max(0.0, next_due - time.time()))
+        return self.stats()
+
+    # --- 📊 STATE ---
+    def next_due(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MIN(next_attempt) FROM ops WHERE state = 'pending'").fetchone()
+        return row[0]
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM ops GROUP BY state").fetchall()
+        return {"pending": 0, "in_flight": 0, "dead": 0, **dict(rows)}
+
+    def pop_unsettled(self, table, kind):
+        """Keys this instance queued for `table` since the last call that have not landed yet.
+
+        Ops queued by other processes sharing the file, or left dead by an
+        earlier run, are not reported: they belong to whoever queued them.
+        """
+        with self.lock:
+            keys = self.queued.pop((table, kind), set())
+            unsettled = set()
+            key_list = sorted(keys)
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key FROM ops WHERE table_name = ? AND kind = ? AND key IN ({', '.join('?' * len(chunk))})",
+                    (table, kind, *chunk)).fetchall()
+                unsettled.update(row[0] for row in rows)
+        return unsettled
+
+    def retry_dead(self):
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE ops SET state = 'pending', attempts = 0, next_attempt = 0 WHERE state = 'dead'").rowcount
+
+# --- 🔌 USED BY THE SYNC SCRIPTS (None when WRITE_QUEUE_PATH is unset) ---
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue(supabase):
+    """The shared, already-started WriteQueue, or None when WRITE_QUEUE_PATH is not set."""
+    global _queue
+    if WRITE_QUEUE_PATH and _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteQueue(supabase, WRITE_QUEUE_PATH)
+                # The local mirror only copies writes once they are in Supabase
+                _queue.listeners.append(local_store.mirror_landed)
+                _queue.start()
+    return _queue
+
+if __name__ == "__main__":
+    from clients import get_supabase
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=WRITE_QUEUE_PATH or os.path.join("sync_state", "write_queue.sqlite3"))
+    parser.add_argument("--flush", action="store_true", help="Flush everything due now, waiting out short retry delays.")
+    parser.add_argument("--retry-dead", action="store_true", help="Give dead ops a fresh set of attempts first.")
+    args = parser.parse_args()
+
+    queue = WriteQueue(get_supabase(), args.path)
+    if args.retry_dead:
+        print(f"♻️ {queue.retry_dead()} dead op(s) queued again.")
+    if args.flush:
+        queue.drain(timeout=RETRY_MAX_SECONDS)
+    queue.stop()
+    print(f"📬 Write queue {args.path}: {queue.stats()}")